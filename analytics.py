@@ -0,0 +1,147 @@
+'''
+This module keeps the session history of a set in columns
+for the dashboards of nb_code.
+
+SessionHistory reads the stats entries of a set once into flat
+arrays: date, cycle, duration, deck size, the count of every score,
+and the learned (score 3 and up) and unlearned (score 0) terms.
+Study.finalize_session appends each new session to the history of
+the study, so plots never parse the whole history again.
+Learned and unlearned counts are also kept relative to the end of
+the previous cycle, as a trend per cycle.
+
+remaining_freqs counts the frequencies of the lexemes still to be
+learned from the example index, without Text-Fabric.
+'''
+
+import re
+import math
+import bisect
+import collections
+from array import array
+from datetime import datetime
+
+LEARNED_SCORE = 3 # scores from here up count as learned
+DURATION = re.compile(r'(?:(-?\d+) days?, )?(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+def parse_duration(text):
+    '''Give the seconds of a str(timedelta)'''
+    match = DURATION.fullmatch(text)
+    if match is None:
+        return 0.0
+    days, hours, minutes, secs = match.groups()
+    return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(secs)
+
+class SessionHistory:
+    '''
+    Columns of the sessions in a set's stats that have score counts,
+    in order. score_counts maps every score to its column.
+    '''
+
+    COLUMNS = ('time', 'cycle', 'duration', 'secs_per_term', 'deck',
+               'learned', 'unlearned', 'cycle_learned', 'cycle_unlearned')
+
+    def __init__(self, stats=()):
+        self.time = array('d') # POSIX timestamps
+        self.cycle = array('q')
+        self.duration = array('d')
+        self.secs_per_term = array('d')
+        self.deck = array('q')
+        self.learned = array('q')
+        self.unlearned = array('q')
+        # relative to the last session of the previous cycle
+        self.cycle_learned = array('q')
+        self.cycle_unlearned = array('q')
+        self.score_counts = {}
+        self.cycle_starts = [] # row of the first session of every cycle
+        self.base = (0, 0)
+        for session_stats in stats:
+            self.append(session_stats)
+
+    def __len__(self):
+        return len(self.time)
+
+    def append(self, session_stats):
+        '''Add the stats entry of a session; entries without score counts are skipped'''
+        counts = session_stats.get('score_counts')
+        if counts is None:
+            return
+        row = len(self)
+        cycle = session_stats.get('cycle', 0)
+        learned = sum(n for score, n in counts.items() if int(score) >= LEARNED_SCORE)
+        unlearned = counts.get('0', 0)
+
+        if not row:
+            self.base = (learned, unlearned)
+            self.cycle_starts.append(row)
+        elif cycle != self.cycle[-1]:
+            self.base = (self.learned[-1], self.unlearned[-1])
+            self.cycle_starts.append(row)
+
+        self.time.append(datetime.fromisoformat(session_stats['date']).timestamp())
+        self.cycle.append(cycle)
+        # an unknown duration is NaN
+        duration, secs_per_term = session_stats.get('duration', ''), session_stats.get('secs_per_term', 0)
+        self.duration.append(math.nan if duration is None else parse_duration(duration))
+        self.secs_per_term.append(math.nan if secs_per_term is None else secs_per_term)
+        self.deck.append(sum(session_stats.get('deck', {}).values()))
+        self.learned.append(learned)
+        self.unlearned.append(unlearned)
+        self.cycle_learned.append(learned - self.base[0])
+        self.cycle_unlearned.append(unlearned - self.base[1])
+        for score in counts:
+            if score not in self.score_counts:
+                self.score_counts[score] = array('q', [0]) * row
+        for score, column in self.score_counts.items():
+            column.append(counts.get(score, 0))
+
+    def dates(self, start=0, fmt='%d-%m_%H:%M'):
+        '''Format the session dates from row start on'''
+        return [datetime.fromtimestamp(t).strftime(fmt) for t in self.time[start:]]
+
+    def cycle_bounds(self, start=0):
+        '''Give the rows from start on where a new cycle begins'''
+        return [row - start for row in self.cycle_starts[bisect.bisect_right(self.cycle_starts, start):]]
+
+    def cycle_trends(self):
+        '''
+        Per cycle: its sessions and the learned and unlearned
+        counts at its end and their change over the cycle.
+        '''
+        trends = collections.OrderedDict()
+        ends = self.cycle_starts[1:] + [len(self)]
+        for start, end in zip(self.cycle_starts, ends):
+            last = end - 1
+            trends[self.cycle[start]] = {
+                'sessions': end - start,
+                'learned': self.learned[last],
+                'unlearned': self.unlearned[last],
+                'learned_change': self.cycle_learned[last],
+                'unlearned_change': self.cycle_unlearned[last],
+            }
+        return trends
+
+    def frame(self):
+        '''Give the history as a pandas DataFrame, one row per session'''
+        import pandas as pd
+        data = {name: getattr(self, name) for name in self.COLUMNS}
+        data['date'] = pd.to_datetime(self.time, unit='s')
+        for score in sorted(self.score_counts, key=int):
+            data[f'score_{score}'] = self.score_counts[score]
+        return pd.DataFrame(data)
+
+def remaining_freqs(study, score='0'):
+    '''
+    Count the terms of a score queue by the frequency
+    of their lexemes, from the example index.
+    Lexemes that are not indexed are looked up in TF.
+    '''
+    terms_dict = study.set_data['terms_dict']
+    index = study.index
+    to_learn = collections.Counter()
+    for term in study.set_data['term_queues'][score]:
+        for lex in terms_dict[term]['source_lexemes']:
+            row = index.lex2row.get(lex)
+            freq = index.freqs[row] if row is not None else study.TF.api.Fs(study.freqfeat).v(lex)
+            to_learn[freq] += 1
+    return to_learn
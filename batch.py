@@ -0,0 +1,206 @@
+'''
+This module prepares, reports and finalizes many vocab sets at once,
+e.g. Hebrew and Greek sets and per-user copies of them, side by side.
+
+    from batch import Batch
+    batch = Batch(['sample_vocab', 'users/*.json'])
+    batch.prepare()
+    batch.report()
+
+prepare builds the next session deck of every set in a process pool,
+without Text-Fabric, and starts a session journal for each new deck,
+so that loadStudy picks up the prepared deck. The example indexes of
+all sets are then filled with one TF app per (app, version), shared
+through the app registry in iMahir. Journals are kept next to
+their sets, but like loadStudy, indexes are written to the current
+directory, so set names must be unique within a batch.
+
+finalize ends the sessions whose journals reached the end of the deck.
+'''
+
+import io
+import glob
+import types
+import contextlib
+import collections
+from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import journal
+from storage import STORES, load_set, save_set
+from tfindex import ExampleIndex, index_path, set_lexemes
+from iMahir import Study, Session, LazyTF, start_cycle, cycle_complete, load_queues
+from scheduler import get_scheduler
+
+def discover(paths):
+    '''
+    Find the vocab files in a list of files, directories and glob patterns.
+    Directories are searched for files of every storage format.
+    '''
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            found = (file for suffix in STORES for file in path.glob(f'*{suffix}'))
+        elif path.exists():
+            found = [path]
+        else:
+            found = (Path(file) for file in glob.glob(str(path)))
+        for file in sorted(found):
+            if file.suffix in STORES and file not in files:
+                files.append(file)
+    return files
+
+def plan_set(file, new_cycles=False, commit=True):
+    '''
+    Plan the next session of a set, without TF.
+    Runs in a worker process and returns a plan dict.
+
+    A set with a journal keeps the deck of its journal.
+    A set at the end of its cycle gets no deck, unless
+    new_cycles is True; then a new cycle is started with
+    the same parameters and the set is saved.
+    With commit=False nothing is saved, e.g. to look at
+    the plan. A new deck is shuffled, as are the queues of
+    a new cycle, so only its size and deck_stats are those
+    that a commit would give.
+    '''
+    file = Path(file)
+    set_data = load_set(file)
+    appdata = set_data['app_data']
+    plan = {
+        'file': str(file),
+        'name': set_data['name'],
+        'app_data': appdata,
+        'deck': [],
+        'deck_stats': {},
+        'term_n': 0,
+    }
+
+    journal_file = journal.journal_path(file)
+    if journal_file.exists():
+        header, records = journal.read(journal_file)
+        plan['term_n'] = journal.replay(set_data, records)[0]
+        plan['deck'], plan['deck_stats'] = header['deck'], header['deck_stats']
+        plan['status'] = 'complete' if plan['term_n'] >= len(plan['deck']) else 'in progress'
+
+    elif cycle_complete(set_data) and not new_cycles:
+        plan['status'] = 'cycle complete'
+
+    else:
+        # commit a new cycle or newly scheduled terms so the journal replays onto them
+        migrated = get_scheduler(set_data).migrate(load_queues(set_data))
+        new_cycle = cycle_complete(set_data)
+        if new_cycle:
+            start_cycle(set_data)
+        if commit and (new_cycle or migrated):
+            save_set(set_data, file)
+        session = Session(set_data)
+        plan['deck'], plan['deck_stats'] = session.deck, dict(session.deck_stats)
+        plan['status'] = 'new'
+
+    plan['session'] = set_data['cycle_data']['total_sessions'] + 1
+    plan['cycle'] = set_data['cycle_data']['ncycle']
+
+    # lexemes still to be indexed in the parent process
+    lexemes = set_lexemes(set_data['terms_dict'])
+    index = ExampleIndex.load(index_path(file.stem, appdata['app'], appdata['version']),
+                              appdata['app'], appdata['version'])
+    plan['missing'] = index.missing(lexemes) if index is not None else lexemes
+    return plan
+
+class Batch:
+    '''
+    Schedules and finalizes a batch of vocab sets.
+    '''
+
+    def __init__(self, paths, workers=None, new_cycles=False):
+        self.files = discover(paths)
+        self.workers = workers
+        self.new_cycles = new_cycles
+        self.plans = collections.OrderedDict()
+
+        stems = collections.Counter(file.stem for file in self.files)
+        doubles = sorted(stem for stem, count in stems.items() if count > 1)
+        if doubles:
+            raise Exception(f'set names must be unique in a batch; found more than once: {doubles}')
+
+    def prepare(self, start_journals=True):
+        '''
+        Build the decks of all sets in parallel, fill their
+        example indexes and start journals for new decks.
+        '''
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            plans = pool.map(plan_set, self.files, repeat(self.new_cycles))
+            for file, plan in zip(self.files, plans):
+                self.plans[file] = plan
+
+        self.index_sets()
+
+        if start_journals:
+            for file, plan in self.plans.items():
+                if plan['status'] == 'new':
+                    session = types.SimpleNamespace(deck=plan['deck'], deck_stats=plan['deck_stats'])
+                    journal.Journal.start(journal.journal_path(file), session).close()
+                    plan['status'] = 'in progress'
+        return self.plans
+
+    def index_sets(self):
+        '''
+        Index the missing lexemes of all sets,
+        loading TF once for every (app, version).
+        '''
+        groups = collections.defaultdict(list)
+        for file, plan in self.plans.items():
+            if plan['missing']:
+                appdata = plan['app_data']
+                groups[(appdata['app'], appdata['version'])].append(file)
+
+        for (app, version), files in groups.items():
+            TF = LazyTF(app, version)
+            for file in files:
+                plan = self.plans[file]
+                ifile = index_path(file.stem, app, version)
+                index = ExampleIndex.load(ifile, app, version) or ExampleIndex(app, version)
+                print(f'{file.stem}: indexing {len(plan["missing"])} lexemes...')
+                index.extend(TF.api, plan['missing'], plan['app_data'])
+                index.save(ifile)
+                plan['missing'] = []
+
+    def report(self):
+        '''Print the planned session of every set.'''
+        print(f'{"set":<24}{"session":>8}{"cycle":>7}{"deck":>7}{"done":>7}  status')
+        for file, plan in self.plans.items():
+            print(f'{file.stem:<24}{plan["session"]:>8}{plan["cycle"]:>7}'
+                  f'{len(plan["deck"]):>7}{plan["term_n"]:>7}  {plan["status"]}')
+            if plan['deck_stats']:
+                scores = ', '.join(f'{score}: {n}' for score, n in plan['deck_stats'].items())
+                print(f'{"":<24}scores {scores}')
+
+    def finalize(self):
+        '''
+        Finalize the sessions that reached the end of their deck.
+        The journal only holds the time up to the last pause,
+        so the duration of these sessions is stored as unknown.
+        Returns the files that were finalized.
+        '''
+        done = []
+        for file in self.files:
+            journal_file = journal.journal_path(file)
+            if not journal_file.exists():
+                continue
+            # suppress the study reports of every set
+            with contextlib.redirect_stdout(io.StringIO()):
+                study = Study(file, headless=True, journal_file=journal_file)
+            if study.term_n < len(study.session_data.deck):
+                study.journal.close()
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                study.finalize_session(None)
+            done.append(file)
+            if file in self.plans:
+                self.plans[file]['status'] = 'finalized'
+        return done
@@ -0,0 +1,84 @@
+'''
+Benchmarks deck construction in Session against the old
+list-based construction, which moved each term to the back
+of its queue with list.pop(0).
+
+Run from the repository root:
+    python benchmarks/bench_deck.py [vocab.json] [scale]
+
+scale repeats every queue (with new term IDs) to simulate a larger set.
+'''
+
+import sys
+import copy
+import json
+import random
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from iMahir import Session, load_queues
+
+def scale_set(set_data, scale):
+    '''Multiply the queues of a set by scale, using new term IDs'''
+    if scale == 1:
+        return set_data
+    set_data = copy.deepcopy(set_data)
+    for score, queue in set_data['term_queues'].items():
+        set_data['term_queues'][score] = [f'{tid}_{i}' for i in range(scale) for tid in queue]
+    for score in set_data['cycle_data']['score_starts']:
+        set_data['cycle_data']['score_starts'][score] *= scale
+    return set_data
+
+def list_deck(term_queues, quota):
+    '''The old deck construction, on plain lists'''
+    deck = []
+    for score, n in quota.items():
+        for i in range(0, n):
+            if len(term_queues[score]) < i+1:
+                break
+            if score != '0':
+                deck.append(term_queues[score][0])
+                term_queues[score].append(term_queues[score].pop(0))
+            else:
+                deck.append(term_queues[score][i])
+    random.shuffle(deck)
+    return deck
+
+def quotas(set_data):
+    '''Get the quotas Session uses, from a throwaway copy of the set'''
+    deck_set = copy.deepcopy(set_data)
+    session = Session(deck_set)
+    return {score: session.deck_stats.get(score, 0) for score in set_data['term_queues']}
+
+def main():
+    vocab = sys.argv[1] if len(sys.argv) > 1 else 'sample_vocab/hebrew.json'
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    with open(vocab, encoding='utf8') as infile:
+        set_data = scale_set(json.load(infile), scale)
+
+    nterms = sum(len(q) for q in set_data['term_queues'].values())
+    print(f'{vocab} x{scale}: {nterms} queued terms')
+
+    random.seed(0)
+    list_set = copy.deepcopy(set_data)
+    deck_set = copy.deepcopy(set_data)
+    load_queues(deck_set)
+    ndeck = len(Session(copy.deepcopy(deck_set)).deck)
+    quota = quotas(set_data)
+
+    def run_list():
+        list_deck(list_set['term_queues'], quota)
+
+    def run_session():
+        Session(deck_set)
+
+    number = 20
+    list_time = timeit.timeit(run_list, number=number) / number
+    session_time = timeit.timeit(run_session, number=number) / number
+    print(f'deck size: {ndeck}')
+    print(f'list pop(0):      {list_time*1000:8.3f} ms')
+    print(f'TermQueue rotate: {session_time*1000:8.3f} ms')
+
+if __name__ == '__main__':
+    main()
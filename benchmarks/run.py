@@ -0,0 +1,233 @@
+'''
+Benchmark suite for the Mahir study pipeline.
+
+Times the hot paths of a study session and of the tools
+on the sample vocab sets and on synthetic sets of 10k, 100k
+and 1M terms, and reports the best time and the peak memory
+of each. Text-Fabric is replaced by a stub, so this runs offline.
+
+Run from the repository root:
+    python benchmarks/run.py
+    python benchmarks/run.py --sizes 10000,100000 --only session
+    python benchmarks/run.py --save base.json
+    python benchmarks/run.py --compare base.json
+
+With --compare, benchmarks more than 20% slower
+than the saved results are flagged and the exit code is 1.
+'''
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import collections
+import tracemalloc
+import importlib.util
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from iMahir import Study, Session, load_queues
+from storage import load_set, save_set
+from tfindex import ExampleIndex, ExampleSampler, set_lexemes
+from terms import load_terms
+from stubs import StubAPI, make_set, score_pass
+
+# the tools module is loaded by path, since tools/ is not a package
+spec = importlib.util.spec_from_file_location('mahir_tools', ROOT / 'tools' / 'tools.py')
+tools = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tools)
+
+SLOWER = 1.2 # flag benchmarks this much slower than a saved run
+
+BENCHMARKS = collections.OrderedDict()
+
+def benchmark(name):
+    '''
+    Register a benchmark. The function gets the set data and
+    a work directory and returns (setup, run): setup makes fresh
+    state for each repeat, and only run(state) is timed.
+    '''
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def copy_set(set_data):
+    '''A quick copy of a set, much faster than deepcopy on large sets'''
+    new = dict(set_data)
+    new['terms_dict'] = {
+        tid: dict(tdata, source_lexemes=list(tdata['source_lexemes']), stats=dict(tdata['stats']))
+            for tid, tdata in set_data['terms_dict'].items()
+    }
+    new['term_queues'] = {score:list(queue) for score, queue in set_data['term_queues'].items()}
+    new['cycle_data'] = dict(set_data['cycle_data'],
+                             score_starts=dict(set_data['cycle_data']['score_starts']))
+    new['stats'] = list(set_data['stats'])
+    return new
+
+def make_study(set_data):
+    '''A Study for set data, without loading files or TF'''
+    study = Study.__new__(Study)
+    study.set_data = set_data
+    load_terms(set_data)
+    study.session_data = Session(set_data)
+    return study
+
+@benchmark('json load')
+def bench_json_load(set_data, workdir):
+    file = workdir / 'load.json'
+    save_set(set_data, file)
+    return (lambda: None), (lambda state: load_set(file))
+
+@benchmark('json save')
+def bench_json_save(set_data, workdir):
+    file = workdir / 'save.json'
+    return (lambda: None), (lambda state: save_set(set_data, file))
+
+@benchmark('session')
+def bench_session(set_data, workdir):
+    def setup():
+        data = copy_set(set_data)
+        load_queues(data)
+        return data
+    return setup, Session
+
+@benchmark('term table')
+def bench_term_table(set_data, workdir):
+    return (lambda: copy_set(set_data)), load_terms
+
+@benchmark('update_queues')
+def bench_update_queues(set_data, workdir):
+    def setup():
+        study = make_study(copy_set(set_data))
+        score_pass(study.set_data, study.session_data.deck)
+        study.add_new_scores()
+        return study
+    return setup, (lambda study: study.update_queues(collections.Counter()))
+
+@benchmark('add_new_scores')
+def bench_add_new_scores(set_data, workdir):
+    def setup():
+        study = make_study(copy_set(set_data))
+        score_pass(study.set_data, study.session_data.deck)
+        return study
+    return setup, (lambda study: study.add_new_scores())
+
+@benchmark('tools.reindex')
+def bench_reindex(set_data, workdir):
+    return (lambda: copy_set(set_data)), tools.reindex
+
+@benchmark('tools.merge')
+def bench_merge(set_data, workdir):
+    # merge a group of terms from the back of the largest queue
+    queue = max(set_data['term_queues'].values(), key=len)
+    ids = queue[-5:]
+    return (lambda: copy_set(set_data)), (lambda data: tools.merge(data, ids))
+
+@benchmark('tools.bulkedit')
+def bench_bulkedit(set_data, workdir):
+    # merge pairs of terms from 1% of the set, then reindex once
+    ids = list(set_data['terms_dict'])
+    groups = [ids[i:i+2] for i in range(0, len(ids) // 50 * 2, 2)]
+    def run(data):
+        tools.bulkedit(data, groups)
+        tools.reindex(data)
+    return (lambda: copy_set(set_data)), run
+
+@benchmark('tools.blank')
+def bench_blank(set_data, workdir):
+    return (lambda: copy_set(set_data)), tools.blank
+
+@benchmark('index build')
+def bench_index(set_data, workdir):
+    api = StubAPI()
+    lexemes = set_lexemes(set_data['terms_dict'])
+    appdata = set_data['app_data']
+    return (lambda: None), (lambda state: ExampleIndex.build(api, lexemes, appdata))
+
+@benchmark('example draw')
+def bench_example_draw(set_data, workdir):
+    # 10k book-weighted draws over the first 1000 lexemes of the set
+    lexemes = set_lexemes(set_data['terms_dict'])[:1000]
+    index = ExampleIndex.build(StubAPI(), lexemes, set_data['app_data'])
+    draws = [lexemes[i % len(lexemes)] for i in range(10_000)]
+    def run(sampler):
+        for lex in draws:
+            sampler.draw(lex)
+    return (lambda: ExampleSampler(index, 'book', seed=0)), run
+
+def measure(setup, run, repeat):
+    '''Return the best time in seconds and the peak memory in bytes of run'''
+    best = float('inf')
+    for i in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - start)
+
+    # measure memory on a separate run, as tracing slows it down
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def get_sets(args):
+    '''Yield (name, set data) for the sample and synthetic sets'''
+    if not args.no_samples:
+        for file in sorted((ROOT / 'sample_vocab').glob('*.json')):
+            yield file.stem, load_set(file)
+    for size in args.sizes:
+        yield f'synthetic-{size}', make_set(size)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma-separated sizes of synthetic sets')
+    parser.add_argument('--no-samples', action='store_true', help='skip sample_vocab sets')
+    parser.add_argument('--only', default='', help='run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5, help='repeats on sets up to 10k terms')
+    parser.add_argument('--save', help='write results to a json file')
+    parser.add_argument('--compare', help='compare to results in a json file')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+
+    results = {}
+    slower = []
+    print(f'{"set":<20}{"benchmark":<18}{"time (ms)":>12}{"peak (MB)":>12}')
+    with tempfile.TemporaryDirectory() as workdir:
+        for set_name, set_data in get_sets(args):
+            nterms = len(set_data['terms_dict'])
+            repeat = max(1, args.repeat * 10_000 // max(nterms, 10_000))
+            for name, bench in BENCHMARKS.items():
+                if args.only not in name:
+                    continue
+                setup, run = bench(set_data, Path(workdir))
+                secs, peak = measure(setup, run, repeat)
+                key = f'{set_name}/{name}'
+                results[key] = {'secs': secs, 'peak': peak}
+                flag = ''
+                if key in baseline and secs > baseline[key]['secs'] * SLOWER:
+                    flag = f'  SLOWER ({secs / baseline[key]["secs"]:.1f}x)'
+                    slower.append(key)
+                print(f'{set_name:<20}{name:<18}{secs*1000:>12.2f}{peak/2**20:>12.1f}{flag}')
+
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump(results, outfile, indent=1)
+    if slower:
+        print(f'\n{len(slower)} benchmarks are slower than {args.compare}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
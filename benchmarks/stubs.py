@@ -0,0 +1,149 @@
+'''
+Offline stand-ins for the benchmarks: a stubbed Text-Fabric app
+and a generator of synthetic vocab sets of any size.
+'''
+
+import random
+from datetime import datetime, timedelta
+
+SCORECONFIG = {
+    '3': {'nreset': 1, 'shuffle': 'yes'},
+    '4': {'nreset': 2, 'shuffle': 'yes'},
+    '5': {'nreset': 4, 'shuffle': 'yes'},
+    '6': {'nreset': 8, 'shuffle': 'yes'},
+}
+
+# share of terms per score, roughly as in sample_vocab/hebrew.json
+SCORE_SHARES = {'0': 0.10, '1': 0.02, '2': 0.01, '3': 0.55, '4': 0.15, '5': 0.11, '6': 0.06}
+
+# node numbers of the stub corpus
+FIRST_LEX = 1_000_000
+WORDS_PER_VERSE = 15
+
+class Feature:
+    '''A TF feature whose values are computed from the node number'''
+
+    def __init__(self, value):
+        self.value = value
+
+    def v(self, node):
+        return self.value(node)
+
+class StubAPI:
+    '''
+    Imitates the parts of the TF api that Mahir uses.
+    Lexeme n occurs (n % 20) + 1 times; every word is
+    in verse word // WORDS_PER_VERSE.
+    '''
+
+    def __init__(self):
+        self.F = type('F', (), {
+            'gn': Feature(lambda n: 'm'),
+            'nu': Feature(lambda n: 'sg'),
+            'pdp': Feature(lambda n: 'verb' if n % 3 == 0 else 'subs'),
+            'ps': Feature(lambda n: 'p3'),
+            'vs': Feature(lambda n: 'qal'),
+            'vt': Feature(lambda n: 'perf'),
+            'st': Feature(lambda n: 'a'),
+            'freq_lex': Feature(lambda n: n % 500),
+        })()
+        self.features = {
+            'gloss': Feature(lambda n: f'gloss {n}'),
+            'freq_lex': self.F.freq_lex,
+        }
+        self.L = type('L', (), {'d': staticmethod(self.words), 'u': staticmethod(self.verse)})()
+
+    @staticmethod
+    def words(lex, otype):
+        start = lex * 20
+        return tuple(range(start, start + (lex % 20) + 1))
+
+    @staticmethod
+    def verse(word, otype):
+        return (10_000_000 + word // WORDS_PER_VERSE,)
+
+    def Fs(self, feature):
+        return self.features[feature]
+
+class StubApp:
+    '''Imitates a TF app: an api plus the display methods'''
+
+    appName = 'bhsa'
+
+    def __init__(self):
+        self.api = StubAPI()
+
+    def sectionStrFromNode(self, node):
+        return f'Genesis {node % 50 + 1}:{node % 30 + 1}'
+
+    def plain(self, node, highlights=None, _asString=False):
+        words = ' '.join(
+            f'<span style="background:{highlights.get(w)}">w{w}</span>' if highlights and w in highlights
+            else f'<span>w{w}</span>'
+            for w in range(node * WORDS_PER_VERSE, node * WORDS_PER_VERSE + WORDS_PER_VERSE))
+        return f'<div class="verse">{words}</div>'
+
+def make_set(nterms, seed=0, nsessions=50):
+    '''
+    Make a synthetic vocab set of nterms terms,
+    with scores spread like a long-used set.
+    '''
+    rng = random.Random(seed)
+    scores = list(SCORE_SHARES)
+    weights = list(SCORE_SHARES.values())
+
+    terms_dict = {}
+    term_queues = {score:[] for score in scores}
+    for i in range(1, nterms+1):
+        tid = str(i)
+        score = rng.choices(scores, weights)[0]
+        lexs = [FIRST_LEX + i] + ([FIRST_LEX + nterms + i] if i % 7 == 0 else [])
+        stats = {'seen': rng.randint(0, 20), 'missed': rng.randint(0, 3)}
+        if score != '0' and i % 3:
+            stats['learned'] = str(datetime(2020, 1, 1) + timedelta(minutes=i))
+        terms_dict[tid] = {
+            'term': f'term {i}',
+            'score': score,
+            'source_lexemes': lexs,
+            'gloss': f'gloss of term {i}',
+            'stats': stats,
+        }
+        term_queues[score].append(tid)
+
+    stats = []
+    for n in range(nsessions):
+        stats.append({
+            'date': str(datetime(2020, 1, 1) + timedelta(days=n)),
+            'duration': '0:20:00.000000',
+            'secs_per_term': 5.0,
+            'deck': {'3': 200, '1': 30},
+            'cycle': n // 15,
+            'changes': {'1<-3': 10, '1->3': 12},
+            'score_counts': {score:len(queue) for score, queue in term_queues.items()},
+        })
+
+    return {
+        'name': f'synthetic-{nterms}',
+        'init_date': str(datetime(2020, 1, 1)),
+        'description': 'synthetic benchmark set',
+        'app_data': {
+            'app': 'bhsa', 'version': 'c', 'gloss_feature': 'gloss',
+            'freq_feature': 'freq_lex', 'wordtype': 'word', 'context': 'verse',
+        },
+        'cycle_data': {
+            'ncycle': 3, 'total_sessions': 5, 'cycle_length': 15, 'new_quota': 100,
+            'score_starts': {score:len(term_queues[score]) for score in SCORECONFIG},
+        },
+        'scoreconfig': SCORECONFIG,
+        'term_queues': term_queues,
+        'terms_dict': terms_dict,
+        'stats': stats,
+    }
+
+def score_pass(set_data, deck, share=0.2, seed=0):
+    '''Rescore a share of the deck, as in a study session'''
+    rng = random.Random(seed)
+    scores = list(set_data['term_queues'])
+    for tid in deck:
+        if rng.random() < share:
+            set_data['terms_dict'][tid]['score'] = rng.choice(scores)
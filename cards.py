@@ -0,0 +1,236 @@
+'''
+This module prepares study cards ahead of time.
+
+A card is the rendered payload that Study.learn shows for one
+deck position: the example passage string, the highlighted passage
+HTML, the parse string, and the standard gloss table. While a card
+is on screen, a worker thread prepares the next few positions of the
+deck so that moving forward is instant. Cards already shown are kept
+in a bounded LRU cache so that moving back is instant too.
+
+Rendered passage HTML and section strings are also kept across
+sessions in a CardCache on disk, so that a card of a verse seen
+before does not need Text-Fabric to render.
+'''
+
+import sqlite3
+import collections
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+class LRUCache:
+    '''
+    A dict-like cache that keeps at most size items,
+    dropping the least recently used first.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.items.pop(key, default)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+class Prefetcher:
+    '''
+    Prepares cards for deck positions with a background worker.
+
+    prepare is a function that takes a deck position and returns a card.
+    ahead is the number of positions prepared in advance;
+    cache_size bounds the number of cards kept for going back.
+    '''
+
+    def __init__(self, prepare, ndeck, ahead=3, cache_size=50, workers=1):
+        self.prepare = prepare
+        self.ndeck = ndeck
+        self.ahead = ahead
+        self.cache = LRUCache(cache_size)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def get(self, pos):
+        '''
+        Return the card for a position, waiting on
+        a pending preparation or preparing it now.
+        '''
+        card = self.cache.get(pos)
+        if card is not None:
+            return card
+        with self.lock:
+            future = self.pending.pop(pos, None)
+        card = future.result() if future is not None else self.prepare(pos)
+        self.cache.put(pos, card)
+        return card
+
+    def prefetch(self, pos):
+        '''Start preparing the positions after pos.'''
+        for nxt in range(pos+1, min(pos+1+self.ahead, self.ndeck)):
+            with self.lock:
+                if nxt in self.pending or nxt in self.cache:
+                    continue
+                self.pending[nxt] = self.executor.submit(self.prepare, nxt)
+
+    def invalidate(self, pos):
+        '''Forget the card of a position, e.g. to draw a new example.'''
+        self.cache.pop(pos)
+        with self.lock:
+            future = self.pending.pop(pos, None)
+        if future is not None:
+            future.cancel()
+
+    def close(self):
+        '''Stop the worker; pending cards are dropped.'''
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+def cache_path(app, version):
+    '''Give the card cache file name for a TF app and version'''
+    return Path(f'{app}-{version}.cardcache')
+
+class CardCache:
+    '''
+    A persistent cache of rendered strings, such as passage HTML,
+    in a SQLite file that is shared by all sets of a TF app.
+    Entries are keyed by TF app, version and a key string.
+    When the stored strings grow beyond max_bytes,
+    the least recently used are dropped.
+    Safe to use from the prefetch worker.
+
+    The total size and the use counter are kept in the file too,
+    and changed in the same transaction as the entries, so that
+    caches open on one file (e.g. of every user of a server, or
+    in other kernels) agree on them.
+    '''
+
+    def __init__(self, file, app, version, max_bytes=50*2**20):
+        self.app = app
+        self.version = version
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(file), check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                app TEXT, version TEXT, key TEXT, value TEXT, used INTEGER,
+                PRIMARY KEY (app, version, key)
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        # a use counter orders the entries from least to most recent
+        self.conn.execute('CREATE TABLE IF NOT EXISTS totals (clock INTEGER, nbytes INTEGER)')
+        with self.transaction():
+            if self.conn.execute('SELECT COUNT(*) FROM totals').fetchone()[0] == 0:
+                self.conn.execute(
+                    'INSERT INTO totals SELECT COALESCE(MAX(used), 0), '
+                    'COALESCE(SUM(LENGTH(value)), 0) FROM entries')
+
+    @contextmanager
+    def transaction(self):
+        '''Run statements in one transaction, locking out other writers'''
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def tick(self):
+        '''Advance the use counter and give it; call in a transaction'''
+        self.conn.execute('UPDATE totals SET clock = clock + 1')
+        return self.conn.execute('SELECT clock FROM totals').fetchone()[0]
+
+    @property
+    def nbytes(self):
+        '''The size of all stored strings'''
+        return self.conn.execute('SELECT nbytes FROM totals').fetchone()[0]
+
+    def get(self, key):
+        '''Give the value of a key, or None'''
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM entries WHERE app=? AND version=? AND key=?',
+                (self.app, self.version, key)).fetchone()
+            if row is None:
+                return None
+            with self.transaction():
+                self.conn.execute(
+                    'UPDATE entries SET used=? WHERE app=? AND version=? AND key=?',
+                    (self.tick(), self.app, self.version, key))
+            return row[0]
+
+    def put(self, key, value):
+        with self.lock, self.transaction():
+            old = self.conn.execute(
+                'SELECT LENGTH(value) FROM entries WHERE app=? AND version=? AND key=?',
+                (self.app, self.version, key)).fetchone()
+            self.conn.execute(
+                'REPLACE INTO entries VALUES (?,?,?,?,?)',
+                (self.app, self.version, key, value, self.tick()))
+            self.conn.execute(
+                'UPDATE totals SET nbytes = nbytes + ?', (len(value) - (old[0] if old else 0),))
+            if self.nbytes > self.max_bytes:
+                self.evict()
+
+    def fetch(self, key, make):
+        '''Give the value of a key, making and storing it if missing'''
+        value = self.get(key)
+        if value is None:
+            value = make()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        '''
+        Drop the least recently used entries down to 90% of max_bytes;
+        call in a transaction.
+        '''
+        target = self.max_bytes * 0.9
+        total = self.nbytes
+        rows = self.conn.execute('SELECT used, LENGTH(value) FROM entries ORDER BY used').fetchall()
+        cutoff = None
+        for used, nbytes in rows:
+            if total <= target:
+                break
+            total -= nbytes
+            cutoff = used
+        if cutoff is not None:
+            self.conn.execute('DELETE FROM entries WHERE used <= ?', (cutoff,))
+            self.conn.execute('UPDATE totals SET nbytes = ?', (total,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -13,15 +13,24 @@ import os
 from pathlib import Path
 import pickle
 import collections
-import json
 import random
 import time
-import math
-import copy
+import itertools
+import threading
+import asyncio
 from datetime import datetime, timedelta
-from tf.app import use
-from tf.fabric import Fabric
 from IPython.display import clear_output, display, HTML
+from tfindex import ExampleIndex, ExampleSampler, index_path, set_lexemes
+from terms import TermTable, load_terms
+import journal
+from storage import load_set, save_set, update_set
+from cards import Prefetcher, CardCache, cache_path
+from profiler import Profiler, NullProfiler
+from snapshot import Snapshot, snapshot_path
+from analytics import SessionHistory
+from validate import validate, describe
+from scheduler import get_scheduler
+from ui import TextUI, WidgetUI, run_sync
 
 def safediv(a, b):
     '''Return zero in zero divisions'''
@@ -30,10 +39,55 @@ def safediv(a, b):
     except ZeroDivisionError:
         return 0
 
-def loadStudy(vocab_json, tf_app='bhsa'):
-        """Determine how to load a study session"""
+# highlight colours of example words by term score
+HIGHLIGHTS = {'0': 'pink'}
+DEFAULT_HIGHLIGHT = 'lightgreen'
+
+# studies saved in this kernel, by set file; see Study.suspend.
+# Only the most recently saved are kept, since each holds its set and index
+SAVED_STUDIES = collections.OrderedDict()
+MAX_SAVED_STUDIES = 4
+
+def file_signature(file):
+    '''Give the size and modification time of a file, to tell whether it has changed'''
+    stat = os.stat(file)
+    return stat.st_size, stat.st_mtime_ns
+
+def saved_study(vocab_json, headless=False, snapshot=None):
+    '''
+    Give the study of a set that was saved in this kernel,
+    if neither the set nor its journal have changed since;
+    otherwise None.
+    '''
+    vocab_json = Path(vocab_json)
+    saved = SAVED_STUDIES.pop(vocab_json.resolve(), None)
+    if saved is None:
+        return None
+    signatures, options, study = saved
+    journal_file = journal.journal_path(vocab_json)
+    if not journal_file.exists() or options != (headless, snapshot):
+        return None
+    if signatures != (file_signature(vocab_json), file_signature(journal_file)):
+        return None
+    return study.resume()
+
+def loadStudy(vocab_json, tf_app='bhsa', headless=False, snapshot=None):
+        """
+        Determine how to load a study session.
+        With headless=True, Text-Fabric is never loaded;
+        this is enough for deck building and scheduling.
+        With snapshot=True, the corpus is read from the
+        {app}-{version}.snapshot file instead of Text-Fabric;
+        another snapshot file can be given instead of True.
+        """
 
         vocab_json = Path(vocab_json)
+
+        # a session saved in this kernel is resumed as it is,
+        # with its set data, TF app, index and cards still loaded
+        study = saved_study(vocab_json, headless, snapshot)
+        if study is not None:
+            return study
         
         # check for existing saves
         savefile = next(Path().glob(f'{vocab_json.stem}.save'), None)
@@ -49,25 +103,200 @@ def loadStudy(vocab_json, tf_app='bhsa'):
                 print('\nOld session found but expired! Deleting it!\n')
                 savefile.unlink() # bye bye :) 
 
-        # load the save
+        # resume from a session journal
+        journal_file = journal.journal_path(vocab_json)
+        if journal_file.exists():
+            return Study(vocab_json, tf_app, journal_file=journal_file,
+                         headless=headless, snapshot=snapshot)
+
+        # convert an old-style pickled save to a journal
         if savefile is not None and savefile.exists():
             with open(savefile, 'rb') as infile:
                 savedata = pickle.load(infile)
-            return Study(
-                vocab_json, 
-                tf_app, 
-                set_data=savedata['set_data'],
-                session_data=savedata['session_data'],
-                resume_time=savedata['resume_time'],
-                term_n=savedata['term_n'],
-                pause_times=savedata['pause_times'],
-            )
+            set_data = load_set(vocab_json)
+            if journal.restore_save(savedata, set_data):
+                save_set(set_data, vocab_json)
+            journal.from_save(savedata, set_data, journal_file)
+            savefile.unlink()
+            return Study(vocab_json, tf_app, journal_file=journal_file,
+                         headless=headless, snapshot=snapshot)
             
         # load new session
         else:
-            return Study(vocab_json, tf_app)
+            return Study(vocab_json, tf_app, headless=headless, snapshot=snapshot)
         
-    
+
+class TermQueue:
+    '''
+    A queue of term IDs with constant-time membership,
+    removal, and insertion at the front or back.
+    Backed by an ordered dict keyed by term ID.
+    Saved to JSON as a plain list.
+    Indexing by position walks the queue, so queue[i]
+    costs O(i); use head, popleft or rotate instead.
+    '''
+
+    def __init__(self, terms=()):
+        self.terms = collections.OrderedDict.fromkeys(terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def __getitem__(self, i):
+        '''Give the term at position i; O(i), unlike the other operations'''
+        if i < 0:
+            i += len(self.terms)
+        try:
+            return next(itertools.islice(self.terms, i, None))
+        except StopIteration:
+            raise IndexError('term queue index out of range')
+
+    def __repr__(self):
+        return f'TermQueue({list(self.terms)})'
+
+    def append(self, term):
+        '''Put a term at the back of the queue'''
+        self.terms[term] = None
+        self.terms.move_to_end(term)
+
+    def appendleft(self, term):
+        '''Put a term at the front of the queue'''
+        self.terms[term] = None
+        self.terms.move_to_end(term, last=False)
+
+    def popleft(self):
+        '''Remove and return the term at the front'''
+        return self.terms.popitem(last=False)[0]
+
+    def remove(self, term):
+        '''Remove a term from anywhere in the queue'''
+        try:
+            del self.terms[term]
+        except KeyError:
+            raise ValueError(f'term {term} not in queue')
+
+    def head(self, n):
+        '''Return the first n terms without moving them'''
+        return list(itertools.islice(self.terms, n))
+
+    def rotate(self, n):
+        '''
+        Move the first n terms to the back of the queue
+        and return them. Costs O(n) regardless of queue length.
+        '''
+        moved = self.head(n)
+        for term in moved:
+            self.terms.move_to_end(term)
+        return moved
+
+    def shuffle(self):
+        '''Shuffle the queue in place'''
+        terms = list(self.terms)
+        random.shuffle(terms)
+        self.terms = collections.OrderedDict.fromkeys(terms)
+
+def load_queues(set_data):
+    '''
+    Converts the term queue lists of a set to TermQueues in place.
+    Queues that are already converted are left alone.
+    '''
+    term_queues = set_data['term_queues']
+    for score, queue in term_queues.items():
+        if not isinstance(queue, TermQueue):
+            term_queues[score] = TermQueue(queue)
+    return term_queues
+
+# loaded TF apps by (app, version), shared by all studies of a process
+TF_APPS = {}
+TF_LOCK = threading.Lock()
+
+def shared_app(app, version):
+    '''Give the TF app for (app, version), loading it once per process'''
+    with TF_LOCK:
+        if (app, version) not in TF_APPS:
+            from tf.app import use
+            print('preparing TF...')
+            TF_APPS[(app, version)] = use(app, version=version, silent=True)
+        return TF_APPS[(app, version)]
+
+def start_cycle(set_data):
+    '''
+    Starts a new cycle of a set with the same cycle parameters.
+    '''
+    set_data['cycle_data']['total_sessions'] = 0  # reset sessions
+    set_data['cycle_data']['ncycle'] += 1
+
+    # some scores reset at cyclic intervals (e.g. S3 and S4)
+    # this config allows those scores to be reset on a modulo trigger
+    term_queues = load_queues(set_data)
+    for score, configdata in set_data['scoreconfig'].items():
+        ncycle = set_data['cycle_data']['ncycle']
+        nreset = configdata['nreset']
+        shuffle = configdata['shuffle']
+        if ncycle % nreset == 0:
+            if shuffle == 'yes':
+                term_queues[score].shuffle()
+            set_data['cycle_data']['score_starts'][score] = len(term_queues[score])
+
+def cycle_complete(set_data):
+    '''Whether all sessions of the current cycle are done; never for schedulers without cycles'''
+    cycle_data = set_data['cycle_data']
+    return get_scheduler(set_data).cycles and safediv(cycle_data['cycle_length'], cycle_data['total_sessions']) == 1
+
+class LazyTF:
+    '''
+    Stands in for a Text-Fabric app and defers
+    the call to tf.app.use until an attribute of the
+    app is first needed. In headless mode the app
+    is never loaded and any access raises an error.
+    Given a snapshot file, a memory-mapped Snapshot
+    stands in for the app; see snapshot.py.
+    '''
+
+    def __init__(self, app, version, headless=False, snapshot=None):
+        self.appName = app
+        self.version = version
+        self.headless = headless
+        self.snapshot = snapshot
+        self.app = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.app is not None
+
+    def load(self):
+        '''Load the TF app if not yet loaded'''
+        with self.lock:
+            if self.app is None:
+                if self.headless:
+                    raise Exception(f'TF app {self.appName} is not available in headless mode')
+                if self.snapshot is not None:
+                    self.app = self.open_snapshot()
+                else:
+                    self.app = shared_app(self.appName, self.version)
+        return self.app
+
+    def open_snapshot(self):
+        '''Open the snapshot and check that it is of this app and version'''
+        snapshot = Snapshot(self.snapshot)
+        if (snapshot.appName, snapshot.version) != (self.appName, self.version):
+            raise Exception(f'{self.snapshot} is a snapshot of {snapshot.appName} {snapshot.version}, '
+                            f'not of {self.appName} {self.version}')
+        return snapshot
+
+    def __getattr__(self, name):
+        # only reached for attributes of the app itself
+        if name.startswith('__') or name in {'app', 'lock', 'snapshot'}:
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
 class Study:
     '''
     Prepares and consumes data from Mahir 
@@ -77,25 +306,35 @@ class Study:
     def __init__(self, vocab_json, tf_app='bhsa', 
                  set_data=None, session_data=None,
                  resume_time=False, term_n=0, 
-                 pause_times=[]):
+                 pause_times=[], headless=False, journal_file=None,
+                 snapshot=None):
 
         # set meta data for study loop (for saves)
         self.session_data = session_data
         self.set_data = set_data
         self.term_n = term_n
-        self.pause_times = pause_times
+        self.pause_times = list(pause_times)
+        self.journal = None
+        self.edits = journal.EditLog() # score, gloss and lexeme edits, for undo
+        self.profiler = NullProfiler()
+        self.card_cache = None
+        self.ui = TextUI()
+        self.history = None
 
         self.tf_app = tf_app
         self.fstem = vocab_json.stem # for save names
+        self.options = (headless, snapshot) # for saved_study
         
         # load set data
         if not set_data:
-            with open(vocab_json, encoding='utf8') as setfile:
-                set_data = json.load(setfile)
-                self.set_data = set_data
+            set_data = load_set(vocab_json)
+            self.set_data = set_data
+        load_queues(set_data)
+        load_terms(set_data)
         
         # retrieve TF app data
         appdata = set_data['app_data']
+        self.appdata = appdata
         app = appdata['app']
         datversion = appdata['version']
         self.glossfeat = appdata['gloss_feature']
@@ -103,16 +342,46 @@ class Study:
         self.wordtype = appdata['wordtype']
         self.context = appdata['context']
         
-        # load the app
-        print('preparing TF...')
-        self.TF = use(app, version=datversion, silent=True)
-        self.F, self.T, self.L = self.TF.api.F, self.TF.api.T, self.TF.api.L
+        # the app is only loaded once a card needs it
+        if snapshot is True:
+            snapshot = snapshot_path(app, datversion)
+        self.TF = LazyTF(app, datversion, headless=headless, snapshot=snapshot)
+
+        # load example occurrences for the set's lexemes
+        self.index = self.load_index(set_data)
+        self.index_lock = threading.Lock()
+        # examples are weighted by appdata['example_weights']: uniform, parse or book
+        self.sampler = ExampleSampler(self.index, appdata.get('example_weights', 'uniform'))
+
+        # report inconsistencies; tools/checkset.py repairs them
+        problems = validate(set_data, self.index)
+        if problems:
+            print(f'CAUTION: {vocab_json} has problems (repair with tools/checkset.py --repair):')
+            for line in describe(problems):
+                print('\t' + line)
+
+        # resume a journaled session onto the committed set data
+        if journal_file is not None:
+            header, records = journal.read(journal_file)
+            session_data = Session.from_deck(set_data, header['deck'], header['deck_stats'])
+            self.session_data = session_data
+            self.term_n, self.pause_times = journal.replay(set_data, records, self.edits)
+            self.journal = journal.Journal(journal_file)
+            resume_time = datetime.fromtimestamp(os.path.getmtime(journal_file))
 
         # prepare for run, check cycle length
-        run = self.check_end_cycle(set_data)
-        if not run:
-            self.save_file(set_data, vocab_json)
-            raise Exception('EXIT PROGRAM INITIATED; FILE SHUFFLED AND SAVED')
+        elif session_data is None:
+            ncycle = set_data['cycle_data']['ncycle']
+            run = self.check_end_cycle(set_data)
+            if not run:
+                self.save_file(set_data, vocab_json)
+                raise Exception('EXIT PROGRAM INITIATED; FILE SHUFFLED AND SAVED')
+            # commit a new cycle or newly scheduled terms so journals replay onto them
+            migrated = get_scheduler(set_data).migrate(load_queues(set_data))
+            if migrated:
+                print(f'{migrated} terms were given due dates.')
+            if ncycle != set_data['cycle_data']['ncycle'] or migrated:
+                self.save_file(set_data, vocab_json)
 
         # build the study set, prep data for study session
         if session_data is None:
@@ -130,27 +399,94 @@ class Study:
             print(f'score {score}: {stat} terms')
         print(f'total: {sum(deck_stats.values())}')
 
-    def learn(self):
+    @property
+    def F(self):
+        return self.TF.api.F
+
+    @property
+    def T(self):
+        return self.TF.api.T
+
+    @property
+    def L(self):
+        return self.TF.api.L
+
+    def learn(self, profile=False):
         '''
-        Runs a study session with the user.
+        Runs a study session with the user, reading input with input().
+        With profile=True, the stages of every card are timed;
+        see profiler.py.
+        '''
+        self.ui = TextUI()
+        run_sync(self.study_loop(profile))
+
+    def start(self, profile=False, sync_secs=60):
         '''
+        Starts a study session as a task on the running event loop,
+        e.g. Jupyter's, with a text box for input (needs ipywidgets).
+        The kernel is not blocked while the user thinks: cards are
+        prepared and saves are made in threads, and the journal
+        is synced to disk every sync_secs.
+        Returns the task.
+        '''
+        self.ui = WidgetUI()
+        display(self.ui.box)
+
+        async def run():
+            with self.ui.output():
+                try:
+                    await self.study_loop(profile, sync_secs)
+                except Exception as error: # e.g. quit; a task would keep it silent
+                    print(error)
+                    raise
+
+        return asyncio.get_event_loop().create_task(run())
+
+    async def study_loop(self, profile=False, sync_secs=None):
+        '''
+        The study session of learn and start.
+        Input and slow work go through self.ui; see ui.py.
+        '''
+        ui = self.ui
+
+        # index any lexemes not yet seen; loads TF if needed
+        await ui.call(self.extend_index, set_lexemes(self.set_data['terms_dict']))
         print('beginning study session...')
-        self.start_time = datetime.now() # to be filled in on first instructions
-        
+        self.start_time = time.monotonic() # to be filled in on first instructions
+
+        self.open_session()
+
+        # sync the journal in the background, between events
+        syncer = asyncio.ensure_future(self.sync_journal(sync_secs)) if sync_secs else None
+
+        # keep timings over a saved and continued session
+        if profile and not self.profiler.enabled:
+            self.profiler = Profiler()
+        profiler = self.profiler
+
+        def record(op, **data):
+            profiler.lap('handle')
+            self.journal.record(op, **data)
+            profiler.lap('save')
                
         def pause_time():
             """Pause the timer"""
-            this_duration = datetime.now() - self.start_time
+            this_duration = timedelta(seconds=time.monotonic() - self.start_time)
             self.pause_times.append(this_duration)
+            record('pause', secs=this_duration.total_seconds())
             self.start_time = None # reset clock
 
         deck = self.session_data.deck
         terms_dict = self.set_data['terms_dict']
 
-        # make shortform TF methods / data names
-        glossfeat, freqfeat, wordtype, context = self.glossfeat, self.freqfeat, self.wordtype, self.context
-        F, L, T, Fs = self.F, self.L, self.T, self.TF.api.Fs
-        
+        # cards for the next deck positions are prepared while the user answers
+        cards = Prefetcher(lambda pos: self.prepare_card(deck[pos]), len(deck))
+
+        def close():
+            cards.close()
+            if syncer is not None:
+                syncer.cancel()
+
         # allow toggling of progress indicator
         show_progress = True
 
@@ -165,26 +501,19 @@ class Study:
             score = terms_dict[term_ID]['score']
             missed = terms_dict[term_ID]['stats']['missed']
 
-            # -- assemble and select examples (cycle through lexemes) -- 
-            lexs = terms_dict[term_ID]['source_lexemes']
-            ex_lex = random.choice(lexs)
-            ex_instance = random.choice(L.d(ex_lex, wordtype))
-            ex_passage = L.u(ex_instance, context)[0]
-            std_glosses = [(lx, Fs(glossfeat).v(lx), Fs(freqfeat).v(lx))
-                               for lx in lexs]
-            
-            # build parse string for BHSA app
-            if self.TF.appName == 'bhsa':
-                gender = F.gn.v(ex_instance)
-                number = F.nu.v(ex_instance)
-                if F.pdp.v(ex_instance) == 'verb':
-                    person = F.ps.v(ex_instance)
-                    stem = F.vs.v(ex_instance)
-                    tense = F.vt.v(ex_instance)
-                    parse_string = f'{stem}.{tense}.{person}.{gender}.{number}'
-                else:
-                    state = F.st.v(ex_instance)
-                    parse_string = f'{gender}.{number}.{state}'
+            # -- get the prepared card; start preparing the next ones -- 
+            profiler.card(term_ID, term_n)
+            highlight = HIGHLIGHTS.get(score, DEFAULT_HIGHLIGHT)
+            card = await ui.call(cards.get, term_n)
+            profiler.lap('wait')
+            rescored = card['highlight'] != highlight # since it was prepared
+            card = self.render_card(card, highlight)
+            if rescored:
+                profiler.lap('render')
+            profiler.prepared(card)
+            cards.prefetch(term_n)
+            parse_string = card['parse_string']
+            std_glosses = card['std_glosses']
             
             # -- display passage prompt and score box -- 
             clear_output()
@@ -194,25 +523,22 @@ class Study:
                     HTML(f'<span style="font-family:Times New Roman; font-size:14pt">{term_n+1}/{len(deck)}</span>')
                 )
 
-            highlights = {'0': 'pink'}
-            highlight = highlights.get(score, 'lightgreen') # default to light green
-
-            passage = self.TF.sectionStrFromNode(ex_passage)
             display(HTML(
-                f'<span style="float:right; font-family:Times New Roman; font-size:14pt">{passage}<span>'))
-            self.TF.plain(ex_passage, highlights={ex_instance: highlight})
+                f'<span style="float:right; font-family:Times New Roman; font-size:14pt">{card["passage"]}<span>'))
+            display(HTML(card['html']))
+            profiler.lap('display')
 
             # -- get user input --
             while True:
-                user_instruct = self.good_choice(
+                user_instruct = await self.good_choice(
                     {'', ',', '.', 'q', 'c', 
                      'e', 'l', '>', '<', 'p',
-                     'save', 'hprog'}
+                     'u', 'r', 'save', 'hprog'}
                     , ask='', allowNumber=True)
                 
                 # start timer upon user instruct if not already
                 if self.start_time is None:
-                    self.start_time = datetime.now()
+                    self.start_time = time.monotonic()
               
                 # show term glosses and data
                 if user_instruct in {''}:
@@ -222,7 +548,7 @@ class Study:
                         f'<span style="font-family:Times New Roman; font-size:14pt">{gloss} </span>'))
 
                     # show parse string for BHSA app
-                    if self.TF.appName == 'bhsa':
+                    if self.appdata['app'] == 'bhsa':
                         display(HTML(
                             f'<span style="font-family:Times New Roman; font-size:10pt">{parse_string} </span>')
                         )
@@ -235,17 +561,20 @@ class Study:
                         f'<span style="font-family:Times New Roman; font-size:10pt">missed: {missed}</span>'))
 
                 # score term
-                elif user_instruct.isnumeric():
-                    
+                elif user_instruct.isdecimal():
+                    user_instruct = str(int(user_instruct)) # e.g. '03' is score '3'
+
                     if user_instruct not in self.set_data['term_queues']:
-                        confirm = self.good_choice({'y','n'}, ask=f'Add new score [{user_instruct}]?')
+                        confirm = await self.good_choice({'y','n'}, ask=f'Add new score [{user_instruct}]?')
                         if confirm == 'y':
                             pass
                         else:
                             break
                     
-                    terms_dict[term_ID]['score'] = user_instruct
+                    self.edits.edit(terms_dict, 'score', term_ID, user_instruct, term_n)
+                    record('score', term=term_ID, score=user_instruct)
                     term_n += 1
+                    record('cursor', term_n=term_n)
                     break
 
                 # move one term back/forward
@@ -256,6 +585,7 @@ class Study:
                     elif user_instruct == '.':
                         if term_n != len(deck):
                             term_n += 1
+                    record('cursor', term_n=term_n)
                     break
               
 
@@ -265,52 +595,79 @@ class Study:
                         term_n = len(deck)
                     elif user_instruct == '<':
                         term_n = 0
+                    record('cursor', term_n=term_n)
                     break
 
                 # get a different word context
                 elif user_instruct == 'c':
+                    cards.invalidate(term_n)
                     break
 
                 # edit term gloss on the fly
                 elif user_instruct == 'e':
-                    new_def = self.good_choice(
+                    new_def = await self.good_choice(
                         set(), ask=f'edit def [{gloss}]')
-                    terms_dict[term_ID]['gloss'] = new_def
+                    self.edits.edit(terms_dict, 'gloss', term_ID, new_def, term_n)
+                    record('gloss', term=term_ID, gloss=new_def)
                     break
 
                 # edit lexeme nodes on the fly
                 elif user_instruct == 'l':
 
                     # confirm lexeme edit
-                    confirm = self.good_choice({'y','n'}, ask='Edit lex nodes?')
+                    confirm = await self.good_choice({'y','n'}, ask='Edit lex nodes?')
                     if confirm == 'n':
                         break
 
                     lexs = terms_dict[term_ID].get('source_lexemes', )
-                    new_lexs = self.good_choice(
+                    new_lexs = await self.good_choice(
                         set(), ask=f'edit lex nodes {lexs}')
                     new_lexs = [int(l.strip()) for l in new_lexs.split(',')]
-                    terms_dict[term_ID]['source_lexemes'] = new_lexs
+                    self.edits.edit(terms_dict, 'lexemes', term_ID, new_lexs, term_n)
+                    record('lexemes', term=term_ID, lexemes=new_lexs)
+                    cards.invalidate(term_n)
+                    break
+
+                # undo or redo the last edit and go to its term
+                elif user_instruct in {'u', 'r'}:
+                    op = 'undo' if user_instruct == 'u' else 'redo'
+                    edit = getattr(self.edits, op)(terms_dict)
+                    if edit is None:
+                        print(f'nothing to {op}')
+                        continue
+                    record(op)
+                    edit_op, edit_term, old, new, term_n = edit
+                    record('cursor', term_n=term_n)
+                    if edit_op == 'lexemes':
+                        cards.invalidate(term_n)
                     break
               
                 # pause timer
                 elif user_instruct == 'p':
                     pause_time()
-                    self.save_session(term_n) # save a back up just in case
+                    profiler.lap('handle')
+                    await ui.call(self.save_session, term_n) # save a back up just in case
+                    profiler.lap('save')
                     print('Session time paused...')
 
                 # allow for saving sessions
                 elif user_instruct == 'save':
+                    close()
                     pause_time()
-                    self.save_session(term_n)
+                    profiler.lap('handle')
+                    await ui.call(self.save_session, term_n)
+                    self.suspend(term_n)
+                    profiler.end()
                     print('Session saved for 15 hours...')
                     print(f'\telapsed: {sum(self.pause_times, timedelta())}')
                     return
 
                 # user quit
                 elif user_instruct == 'q':
-                    confirm = self.good_choice({'y', 'n'}, ask='confirm quit?') # double check
+                    confirm = await self.good_choice({'y', 'n'}, ask='confirm quit?') # double check
                     if confirm == 'y':
+                        close()
+                        self.journal.rollback() # keep only what was saved before
                         raise Exception('Quit initiated. Nothing saved.')
                     else:
                         break
@@ -322,17 +679,20 @@ class Study:
 
             # launch end program sequence
             if term_n > len(deck)-1:
+                profiler.end()
                 clear_output()
-                ask_end = self.good_choice(
+                ask_end = await self.good_choice(
                     {'y', 'n'}, 'session is complete, quit now?')
 
                 if ask_end == 'y':
-                    times = [datetime.now() - self.start_time] + self.pause_times
-                    self.finalize_session(times)
+                    times = [timedelta(seconds=time.monotonic() - self.start_time)] + self.pause_times
+                    close()
+                    await ui.call(self.finalize_session, times)
                     break
 
                 elif ask_end == 'n':
                     term_n -= 1
+                    record('cursor', term_n=term_n)
 
         clear_output()
         print('The following scores were changed ')
@@ -341,46 +701,201 @@ class Study:
         print('\nduration: ', self.set_data['stats'][-1]['duration'])
         print('\nseconds per term:', self.set_data['stats'][-1]['secs_per_term'])
 
-    def save_session(self, term_n):
-        """Save a session for later."""
-        savedata = {
-            'set_data': self.set_data,
-            'session_data': self.session_data,
-            'resume_time': str(datetime.now()),
-            'pause_times': self.pause_times,
-            'term_n': term_n,
+    def open_session(self):
+        '''
+        Start the journal of the session and open the card
+        cache, if not yet done; for study_loop and server.py.
+        '''
+        # journal all edits from here on
+        if self.journal is None:
+            self.journal = journal.Journal.start(
+                journal.journal_path(self.vocab_json), self.session_data)
+
+        # rendered passages are kept on disk across sessions
+        if self.card_cache is None:
+            app, version = self.appdata['app'], self.appdata['version']
+            cache_version = version if self.TF.snapshot is None else f'{version}.snapshot' # other html
+            self.card_cache = CardCache(cache_path(app, version), app, cache_version)
+
+    def close_cache(self):
+        '''Close the card cache; open_session opens it again.'''
+        if self.card_cache is not None:
+            self.card_cache.close()
+            self.card_cache = None
+
+    def prepare_card(self, term_ID):
+        '''
+        Selects an example of a term and renders its card.
+        Nothing is displayed, so this can run in a worker thread.
+        '''
+        start = time.perf_counter()
+        tdata = self.set_data['terms_dict'][term_ID]
+
+        # -- assemble and select examples (cycle through lexemes) -- 
+        lexs = tdata['source_lexemes']
+        if self.index.missing(lexs): # e.g. after lexeme edits
+            self.extend_index(lexs)
+        ex_lex = random.choice(lexs)
+        ex_instance, ex_passage, parse_string = self.sampler.draw(ex_lex)
+
+        card = {
+            'term_ID': term_ID,
+            'ex_lex': ex_lex,
+            'ex_instance': ex_instance,
+            'ex_passage': ex_passage,
+            'parse_string': parse_string,
+            'std_glosses': self.index.std_glosses(lexs),
+            'passage': self.cached(f'section:{ex_passage}',
+                                   lambda: self.TF.sectionStrFromNode(ex_passage)),
+            'secs': {'lookup': time.perf_counter() - start},
         }
-        with open(f'{self.fstem}.save', 'wb') as outfile:
-            pickle.dump(savedata, outfile)
+        return self.render_html(card, HIGHLIGHTS.get(tdata['score'], DEFAULT_HIGHLIGHT))
+
+    def render_card(self, card, highlight):
+        '''
+        Give a prepared card for display with a highlight colour,
+        rendering it again if the colour has changed since.
+        Its context now counts as shown, so cards that are
+        prepared but never displayed do not use up contexts.
+        '''
+        self.sampler.show(card['ex_passage'])
+        if card['highlight'] == highlight:
+            return card
+        return self.render_html(card, highlight)
+
+    def render_html(self, card, highlight):
+        '''Render the passage HTML of a card with a highlight colour.'''
+        start = time.perf_counter()
+        html = self.cached(
+            f'html:{card["ex_passage"]}:{card["ex_instance"]}:{highlight}',
+            lambda: self.TF.plain(
+                card['ex_passage'],
+                highlights={card['ex_instance']: highlight},
+                _asString=True,
+            ))
+        secs = dict(card.get('secs', {}), render=time.perf_counter() - start)
+        return dict(card, highlight=highlight, html=html, secs=secs)
+
+    def cached(self, key, make):
+        '''
+        Give a rendered string from the card cache,
+        making and storing it if it is not there.
+        '''
+        if self.card_cache is None:
+            return make()
+        return self.card_cache.fetch(key, make)
+
+    def session_history(self):
+        '''Give the session history of the set in columns; see analytics.py'''
+        if self.history is None:
+            self.history = SessionHistory(self.set_data['stats'])
+        return self.history
+
+    def load_index(self, set_data):
+        '''
+        Loads the example index of the set.
+        If it does not yet exist for this set and TF data version,
+        an empty one is made; it is filled with TF at the start of learn.
+        '''
+        appdata = set_data['app_data']
+        file = index_path(self.fstem, appdata['app'], appdata['version'])
+        index = ExampleIndex.load(file, appdata['app'], appdata['version'])
+        if index is None:
+            index = ExampleIndex(appdata['app'], appdata['version'])
+        return index
+
+    def extend_index(self, lexemes):
+        '''
+        Add missing lexemes to the example index and save it.
+        Cards are prepared in a worker thread, so only one
+        thread extends the index at a time.
+        '''
+        with self.index_lock:
+            missing = self.index.missing(lexemes)
+            if missing:
+                print(f'indexing {len(missing)} lexemes...')
+                self.index.extend(self.TF.api, missing, self.appdata)
+                self.index.save(index_path(self.fstem, self.index.app, self.index.version))
+
+    def save_session(self, term_n):
+        """
+        Save a session for later.
+        All edits are already in the journal, so only
+        the cursor is recorded before syncing to disk.
+        """
+        self.journal.record('cursor', term_n=term_n)
+        self.journal.checkpoint()
             
+    def suspend(self, term_n):
+        '''
+        Keep a saved study in this kernel, so that loadStudy
+        gives it back without loading anything again; only the
+        last MAX_SAVED_STUDIES saved studies are kept.
+        The journal is closed; resume reopens it.
+        '''
+        self.term_n = term_n
+        self.journal.close()
+        self.close_cache()
+        signatures = (file_signature(self.vocab_json), file_signature(self.journal.file))
+        key = Path(self.vocab_json).resolve()
+        SAVED_STUDIES[key] = (signatures, self.options, self)
+        SAVED_STUDIES.move_to_end(key)
+        # the least recently saved are loaded from their journals again
+        while len(SAVED_STUDIES) > MAX_SAVED_STUDIES:
+            SAVED_STUDIES.popitem(last=False)
+
+    def resume(self):
+        '''Reopen the journal of a suspended study; returns the study'''
+        self.journal = journal.Journal(self.journal.file)
+        resume_time = datetime.fromtimestamp(os.path.getmtime(self.journal.file))
+        print(f'\nSession is resumed from {resume_time}.\n')
+        print(f'{self.set_data["name"]}: {self.term_n}/{len(self.session_data.deck)} terms done.')
+        return self
+
     def clean_session_saves(self):
         """Checks for saves and removes them"""
+        SAVED_STUDIES.pop(Path(self.vocab_json).resolve(), None)
         savefile = next(Path().glob(f'{self.fstem}.save'), None)
         if savefile is not None and savefile.exists():
             savefile.unlink()
+        if self.journal is not None:
+            self.journal.delete()
+        else:
+            journal_file = journal.journal_path(self.vocab_json)
+            if journal_file.exists():
+                journal_file.unlink()
             
     def finalize_session(self, times):
         '''
         Updates and saves session data and stats.
+        times are the active stretches of the session;
+        with None its duration is stored as unknown (None).
         '''
         
         # log session stats
         session_stats = {}
-        duration = sum(times, timedelta())
-        secs_per_term = round(duration.total_seconds() / len(self.session_data.deck), 2) # average seconds per term
         session_stats['date'] = str(datetime.now())
-        session_stats['duration'] = str(duration) 
-        session_stats['secs_per_term'] = secs_per_term
+        if times is None:
+            session_stats['duration'] = session_stats['secs_per_term'] = None
+        else:
+            duration = sum(times, timedelta())
+            session_stats['duration'] = str(duration) 
+            session_stats['secs_per_term'] = round(duration.total_seconds() / len(self.session_data.deck), 2) # average seconds per term
+        if self.profiler.enabled:
+            session_stats['timings'] = self.profiler.summary()
         session_stats['deck'] = self.session_data.deck_stats
         session_stats['cycle'] = self.set_data['cycle_data']['ncycle']
         for term in self.session_data.deck:
             # count term as seen
             self.set_data['terms_dict'][term]['stats']['seen'] += 1
 
+        # reschedule the deck's terms before their queues change
+        get_scheduler(self.set_data).review(self.set_data['term_queues'], self.session_data.deck)
+
         # reset queues based on changed scores & update stats
         session_stats['changes'] = collections.Counter()
         self.add_new_scores()
-        self.update_queues(session_stats['changes'])
+        self.update_queues(session_stats['changes'], self.edits.net_changes())
         # track final score count at end of session
         session_stats['score_counts'] = dict((score, len(queue))
                                              for score, queue in self.set_data['term_queues'].items())
@@ -388,43 +903,56 @@ class Study:
         # update set data
         self.set_data['cycle_data']['total_sessions'] += 1
         self.set_data['stats'].append(session_stats)
+        if self.history is not None:
+            self.history.append(session_stats)
 
-        # save new data
-        self.save_file(self.set_data, self.vocab_json)
+        # save new data; only the deck's terms have changed
+        self.save_file(self.set_data, self.vocab_json, term_ids=self.session_data.deck)
         self.clean_session_saves()
+        self.close_cache()
 
-    def update_queues(self, stats_dict):
+    def update_queues(self, stats_dict, terms=None):
         '''
         Adjusts term queues to the terms_dict when a term is changed to a new score.
         Terms are removed from their old queue and added to the new ones.
         All terms go to the back of their respective queues.
+        Only terms of the session deck can be rescored, so only those are checked,
+        or only the given terms, such as the net score changes of the edit log.
         '''
 
         term_queues = self.set_data['term_queues']
         terms_dict = self.set_data['terms_dict']
-        # make buffer queues for iteration
-        # prevents altering original during iteration
-        buffer_queues = copy.deepcopy(term_queues)
+        # a TermTable gives int scores directly
+        table = isinstance(terms_dict, TermTable)
 
         # make adjustments
-        for score, term_queue in buffer_queues.items():
-            for term in term_queue:
+        for term in (self.session_data.deck if terms is None else terms):
 
+            if table:
+                new = terms_dict.score(term)
+                cur_score = str(new)
+            else:
                 cur_score = terms_dict[term]['score']
-              
-                # compare old/new score, change if needed
-                if score != cur_score:
+                new = int(cur_score)
+          
+            # compare old/new score, change if needed
+            if term not in term_queues[cur_score]:
+                score = next((s for s, queue in term_queues.items() if term in queue), None)
+
+                # a term in no queue (see validate.py) is only queued
+                if score is None:
+                    print(f'CAUTION: term {term} was in no queue; it is put in queue {cur_score}')
+
+                else:
+                    old = int(score)
 
                     # check for certain term changes
-                    isdowngrade = int(cur_score) < int(score)
+                    isdowngrade = new < old
                     change = f'{cur_score}<-{score}' if isdowngrade else f'{score}->{cur_score}'
-                    missed = (
-                        int(cur_score) < int(score)
-                        and int(score) > 2
-                    )
+                    missed = new < old and old > 2
                     learned = (
-                        int(score) < 3 
-                        and int(cur_score) > 2
+                        old < 3
+                        and new > 2
                         and terms_dict[term]['stats']['missed'] == 0 
                     )
 
@@ -435,18 +963,15 @@ class Study:
                     if learned:
                         terms_dict[term]['stats']['learned'] = str(datetime.now()) 
 
-                    # assign new queue position
                     term_queues[score].remove(term)
-                    if cur_score != '0':
-                        # scores >0 go to back of queue
-                        term_queues[cur_score].append(term)
-                    else:
-                        # score 0 goes to front of queue
-                        term_queues[cur_score].insert(0, term)
 
-                # if no change, move on
+                # assign new queue position
+                if cur_score != '0':
+                    # scores >0 go to back of queue
+                    term_queues[cur_score].append(term)
                 else:
-                    continue
+                    # score 0 goes to front of queue
+                    term_queues[cur_score].appendleft(term)
 
     def check_end_cycle(self, set_data):
         '''
@@ -457,26 +982,13 @@ class Study:
 
         run_study = True
 
-        if safediv(set_data['cycle_data']['cycle_length'], set_data['cycle_data']['total_sessions']) == 1:
+        if cycle_complete(set_data):
             print('cycle for this set is complete...')
-            keep_same = self.good_choice(
-                {'y', 'n'}, ask='keep cycle parameters the same?')
+            keep_same = run_sync(self.good_choice(
+                {'y', 'n'}, ask='keep cycle parameters the same?'))
 
             if keep_same == 'y':
-                set_data['cycle_data']['total_sessions'] = 0  # reset sessions
-                set_data['cycle_data']['ncycle'] += 1
-
-                # some scores reset at cyclic intervals (e.g. S3 and S4)
-                # this config allows those scores to be reset on a modulo trigger
-                for score, configdata in set_data['scoreconfig'].items():
-                    ncycle = set_data['cycle_data']['ncycle']
-                    nreset = configdata['nreset']
-                    shuffle = configdata['shuffle']
-                    if ncycle % nreset == 0:
-                        if shuffle == 'yes':
-                            random.shuffle(set_data['term_queues'][score])
-                        set_data['cycle_data']['score_starts'][score] = len(
-                            set_data['term_queues'][score])
+                start_cycle(set_data)
 
             elif keep_same == 'n':
                 print('You must reset parameters manually...')
@@ -494,119 +1006,100 @@ class Study:
         terms_dict = self.set_data['terms_dict']
 
         # add new scores and terms to term queues
-        for termID, tdata in terms_dict.items():
-            score = tdata['score']
+        if isinstance(terms_dict, TermTable):
+            score_terms = ((termID, score) for score, termID in terms_dict.first_scores().items())
+        else:
+            score_terms = ((termID, tdata['score']) for termID, tdata in terms_dict.items())
+        for termID, score in score_terms:
             if score not in queues:
                 if score not in score_configs:
                     print(
                         f'CAUTION: score {score} is not configured! (found on term {termID})')
                     print('NB: a new score queue has been generated!')
-                queues[score] = []
+                queues[score] = TermQueue()
                 self.set_data['cycle_data']['score_starts'][score] = 0
 
-    def good_choice(self, good_choices, ask='', allowNumber=False):
+    async def sync_journal(self, secs):
+        '''Sync the journal to disk every secs seconds.'''
+        while True:
+            await asyncio.sleep(secs)
+            self.journal.sync()
+
+    async def good_choice(self, good_choices, ask='', allowNumber=False):
         '''
         Gathers and checks a user's input against the 
         allowed choices. Runs loop until valid choice provided.
         '''
-        choice = input(ask)
+        self.profiler.lap('handle')
+        choice = await self.ui.read(ask)
+        self.profiler.lap('think')
 
-        if allowNumber and choice.isnumeric():  # allow arbitrary score choices
+        if allowNumber and choice.isdecimal():  # allow arbitrary score choices
             good_choices.add(choice)
 
         while (not {choice} & good_choices) and (good_choices):
             print(f'Invalid. Choose from {good_choices}')
-            choice = input(ask)
+            self.profiler.lap('handle')
+            choice = await self.ui.read(ask)
+            self.profiler.lap('think')
 
         return choice
 
-    def save_file(self, set_data, file):
+    def save_file(self, set_data, file, term_ids=None):
         '''
-        Save json set dat with proper encoding
-        and indentation.
+        Save set data with the storage backend of the file.
+        JSON is written with proper encoding and indentation.
+        If term_ids are given, backends that can (SQLite)
+        only update those terms.
         '''
-        with open(file, 'w', encoding='utf8') as outfile:
-            json.dump(set_data, outfile, indent=1, ensure_ascii=False)
+        if term_ids is None:
+            save_set(set_data, file)
+        else:
+            update_set(set_data, file, term_ids)
 
 
 class Session:
 
     '''
     Constructs a study set for a session that contains words scored 0-3.
-    term_queues is a dict with scores as keys, lists as values containing term IDs.
+    term_queues is a dict with scores as keys, TermQueues as values containing term IDs.
     The quota for term 0 (new terms) is set by the user in the new_quota key of cycle_data.
     The cycle_len is the number of days in a full review cycle that class should calculate.
 
     The key to buildDeck is the term queue.
     The term queue is a list of term IDs of a given score.
     These lists are modified while a deck is constructed.
-    When class adds terms to a deck, it also moves them to the end of their queue (with list.pop(0)).
+    When class adds terms to a deck, it also moves them to the end of their queue (with TermQueue.rotate).
     The modified lists are then returned (along with the deck) to be used for the next study session.
     The cycle is repeated in the subsequent session.
+    The deck is built by the set's scheduler, which may also
+    keep due dates per term instead (see scheduler.py).
     '''
 
+    @classmethod
+    def from_deck(cls, set_data, deck, deck_stats):
+        '''
+        Rebuild a session from a deck that was made
+        earlier from the same committed set data.
+        The queues are advanced just as when the deck was built.
+        '''
+        session = cls.__new__(cls)
+        term_queues = load_queues(set_data)
+        session.scheduler = get_scheduler(set_data)
+        session.scheduler.replay_deck(term_queues, deck, deck_stats)
+        session.deck = list(deck)
+        session.deck_stats = collections.Counter(deck_stats)
+        session.term_queues = term_queues
+        return session
+
     def __init__(self, set_data):
 
         # grab set data
-        term_queues = set_data['term_queues']
-        new_min = set_data['cycle_data']['new_quota']
-        cycle_len = set_data['cycle_data']['cycle_length']
-        nsession = set_data['cycle_data']['total_sessions']
-        # sum of scores at start of the cycle
-        s_starts = set_data['cycle_data']['score_starts']
-        # sum of all scores by this session
-        s_counts = dict((score, len(terms))
-                        for score, terms in term_queues.items())
-
-        # calculate daily set quotas, NB math.ceil rounds up^
-        # score 4-5 formula optimizes with decimal issues in Python
-        # formula is: int(round(((nterms/nsessions/nreset)*(NthSession-1))-int((nterms/nsessions/nreset)*(NthSession-1)) + (nterms/nsessions/nreset), 2))
-
-        score2quota = {
-            # s6 seen every 8 cycles
-            '6': int(round(((s_starts['6']/cycle_len/8)*(nsession-1))-int((s_starts['6']/cycle_len/8)*(nsession-1))
-              + (s_starts['6']/cycle_len/8), 2)) if s_counts.get('6', 0) else 0,
-            # s5 seen every 4 cycles
-            '5': int(round(((s_starts['5']/cycle_len/4)*(nsession-1))-int((s_starts['5']/cycle_len/4)*(nsession-1))
-                          + (s_starts['5']/cycle_len/4), 2)) if s_counts.get('5', 0) else 0,
-            # s4 seen every 2 cycles
-            '4': int(round(((s_starts['4']/cycle_len/2)*(nsession-1))-int((s_starts['4']/cycle_len/2)*(nsession-1))
-                          + (s_starts['4']/cycle_len/2), 2)) if s_counts.get('4', 0) else 0,
-            # s3 seen every cycle
-            '3': math.ceil(s_starts['3'] / cycle_len) if s_counts.get('3', 0) else 0,
-            # s2 seen every 4 sessions
-            '2': math.ceil(s_counts['2'] / 4) if s_counts.get('2', 0) else 0,
-            # s1 seen ever other session
-            '1': math.ceil(s_counts['1'] / 2) if s_counts.get('1', 0) else 0,
-            # s0 set by user
-            '0': new_min
-        }
-
-        # construct a study deck and keep stats
-        deck = []
-
-        deck_stats = collections.Counter()
-
-        # add quotas from scores and advance known queues
-        for score, quota in score2quota.items():
-            for i in range(0, quota):
-
-                # stop if no more terms
-                if len(term_queues[score]) < i+1:
-                    break
-
-                # add new terms to deck
-                # move known terms to back of their queues
-                if score != '0':
-                    deck.append(term_queues[score][0])
-                    term_queues[score].append(term_queues[score].pop(0))
-
-                # score 0 selected differently; their queue is not advanced
-                else:
-                    deck.append(term_queues[score][i])
+        term_queues = load_queues(set_data)
 
-                # log count for statistics tracking
-                deck_stats.update([score])
+        # the set's scheduler builds the deck (see scheduler.py)
+        self.scheduler = get_scheduler(set_data)
+        deck, deck_stats = self.scheduler.build_deck(term_queues)
 
         # shuffle deck data
         random.shuffle(deck)
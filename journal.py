@@ -0,0 +1,262 @@
+'''
+This module keeps an append-only journal of a study session.
+
+A journal starts with a header record holding the session deck.
+Every score, gloss or lexeme edit, cursor move and pause is then
+appended as a small JSON record, one per line, and flushed right away,
+so a crash of Python or the kernel loses at most the record being
+written. Pauses and saves mark a checkpoint, which is also synced to
+disk; an OS crash or power loss can lose the records since the last
+sync (Study.start also syncs every sync_secs).
+The journal is kept next to its set, e.g. hebrew.json has hebrew.journal.
+
+A session is resumed by loading the last committed vocab json,
+rebuilding the deck from the header and replaying the records onto it.
+The journal is removed once the session is finalized.
+Old-style pickled saves are converted to journals with from_save,
+after restore_save has committed the cycle state they held.
+
+The edits of a session are kept in an EditLog, which can undo and
+redo them one at a time. Undos and redos are journaled as records
+too, and replay rebuilds the log, so the undo history of a session
+lasts over saves. The old value of an edit is not journaled, since
+replay finds it in the set data.
+'''
+
+import os
+import copy
+import json
+from pathlib import Path
+from datetime import timedelta
+
+JOURNAL_VERSION = 1
+
+def journal_path(file):
+    '''Give the journal file of a set file, in the set's directory'''
+    return Path(file).with_suffix('.journal')
+
+class Journal:
+    '''
+    Writes records to a session journal.
+    '''
+
+    def __init__(self, file, mode='a'):
+        self.file = Path(file)
+        if mode == 'a' and self.file.exists():
+            drop_torn_record(self.file)
+        self.outfile = open(self.file, mode, encoding='utf8')
+        # position of the last checkpoint, for rollbacks;
+        # a reopened journal can be rolled back to where it was opened
+        self.committed = self.outfile.tell() if mode == 'a' else None
+
+    @classmethod
+    def start(cls, file, session):
+        '''Start a new journal for a session deck.'''
+        journal = cls(file, mode='w')
+        journal.record(
+            'session',
+            version=JOURNAL_VERSION,
+            deck=session.deck,
+            deck_stats=session.deck_stats,
+        )
+        journal.sync()
+        return journal
+
+    def record(self, op, **data):
+        '''Append a record and flush it.'''
+        data = {'op': op, **data}
+        self.outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
+        self.outfile.flush()
+
+    def sync(self):
+        '''Force written records to disk.'''
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+
+    def checkpoint(self):
+        '''Mark and sync a point that a rollback returns to.'''
+        self.record('checkpoint')
+        self.sync()
+        self.committed = self.outfile.tell()
+
+    def rollback(self):
+        '''
+        Drop all records since the last checkpoint.
+        Without a checkpoint the whole journal is removed.
+        '''
+        if self.committed is None:
+            self.delete()
+        else:
+            self.outfile.truncate(self.committed)
+            self.close()
+
+    def close(self):
+        if not self.outfile.closed:
+            self.outfile.close()
+
+    def delete(self):
+        '''Close and remove the journal file.'''
+        self.close()
+        if self.file.exists():
+            self.file.unlink()
+
+class EditLog:
+    '''
+    The undo and redo stacks of the score, gloss and lexeme
+    edits of a session. An edit is (op, term, old, new, term_n),
+    with op a record op and term_n the deck position of the term.
+    A new edit clears the redo stack.
+    '''
+
+    KEYS = {'score': 'score', 'gloss': 'gloss', 'lexemes': 'source_lexemes'}
+
+    def __init__(self):
+        self.done = []
+        self.undone = []
+
+    def edit(self, terms_dict, op, term, new, term_n):
+        '''Make an edit in terms_dict and log it'''
+        key = self.KEYS[op]
+        old = terms_dict[term][key]
+        terms_dict[term][key] = new
+        self.done.append((op, term, old, new, term_n))
+        self.undone.clear()
+
+    def undo(self, terms_dict):
+        '''Revert the last edit; returns it, or None if there is none'''
+        if not self.done:
+            return None
+        edit = self.done.pop()
+        op, term, old, new, term_n = edit
+        terms_dict[term][self.KEYS[op]] = old
+        self.undone.append(edit)
+        return edit
+
+    def redo(self, terms_dict):
+        '''Make the last undone edit again; returns it, or None if there is none'''
+        if not self.undone:
+            return None
+        edit = self.undone.pop()
+        op, term, old, new, term_n = edit
+        terms_dict[term][self.KEYS[op]] = new
+        self.done.append(edit)
+        return edit
+
+    def net_changes(self, op='score'):
+        '''Map the terms whose value of op has changed to their (first, last) values'''
+        changes = {}
+        for edit_op, term, old, new, term_n in self.done:
+            if edit_op == op:
+                changes[term] = (changes.get(term, (old,))[0], new)
+        return {term: change for term, change in changes.items() if change[0] != change[1]}
+
+def restore_save(savedata, set_data):
+    '''
+    Put the cycle data, score config and queue order of an old-style
+    pickled save into the committed set_data, as they were when its
+    deck was built. Old sessions changed them (e.g. when a new cycle
+    began) without writing the set, so they must be committed before
+    the save's journal is. Returns whether set_data has changed.
+    '''
+    saved = savedata['set_data']
+    deck_stats = savedata['session_data'].deck_stats
+    term_queues = {}
+    for score, queue in saved['term_queues'].items():
+        queue = list(queue)
+        # old sessions moved the deck's known terms to the back;
+        # the journal's deck moves them again when it is resumed
+        count = deck_stats.get(score, 0) if score != '0' else 0
+        if count:
+            queue = queue[-count:] + queue[:-count]
+        term_queues[score] = queue
+    terms = set(set_data['terms_dict'])
+    if any(term not in terms for queue in term_queues.values() for term in queue):
+        raise Exception('the terms of the set have changed since it was saved; cannot convert the save')
+    restored = {
+        'cycle_data': copy.deepcopy(saved['cycle_data']),
+        'scoreconfig': copy.deepcopy(saved['scoreconfig']),
+        'term_queues': term_queues,
+    }
+    changed = any(set_data[key] != value for key, value in restored.items())
+    set_data.update(restored)
+    return changed
+
+def from_save(savedata, set_data, file):
+    '''
+    Write a journal for an old-style pickled save. Its deck goes in
+    the header, and the edits of the saved set data over the committed
+    set_data, each at the cursor of its term, its pauses and its
+    cursor become records.
+    '''
+    session = savedata['session_data']
+    saved_terms = savedata['set_data']['terms_dict']
+    terms_dict = set_data['terms_dict']
+    journal = Journal.start(file, session)
+    # only the terms of the deck are edited in a session;
+    # the cursor goes to a term before its edits, so that undo returns to it
+    deck_index = {}
+    for term_n, term in enumerate(session.deck):
+        deck_index.setdefault(term, term_n)
+    for term, term_n in deck_index.items():
+        saved, committed = saved_terms[term], terms_dict[term]
+        moved = False
+        for key, op in (('score', 'score'), ('gloss', 'gloss'), ('source_lexemes', 'lexemes')):
+            if key in saved and saved[key] != committed.get(key):
+                if not moved:
+                    journal.record('cursor', term_n=term_n)
+                    moved = True
+                journal.record(op, term=term, **{op: saved[key]})
+    for pause in savedata['pause_times']:
+        journal.record('pause', secs=pause.total_seconds())
+    journal.record('cursor', term_n=savedata['term_n'])
+    journal.checkpoint()
+    journal.close()
+
+def drop_torn_record(file):
+    '''Cut a half-written last line off a journal file.'''
+    with open(file, 'rb+') as infile:
+        data = infile.read()
+        if data and not data.endswith(b'\n'):
+            infile.truncate(data.rfind(b'\n') + 1)
+
+def read(file):
+    '''
+    Read a journal file into its header and records.
+    A half-written last line (e.g. from a crash) is ignored.
+    '''
+    records = []
+    with open(file, encoding='utf8') as infile:
+        for line in infile:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    header, records = records[0], records[1:]
+    if header.get('op') != 'session' or header.get('version') != JOURNAL_VERSION:
+        raise Exception(f'{file} is not a version {JOURNAL_VERSION} session journal')
+    return header, records
+
+def replay(set_data, records, edits=None):
+    '''
+    Apply journal records onto set data, logging
+    the edits in an EditLog, if one is given.
+    Returns the cursor position and pause times.
+    '''
+    terms_dict = set_data['terms_dict']
+    edits = EditLog() if edits is None else edits
+    term_n = 0
+    pause_times = []
+    for rec in records:
+        op = rec['op']
+        if op in EditLog.KEYS:
+            # an edit is made at the cursor
+            edits.edit(terms_dict, op, rec['term'], rec[op], term_n)
+        elif op == 'undo':
+            edits.undo(terms_dict)
+        elif op == 'redo':
+            edits.redo(terms_dict)
+        elif op == 'cursor':
+            term_n = rec['term_n']
+        elif op == 'pause':
+            pause_times.append(timedelta(seconds=rec['secs']))
+    return term_n, pause_times
@@ -10,35 +10,22 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 from iMahir import loadStudy
+from analytics import remaining_freqs
 
 def plot_progress(heb):
     """Make a plot of learned/unlearned terms"""
     
-    sessions = [sd for sd in heb.set_data['stats'] if 'score_counts' in sd]
-    learned_lengths = [sum(s['score_counts'][scr] for scr in s['score_counts'] if int(scr) > 2) 
-                           for s in sessions]
-    unlearned_lengths = [s['score_counts']['0'] for s in sessions]
-    dates = [datetime.strptime(sd['date'], '%Y-%m-%d %H:%M:%S.%f') for sd in sessions]
-    date_labels = [datetime.strftime(time, format='%d-%m_%H:%M') for time in dates]
-    date2nlearned = dict(zip(date_labels, learned_lengths)) # get dict for references
-    date2nunlearned = dict(zip(date_labels, unlearned_lengths))
+    history = heb.session_history()
 
     # plot this data only with cutoff
-    cutoff = -30 # max amount
-    plt_sessions = sessions[cutoff:]
-    plt_learned = learned_lengths[cutoff:]
-    plt_unlearned = unlearned_lengths[cutoff:]
-    plt_dates = date_labels[cutoff:]
+    cutoff = 30 # max amount
+    start = max(0, len(history) - cutoff)
+    plt_learned = history.learned[start:]
+    plt_unlearned = history.unlearned[start:]
+    plt_dates = history.dates(start)
 
     # calculate cycle lines
-    cycle_bounds = []
-    last_cycle = None
-    for i, sd in enumerate(plt_sessions):
-        cycle = sd['cycle']
-        last_cycle = cycle if not last_cycle else last_cycle
-        if last_cycle != cycle:
-            cycle_bounds.append(i-0.5)
-            last_cycle = cycle
+    cycle_bounds = [row - 0.5 for row in history.cycle_bounds(start)]
             
     # make the plot
     x = np.arange(len(plt_learned))
@@ -56,17 +43,11 @@ def plot_progress(heb):
         plt.axvline(bound, color='grey', linestyle='dotted')
     plt.show()
     
-    last_transition = plt_dates[int(cycle_bounds[-1] - 0.5)] # get date of last cycle switch
-    print('n-learned since last cycle:', plt_learned[-1] - date2nlearned[last_transition])
+    print('n-learned since last cycle:', history.cycle_learned[-1])
 
 def plot_freqs(heb):
     # get terms left to learn
-    to_learn = collections.Counter()
-    for i in heb.set_data['term_queues']['0']:
-        term_lexs = heb.set_data['terms_dict'][i]['source_lexemes']
-        for term in term_lexs:
-            freq = heb.F.freq_lex.v(term)
-            to_learn[freq] += 1           
+    to_learn = remaining_freqs(heb)
     to_learn = pd.DataFrame.from_dict(to_learn, orient='index').sort_values(by=0)
 
     # make the plot
@@ -0,0 +1,150 @@
+'''
+This module times the stages of a study session, card by card.
+
+Run a session with study.learn(profile=True). Every visit to a card
+is split into stages:
+    wait     waiting on a card that was not prepared in time
+    render   re-rendering a card whose highlight changed
+    display  clear_output and display of the card
+    think    waiting on the user's input
+    handle   handling the input
+    save     journal writes and checkpoints
+Cards are prepared in a worker thread; the time spent there
+on the example lookup and on TF.plain is kept as prep_lookup
+and prep_render, with the lexeme of the example.
+
+Think time is kept apart from system time (all other stages).
+The summary is stored in the session's stats entry when the
+session is finalized; export writes every visit to a csv file
+to find slow cards and lexemes.
+'''
+
+import csv
+import math
+import time
+
+STAGES = ('wait', 'render', 'display', 'think', 'handle', 'save')
+PREP_STAGES = ('prep_lookup', 'prep_render')
+# stages between a keystroke and the next card on screen
+LATENCY_STAGES = ('wait', 'render', 'display')
+
+def percentile(values, q):
+    '''Nearest-rank percentile of a list of numbers'''
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[rank]
+
+class NullProfiler:
+    '''Stands in for a Profiler when a session is not profiled'''
+
+    enabled = False
+
+    def card(self, term_ID, pos):
+        pass
+
+    def prepared(self, card):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def end(self):
+        pass
+
+class Profiler:
+    '''
+    Records per-card stage timings with a lap clock:
+    each lap call adds the time since the last one to a stage
+    of the current card visit.
+    '''
+
+    enabled = True
+
+    def __init__(self):
+        self.visits = []
+        self.current = None
+        self.clock = time.perf_counter()
+
+    def card(self, term_ID, pos):
+        '''Start a visit to a card; the previous one is ended.'''
+        self.end()
+        self.current = {'term': term_ID, 'pos': pos}
+        self.visits.append(self.current)
+
+    def prepared(self, card):
+        '''Keep the preparation times of the card of this visit.'''
+        secs = card.get('secs', {})
+        self.current['lex'] = card.get('ex_lex')
+        self.current['prep_lookup'] = secs.get('lookup', 0)
+        self.current['prep_render'] = secs.get('render', 0)
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        if self.current is not None:
+            self.current[stage] = self.current.get(stage, 0) + now - self.clock
+        self.clock = now
+
+    def end(self):
+        '''End the current visit; any time since the last lap is handling.'''
+        self.lap('handle')
+        self.current = None
+
+    def column(self, stage):
+        return [visit.get(stage, 0) for visit in self.visits]
+
+    def latencies(self):
+        return [sum(visit.get(stage, 0) for stage in LATENCY_STAGES) for visit in self.visits]
+
+    def summary(self, nslow=5):
+        '''
+        Summarize the timings: think and system time in total and
+        per term, p50/p95/max of every stage and of the latency
+        until a card is shown, and the slowest cards.
+        '''
+        think = sum(self.column('think'))
+        system = sum(sum(self.column(stage)) for stage in STAGES if stage != 'think')
+        nterms = len({visit['term'] for visit in self.visits}) or 1
+        stages = {}
+        for stage in STAGES + PREP_STAGES + ('latency',):
+            values = self.latencies() if stage == 'latency' else self.column(stage)
+            stages[stage] = {
+                'p50': round(percentile(values, 50), 4),
+                'p95': round(percentile(values, 95), 4),
+                'max': round(max(values, default=0), 4),
+            }
+        slowest = sorted(zip(self.latencies(), self.visits), key=lambda lv: lv[0], reverse=True)
+        return {
+            'visits': len(self.visits),
+            'think_secs': round(think, 2),
+            'system_secs': round(system, 2),
+            'think_secs_per_term': round(think / nterms, 2),
+            'system_secs_per_term': round(system / nterms, 4),
+            'stages': stages,
+            'slowest': [
+                {'term': visit['term'], 'lex': visit.get('lex'), 'latency': round(latency, 4)}
+                    for latency, visit in slowest[:nslow]
+            ],
+        }
+
+    def report(self):
+        '''Print the p50/p95/max of every stage in milliseconds.'''
+        summary = self.summary()
+        print(f'{summary["visits"]} card visits; think {summary["think_secs"]}s, '
+              f'system {summary["system_secs"]}s')
+        print(f'{"stage":<12}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+        for stage, stats in summary['stages'].items():
+            print(f'{stage:<12}{stats["p50"]*1000:>10.1f}{stats["p95"]*1000:>10.1f}{stats["max"]*1000:>10.1f}')
+
+    def export(self, file):
+        '''Write the timings of every card visit to a csv file.'''
+        fields = ['pos', 'term', 'lex', 'latency'] + list(STAGES + PREP_STAGES)
+        with open(file, 'w', newline='', encoding='utf8') as outfile:
+            writer = csv.DictWriter(outfile, fields)
+            writer.writeheader()
+            for visit, latency in zip(self.visits, self.latencies()):
+                row = {stage: round(visit.get(stage, 0), 6) for stage in STAGES + PREP_STAGES}
+                row.update(pos=visit['pos'], term=visit['term'], lex=visit.get('lex'),
+                           latency=round(latency, 6))
+                writer.writerow(row)
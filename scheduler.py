@@ -0,0 +1,405 @@
+'''
+This module computes the per-score quotas of a study session
+and simulates deck sizes over many cycles.
+
+Quotas follow the Mahir review strategy:
+    • score 0 (new terms) fills the user's new_quota
+    • unconfigured scores below the configured ones are seen every
+      2**score sessions (score 1 every other session, score 2 every 4)
+    • configured scores are seen every nreset cycles,
+      spread evenly over the sessions of a cycle
+    • unconfigured scores above the configured ones are not shown
+
+A session gets its deck from the scheduler of its set, named by
+the scheduler key of cycle_data:
+    queues  (default) the review strategy above; QueueScheduler
+            takes the quotas from the front of the score queues
+    due     DueScheduler keeps a due date and ease per term, after
+            SM-2, and builds decks from a heap of the due dates.
+            Sets are moved to it automatically.
+'''
+
+import math
+import copy
+import time
+import heapq
+import collections
+from datetime import datetime, timedelta
+from terms import TermTable
+
+DAY = 86400
+NEW_EASE = 2.5
+MIN_EASE = 1.3
+
+def score_quotas(s_counts, cycle_data, scoreconfig):
+    '''
+    Calculate the deck quota of every score.
+
+    s_counts maps scores to the number of terms in their queues.
+    Returns an ordered dict from the highest score down to score 0.
+    '''
+    new_min = cycle_data['new_quota']
+    cycle_len = cycle_data['cycle_length']
+    nsession = cycle_data['total_sessions']
+    # sum of scores at start of the cycle
+    s_starts = cycle_data['score_starts']
+    lowest_config = min((int(score) for score in scoreconfig), default=math.inf)
+
+    scores = sorted(set(s_counts) | {'0'}, key=int, reverse=True)
+    quotas = collections.OrderedDict()
+    for score in scores:
+        nscore = int(score)
+
+        if not s_counts.get(score, 0) and score != '0':
+            quotas[score] = 0
+
+        # configured scores are seen every nreset cycles;
+        # NB math.ceil rounds up^
+        # super-cycle formula optimizes with decimal issues in Python
+        # formula is: int(round(((nterms/nsessions/nreset)*(NthSession-1))-int((nterms/nsessions/nreset)*(NthSession-1)) + (nterms/nsessions/nreset), 2))
+        elif score in scoreconfig:
+            nreset = scoreconfig[score]['nreset']
+            if nreset == 1:
+                quotas[score] = math.ceil(s_starts.get(score, 0) / cycle_len)
+            else:
+                per_session = s_starts.get(score, 0) / cycle_len / nreset
+                quotas[score] = int(round(per_session*(nsession-1) - int(per_session*(nsession-1))
+                                          + per_session, 2))
+
+        # s0 set by user
+        elif nscore == 0:
+            quotas[score] = new_min
+
+        # lower scores are seen every 2**score sessions
+        elif nscore < lowest_config:
+            quotas[score] = math.ceil(s_counts[score] / 2**nscore)
+
+        else:
+            quotas[score] = 0
+
+    return quotas
+
+def end_cycle(cycle_data, scoreconfig, s_counts):
+    '''
+    Start a new cycle in cycle_data, as check_end_cycle does
+    when the cycle parameters are kept the same.
+    '''
+    cycle_data['total_sessions'] = 0
+    cycle_data['ncycle'] += 1
+    for score, configdata in scoreconfig.items():
+        if cycle_data['ncycle'] % configdata['nreset'] == 0:
+            cycle_data['score_starts'][score] = s_counts.get(score, 0)
+
+def simulate(set_data, ncycles=1, moves=None, new_quota=None, cycle_length=None):
+    '''
+    Project deck sizes and queue coverage of a set
+    over ncycles cycles without running any sessions.
+
+    Only queue sizes are tracked, so a simulation of
+    hundreds of cycles takes milliseconds.
+
+    moves optionally maps 'old->new' score changes to the share
+    of a score's deck terms that change score each session,
+    e.g. {'0->1': 0.8, '1->3': 0.5, '3->1': 0.05}.
+    new_quota and cycle_length override the set's values,
+    to try out other parameters.
+
+    Returns a list with a dict per session; the last session
+    of each cycle also gets the share of each queue seen in that cycle.
+    '''
+    cycle_data = copy.deepcopy(set_data['cycle_data'])
+    if new_quota is not None:
+        cycle_data['new_quota'] = new_quota
+    if cycle_length is not None:
+        cycle_data['cycle_length'] = cycle_length
+    scoreconfig = set_data['scoreconfig']
+    s_counts = {score:len(queue) for score, queue in set_data['term_queues'].items()}
+    moves = {tuple(move.split('->')):share for move, share in (moves or {}).items()}
+
+    sessions = []
+    seen = collections.Counter()
+    ncycle = 0
+    while ncycle < ncycles:
+
+        # new cycle, same as check_end_cycle
+        if cycle_data['cycle_length'] / (cycle_data['total_sessions'] or math.inf) == 1:
+            if sessions:
+                sessions[-1]['coverage'] = {score: min(1, seen[score] / count) if count else 1
+                                                for score, count in s_counts.items()}
+                ncycle += 1
+            seen.clear()
+            end_cycle(cycle_data, scoreconfig, s_counts)
+            if ncycle == ncycles:
+                break
+
+        # build the deck: quotas limited by queue sizes
+        quotas = score_quotas(s_counts, cycle_data, scoreconfig)
+        deck = {score: min(quota, s_counts.get(score, 0)) for score, quota in quotas.items()}
+        deck = {score:n for score, n in deck.items() if n}
+        seen.update({score:n for score, n in deck.items() if score != '0'})
+
+        # rescore deck terms
+        for (old, new), share in moves.items():
+            nmoved = round(deck.get(old, 0) * share)
+            nmoved = min(nmoved, s_counts.get(old, 0))
+            s_counts[old] = s_counts.get(old, 0) - nmoved
+            s_counts[new] = s_counts.get(new, 0) + nmoved
+
+        sessions.append({
+            'cycle': cycle_data['ncycle'],
+            'session': cycle_data['total_sessions'] + 1,
+            'deck': deck,
+            'total': sum(deck.values()),
+            'score_counts': dict(s_counts),
+        })
+        cycle_data['total_sessions'] += 1
+
+    return sessions
+
+def day_start(now):
+    '''Give the timestamp of the start of the local day of now'''
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+def day_end(now):
+    '''Give the timestamp of the end of the local day of now'''
+    return (datetime.fromtimestamp(day_start(now)) + timedelta(days=1)).timestamp()
+
+def review_quality(old, new):
+    '''
+    Grade a review with an SM-2 quality of 0-5 from the
+    score change the user made: a higher score is 5,
+    the same score 4, and a lower score 2 down to 0.
+    '''
+    if new > old:
+        return 5
+    elif new == old:
+        return 4
+    return max(0, 3 - (old - new))
+
+def sm2(schedule, quality, now):
+    '''
+    Give the next schedule of a term, [due, ease, interval, reps],
+    after a review of the given quality at time now.
+    '''
+    due, ease, interval, reps = schedule
+    if quality < 3:
+        reps, interval = 0, 1
+    else:
+        interval = 1 if reps == 0 else 6 if reps == 1 else round(interval * ease)
+        reps += 1
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return [day_start(now) + interval * DAY, round(ease, 3), interval, reps]
+
+def score_interval(score, cycle_data, scoreconfig):
+    '''
+    Give the days between reviews of a score under the queue
+    scheduler, taking one session a day: nreset cycles for
+    configured scores, 2**score below them, and twice as long
+    for every score above the highest configured one.
+    '''
+    nscore = int(score)
+    cycle_len = cycle_data['cycle_length']
+    configured = sorted(int(s) for s in scoreconfig)
+    if score in scoreconfig:
+        return cycle_len * scoreconfig[score]['nreset']
+    elif not configured or nscore < configured[0]:
+        return 2**nscore
+    top = configured[-1]
+    return cycle_len * scoreconfig[str(top)]['nreset'] * 2**max(1, nscore - top)
+
+def schedule_items(terms_dict):
+    '''Iterate over the IDs and schedules of the terms that have one'''
+    if isinstance(terms_dict, TermTable):
+        return terms_dict.stat_items('schedule')
+    return ((tid, tdata['stats']['schedule']) for tid, tdata in terms_dict.items()
+                if 'schedule' in tdata['stats'])
+
+class QueueScheduler:
+    '''
+    The Mahir review strategy: the quota of every score
+    (see score_quotas) is taken from the front of its queue,
+    and the queue is rotated so those terms go to the back.
+    New terms are taken from the front of the score 0 queue,
+    which is not rotated.
+    '''
+
+    name = 'queues'
+    cycles = True # decks depend on the cycle
+
+    def __init__(self, set_data):
+        self.set_data = set_data
+
+    def migrate(self, term_queues, now=None):
+        '''Nothing to migrate; returns 0'''
+        return 0
+
+    def build_deck(self, term_queues, now=None):
+        '''
+        Give a deck and its counts per score, and
+        advance the queues of term_queues.
+        '''
+        # sum of all scores by this session
+        s_counts = dict((score, len(terms))
+                        for score, terms in term_queues.items())
+
+        # calculate daily set quotas from the score config
+        score2quota = score_quotas(s_counts, self.set_data['cycle_data'], self.set_data['scoreconfig'])
+
+        # construct a study deck and keep stats
+        deck = []
+        deck_stats = collections.Counter()
+
+        # add quotas from scores and advance known queues
+        for score, quota in score2quota.items():
+            if not quota or score not in term_queues:
+                continue
+
+            # move known terms to back of their queues in one rotation
+            if score != '0':
+                terms = term_queues[score].rotate(quota)
+
+            # score 0 selected differently; their queue is not advanced
+            else:
+                terms = term_queues[score].head(quota)
+
+            deck.extend(terms)
+
+            # log count for statistics tracking
+            if terms:
+                deck_stats[score] += len(terms)
+
+        return deck, deck_stats
+
+    def replay_deck(self, term_queues, deck, deck_stats):
+        '''Advance the queues just as when the deck was built'''
+        for score, count in deck_stats.items():
+            if score != '0':
+                term_queues[score].rotate(count)
+
+    def review(self, term_queues, deck, now=None):
+        '''Nothing to do; Study.update_queues moves rescored terms'''
+
+class DueScheduler:
+    '''
+    Spaced repetition with a due date per term, after SM-2.
+
+    The schedule of a term is kept in its stats as
+    'schedule': [due timestamp, ease, interval in days, repetitions],
+    so it moves with the term when a set is edited or merged.
+    A deck holds the known terms due by the end of the day, in order
+    of their due dates, and new_quota new terms from the front of the
+    score 0 queue. The due dates are put in a heap, in linear time, and
+    the k due terms are popped from it in O(k log n).
+
+    Scores and queues are kept up to date as before, and the score
+    changes of a session grade its reviews (see review_quality).
+    Terms that drop to score 0 lose their schedule and are new again.
+    There are no cycles, so a cycle never ends.
+    '''
+
+    name = 'due'
+    cycles = False
+
+    def __init__(self, set_data):
+        self.set_data = set_data
+
+    def migrate(self, term_queues, now=None):
+        '''
+        Give a schedule to the known terms that have none, e.g. those of
+        a set that used the queue scheduler. A term is due on the day
+        that the current quota of its score reaches its queue position,
+        taking one session a day; scores without a quota are spread over
+        their interval, which is that of the score (see score_interval).
+        Returns the number of terms migrated.
+        '''
+        now = time.time() if now is None else now
+        terms_dict = self.set_data['terms_dict']
+        cycle_data = self.set_data['cycle_data']
+        scoreconfig = self.set_data['scoreconfig']
+        scheduled = {tid for tid, schedule in schedule_items(terms_dict)}
+        s_counts = dict((score, len(terms)) for score, terms in term_queues.items())
+        quotas = score_quotas(s_counts, cycle_data, scoreconfig)
+        start = day_start(now)
+        nmigrated = 0
+        for score, queue in term_queues.items():
+            if score == '0':
+                continue
+            interval = score_interval(score, cycle_data, scoreconfig)
+            quota = quotas.get(score)
+            for position, tid in enumerate(queue):
+                if tid in scheduled:
+                    continue
+                days = position // quota if quota else position * interval // len(queue)
+                terms_dict[tid]['stats']['schedule'] = [start + days * DAY, NEW_EASE, interval, 2]
+                nmigrated += 1
+        return nmigrated
+
+    def build_deck(self, term_queues, now=None):
+        '''Give a deck of the due and new terms and its counts per score'''
+        now = time.time() if now is None else now
+        terms_dict = self.set_data['terms_dict']
+        heap = [(schedule[0], tid) for tid, schedule in schedule_items(terms_dict)]
+        # known terms without a schedule are migrated first
+        if len(heap) < sum(len(queue) for score, queue in term_queues.items() if score != '0'):
+            self.migrate(term_queues, now)
+            heap = [(schedule[0], tid) for tid, schedule in schedule_items(terms_dict)]
+        heapq.heapify(heap)
+
+        deck = []
+        deck_stats = collections.Counter()
+        end = day_end(now)
+        while heap and heap[0][0] < end:
+            due, tid = heapq.heappop(heap)
+            score = terms_dict[tid]['score']
+            if score != '0': # new terms come from their queue
+                deck.append(tid)
+                deck_stats[score] += 1
+
+        if '0' in term_queues:
+            new = term_queues['0'].head(self.set_data['cycle_data']['new_quota'])
+            deck.extend(new)
+            if new:
+                deck_stats['0'] += len(new)
+        return deck, deck_stats
+
+    def replay_deck(self, term_queues, deck, deck_stats):
+        '''Nothing to replay; the queues are not advanced'''
+
+    def review(self, term_queues, deck, now=None):
+        '''
+        Reschedule the terms of a finished deck from their score
+        changes. Must run before the queues are updated, since the
+        old score of a term is that of its queue.
+        '''
+        now = time.time() if now is None else now
+        terms_dict = self.set_data['terms_dict']
+        for tid in deck:
+            score = terms_dict[tid]['score']
+            stats = terms_dict[tid]['stats']
+            if score == '0':
+                if 'schedule' in stats:
+                    del stats['schedule']
+                continue
+            if tid in term_queues.get(score, ()):
+                old = score
+            else:
+                old = next((s for s, queue in term_queues.items() if tid in queue), score)
+            schedule = stats.get('schedule')
+            if schedule is None:
+                # new terms get their first schedule, but build_deck schedules every known term
+                if old != '0':
+                    print(f'CAUTION: term {tid} of score {old} had no schedule; it is scheduled as a new term')
+                schedule = [now, NEW_EASE, 0, 0]
+            stats['schedule'] = sm2(schedule, review_quality(int(old), int(score)), now)
+
+SCHEDULERS = {
+    'queues': QueueScheduler,
+    'due': DueScheduler,
+}
+
+def get_scheduler(set_data):
+    '''Give the scheduler of a set, named by the scheduler key of its cycle_data'''
+    name = set_data['cycle_data'].get('scheduler', 'queues')
+    if name not in SCHEDULERS:
+        raise Exception(f'unknown scheduler {name!r}; choose from {", ".join(SCHEDULERS)}')
+    return SCHEDULERS[name](set_data)
@@ -0,0 +1,420 @@
+'''
+This module serves the study sessions of many users over HTTP.
+
+The server is one process that holds the corpus: the Studies of
+all users share its Text-Fabric app (see shared_app in iMahir), or
+its snapshot, so a class of students is served without a copy of
+the corpus per student. Every user studies their own vocab set.
+A session is journaled and saved with the set's storage backend
+just as with Study.learn, so a session saved on the server can be
+continued in a notebook and the other way around.
+
+The API is JSON over HTTP:
+    GET  /users                   the users and their sets
+    GET  /users/<user>            the user's session, deck and position;
+                                  before a session opens, the size and
+                                  scores of its deck, whose terms are
+                                  only drawn when it opens
+    GET  /users/<user>/card       the card at the user's position
+    POST /users/<user>/<action>   an action, with the JSON body:
+        score    {"score": "3"}      score the term and go to the next;
+                                     a new score needs "confirm": true
+        move     {"to": "back"}      to the back, next, start or end
+        context  {}                  show another example of the term
+        gloss    {"gloss": "..."}    edit the gloss of the term
+        lexemes  {"lexemes": [..]}   edit the lexemes of the term
+        undo     {}                  undo the last edit and go to its term
+        redo     {}                  redo the last undone edit and go to its term
+        pause    {}                  pause the session time and save
+        save     {}                  save the session for later
+        finish   {}                  finalize a session at the end of its deck
+        quit     {}                  drop the session since the last save
+Actions give the card at the new position, except for save, finish
+and quit, which end the session on the server and give a summary.
+Errors give {"error": message}.
+
+StudyClient is a stub client of the API for one user, to try the
+server out locally; tools/serve.py starts a server.
+'''
+
+import json
+import time
+import threading
+import collections
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import journal
+from storage import load_set, save_set
+from tfindex import set_lexemes
+from cards import Prefetcher
+from batch import plan_set
+from iMahir import Study, saved_study, start_cycle, cycle_complete, HIGHLIGHTS, DEFAULT_HIGHLIGHT
+
+class Learner:
+    '''
+    The open study session of one user on the server.
+    Its actions are those of Study.study_loop, and are
+    journaled in the same way.
+    '''
+
+    def __init__(self, study):
+        self.study = study
+        # index any lexemes not yet seen; loads TF if needed
+        study.extend_index(set_lexemes(study.set_data['terms_dict']))
+        study.open_session()
+        self.deck = study.session_data.deck
+        self.term_n = study.term_n
+        self.start_time = time.monotonic()
+        self.cards = Prefetcher(lambda pos: study.prepare_card(self.deck[pos]), len(self.deck))
+
+    def record(self, op, **data):
+        self.study.journal.record(op, **data)
+
+    def status(self):
+        session_data = self.study.session_data
+        return {
+            'status': 'complete' if self.term_n >= len(self.deck) else 'in progress',
+            'session': self.study.set_data['cycle_data']['total_sessions'] + 1,
+            'cycle': self.study.set_data['cycle_data']['ncycle'],
+            'deck_stats': dict(session_data.deck_stats),
+            'term_n': self.term_n,
+            'ndeck': len(self.deck),
+        }
+
+    def card(self):
+        '''Give the card payload of the current position'''
+        payload = {'term_n': self.term_n, 'ndeck': len(self.deck),
+                   'complete': self.term_n >= len(self.deck)}
+        if payload['complete']:
+            return payload
+        term_ID = self.deck[self.term_n]
+        tdata = self.study.set_data['terms_dict'][term_ID]
+        highlight = HIGHLIGHTS.get(tdata['score'], DEFAULT_HIGHLIGHT)
+        card = self.study.render_card(self.cards.get(self.term_n), highlight)
+        self.cards.prefetch(self.term_n)
+        payload.update({
+            'term_ID': term_ID,
+            'passage': card['passage'],
+            'html': card['html'],
+            'parse_string': card['parse_string'],
+            'std_glosses': card['std_glosses'],
+            'term': tdata['term'],
+            'gloss': tdata['gloss'],
+            'score': tdata['score'],
+            'missed': tdata['stats']['missed'],
+        })
+        return payload
+
+    def pause(self):
+        '''Pause the session time'''
+        duration = timedelta(seconds=time.monotonic() - self.start_time)
+        self.study.pause_times.append(duration)
+        self.record('pause', secs=duration.total_seconds())
+        self.start_time = None
+
+    def close(self):
+        self.cards.close()
+        self.study.close_cache()
+
+    def act(self, action, data):
+        '''
+        Do an action of the API with its JSON data.
+        Returns the payload and whether the session has ended.
+        '''
+        study = self.study
+        terms_dict = study.set_data['terms_dict']
+        deck = self.deck
+
+        # the time runs again from the first action after a pause
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+        if action in {'score', 'context', 'gloss', 'lexemes'}:
+            if self.term_n >= len(deck):
+                raise Exception(f'{action} needs a term, but the session is at the end of the deck')
+            term_ID = deck[self.term_n]
+
+        if action == 'score':
+            score = str(data.get('score', ''))
+            if not score.isdecimal():
+                raise Exception(f'score {score!r} is not a number')
+            score = str(int(score)) # e.g. '03' is score '3'
+            # a new score level is only made on request, as in learn
+            set_data = study.set_data
+            if score not in set_data['term_queues'] and score not in set_data['scoreconfig']:
+                if data.get('confirm') is not True:
+                    raise Exception(f'score {score} is new; send "confirm": true to add it')
+            study.edits.edit(terms_dict, 'score', term_ID, score, self.term_n)
+            self.record('score', term=term_ID, score=score)
+            self.term_n += 1
+            self.record('cursor', term_n=self.term_n)
+
+        elif action == 'move':
+            positions = {
+                'back': max(0, self.term_n - 1),
+                'next': min(len(deck), self.term_n + 1),
+                'start': 0,
+                'end': len(deck),
+            }
+            if data.get('to') not in positions:
+                raise Exception(f'move to one of {", ".join(positions)}')
+            self.term_n = positions[data['to']]
+            self.record('cursor', term_n=self.term_n)
+
+        elif action == 'context':
+            self.cards.invalidate(self.term_n)
+
+        elif action == 'gloss':
+            gloss = str(data.get('gloss', ''))
+            study.edits.edit(terms_dict, 'gloss', term_ID, gloss, self.term_n)
+            self.record('gloss', term=term_ID, gloss=gloss)
+
+        elif action == 'lexemes':
+            lexemes = [int(lex) for lex in data.get('lexemes', [])]
+            if not lexemes:
+                raise Exception('give the lexemes of the term')
+            study.edits.edit(terms_dict, 'lexemes', term_ID, lexemes, self.term_n)
+            self.record('lexemes', term=term_ID, lexemes=lexemes)
+            self.cards.invalidate(self.term_n)
+
+        elif action in {'undo', 'redo'}:
+            edit = getattr(study.edits, action)(terms_dict)
+            if edit is None:
+                raise Exception(f'nothing to {action}')
+            self.record(action)
+            # go to the term of the edit
+            edit_op, edit_term, old, new, self.term_n = edit
+            self.record('cursor', term_n=self.term_n)
+            if edit_op == 'lexemes':
+                self.cards.invalidate(self.term_n)
+
+        elif action == 'pause':
+            self.pause()
+            study.save_session(self.term_n)
+
+        elif action == 'save':
+            self.close()
+            self.pause()
+            study.save_session(self.term_n)
+            study.suspend(self.term_n)
+            return {'saved': True, 'elapsed': str(sum(study.pause_times, timedelta()))}, True
+
+        elif action == 'finish':
+            if self.term_n < len(deck):
+                raise Exception('the session is not at the end of its deck')
+            times = [timedelta(seconds=time.monotonic() - self.start_time)] + study.pause_times
+            self.close()
+            study.finalize_session(times)
+            session_stats = study.set_data['stats'][-1]
+            return {
+                'changes': dict(session_stats['changes']),
+                'duration': session_stats['duration'],
+                'secs_per_term': session_stats['secs_per_term'],
+            }, True
+
+        elif action == 'quit':
+            self.close()
+            study.journal.rollback() # keep only what was saved before
+            return {'quit': True}, True
+
+        else:
+            raise Exception(f'unknown action {action}')
+
+        return self.card(), False
+
+class StudyServer:
+    '''
+    Serves the study sessions of users, given as a dict
+    from user names to their vocab set files.
+    With snapshot=True, the corpus is read from its snapshot
+    (see snapshot.py). With new_cycles=True, a set at the end
+    of its cycle starts a new one with the same parameters,
+    as Batch does; otherwise its user gets an error.
+    '''
+
+    def __init__(self, users, host='127.0.0.1', port=8000, snapshot=None, new_cycles=False):
+        self.users = {user: Path(file) for user, file in users.items()}
+        # journals are named after their sets
+        stems = collections.Counter(file.stem for file in self.users.values())
+        same = [stem for stem, count in stems.items() if count > 1]
+        if same:
+            raise Exception(f'the sets of different users must have different names: {", ".join(same)}')
+        self.snapshot = snapshot
+        self.new_cycles = new_cycles
+        self.learners = {}
+        self.locks = {user: threading.Lock() for user in self.users}
+        self.httpd = ThreadingHTTPServer((host, port), StudyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.study_server = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.close()
+
+    def start(self):
+        '''Serve from a background thread, e.g. in a notebook or test; returns self'''
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        '''
+        Stop serving. Open sessions keep their journals,
+        so they are resumed when their users come back.
+        '''
+        if self.thread is not None:
+            self.httpd.shutdown()
+            self.thread = None
+        self.httpd.server_close()
+        for learner in self.learners.values():
+            learner.close()
+            learner.study.journal.close()
+        self.learners.clear()
+
+    def open_study(self, user):
+        '''Load the Study of a user, as loadStudy does, but without prompts'''
+        file = self.users[user]
+        journal_file = journal.journal_path(file)
+        if journal_file.exists():
+            return (saved_study(file, snapshot=self.snapshot)
+                    or Study(file, journal_file=journal_file, snapshot=self.snapshot))
+        set_data = load_set(file)
+        if cycle_complete(set_data):
+            if not self.new_cycles:
+                raise Exception(f'the cycle of {file} is complete; start a new one to go on')
+            start_cycle(set_data)
+            save_set(set_data, file)
+        return Study(file, set_data=set_data, snapshot=self.snapshot)
+
+    def learner(self, user):
+        '''Give the open session of a user, opening it if needed; call with the user's lock'''
+        if user not in self.learners:
+            self.learners[user] = Learner(self.open_study(user))
+        return self.learners[user]
+
+    def list_users(self):
+        return {user: str(file) for user, file in self.users.items()}
+
+    def status(self, user):
+        with self.locks[user]:
+            if user in self.learners:
+                return dict(self.learners[user].status(), open=True)
+            # a status poll writes nothing; the deck's terms are drawn on opening
+            plan = plan_set(self.users[user], commit=False)
+        return {
+            'status': plan['status'],
+            'session': plan['session'],
+            'cycle': plan['cycle'],
+            'deck_stats': plan['deck_stats'],
+            'term_n': plan['term_n'],
+            'ndeck': len(plan['deck']),
+            'open': False,
+        }
+
+    def card(self, user):
+        with self.locks[user]:
+            return self.learner(user).card()
+
+    def act(self, user, action, data):
+        with self.locks[user]:
+            payload, ended = self.learner(user).act(action, data)
+            if ended:
+                del self.learners[user]
+            return payload
+
+class StudyHandler(BaseHTTPRequestHandler):
+    '''Routes the requests of the API to the StudyServer'''
+
+    server_version = 'Mahir'
+
+    def do_GET(self):
+        self.respond(*self.route('GET'))
+
+    def do_POST(self):
+        self.respond(*self.route('POST'))
+
+    def route(self, method):
+        '''Give the status code and JSON payload of a request'''
+        study_server = self.server.study_server
+        parts = [urllib.parse.unquote(part) for part in urllib.parse.urlparse(self.path).path.split('/') if part]
+        if parts == ['users'] and method == 'GET':
+            return 200, study_server.list_users()
+        if len(parts) not in (2, 3) or parts[0] != 'users':
+            return 404, {'error': f'no such path {self.path}'}
+        user = parts[1]
+        if user not in study_server.users:
+            return 404, {'error': f'unknown user {user}'}
+        try:
+            if len(parts) == 2 and method == 'GET':
+                return 200, study_server.status(user)
+            elif parts[2:] == ['card'] and method == 'GET':
+                return 200, study_server.card(user)
+            elif len(parts) == 3 and method == 'POST':
+                return 200, study_server.act(user, parts[2], self.read_json())
+        except Exception as error:
+            return 400, {'error': str(error)}
+        return 404, {'error': f'no such path {method} {self.path}'}
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(data, dict):
+            raise Exception('the request body must be a JSON object')
+        return data
+
+    def respond(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # requests are not logged
+
+class StudyClient:
+    '''
+    A stub client of a StudyServer for one user.
+    Errors of the server are raised as exceptions.
+    '''
+
+    def __init__(self, url, user):
+        self.url = url.rstrip('/')
+        self.user = user
+
+    def request(self, path, data=None):
+        body = None if data is None else json.dumps(data).encode('utf8')
+        request = urllib.request.Request(
+            self.url + path, data=body, method='GET' if data is None else 'POST',
+            headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise Exception(json.loads(error.read()).get('error', str(error))) from None
+
+    def users(self):
+        return self.request('/users')
+
+    def status(self):
+        return self.request(f'/users/{urllib.parse.quote(self.user)}')
+
+    def card(self):
+        return self.request(f'/users/{urllib.parse.quote(self.user)}/card')
+
+    def act(self, action, **data):
+        return self.request(f'/users/{urllib.parse.quote(self.user)}/{action}', data)
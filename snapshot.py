@@ -0,0 +1,314 @@
+'''
+This module exports and reads a compact, read-only snapshot
+of the parts of a Text-Fabric corpus that Mahir uses.
+
+A snapshot holds, for every word: its lexeme, context (e.g. verse)
+and book, the parse features (pdp, gn, nu, ps, vs, vt, st) and its
+text; for every lexeme: its words, gloss and frequency; and for every
+context: its words and section string. Everything is stored in flat
+arrays in one file, which is memory-mapped when read. Nothing is
+copied or parsed up front, so a snapshot opens in milliseconds, and
+all kernels on a machine that read the same snapshot share its pages.
+
+A snapshot is exported once from a loaded TF app
+(see tools/export_snapshot.py) and used with loadStudy(..., snapshot=True).
+The Snapshot class stands in for the TF app: it has the plain and
+sectionStrFromNode methods and an api with the F, L and Fs calls
+that Mahir makes; anything else raises an error.
+'''
+
+import sys
+import mmap
+import json
+import html
+import bisect
+import unicodedata
+from array import array
+from pathlib import Path
+from IPython.display import display, HTML
+from storage import atomic_open
+from tfindex import BOOK_TYPE
+
+SNAPSHOT_VERSION = 1
+MAGIC = b'MAHIRSNP'
+PARSE_FEATURES = ('pdp', 'gn', 'nu', 'ps', 'vs', 'vt', 'st')
+ALIGN = 8
+
+def snapshot_path(app, version):
+    '''Give the snapshot file name for a TF app and version'''
+    return Path(f'{app}-{version}.snapshot')
+
+def pack_strings(strings):
+    '''Pack strings into (offsets, utf8 blob) for a string column'''
+    offsets = array('I', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += (string or '').encode('utf8')
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+def export(app, appdata, lextype, file):
+    '''
+    Write a snapshot of a loaded TF app to file.
+    appdata gives the word and context types and the gloss
+    and frequency features, as in a vocab set's app_data;
+    lextype is the node type of the lexemes.
+    '''
+    api = app.api
+    F, L, T, Fs = api.F, api.L, api.T, api.Fs
+    wordtype, context = appdata['wordtype'], appdata['context']
+    if F.otype.slotType != wordtype:
+        raise Exception(f'the word type {wordtype} must be the slot type of {app.appName}')
+    nwords = F.otype.maxSlot
+    words = range(1, nwords+1)
+    columns = {}
+
+    # words
+    columns['word_lex'] = array('I', (next(iter(L.u(w, lextype)), 0) for w in words))
+    columns['word_context'] = array('I', (next(iter(L.u(w, context)), 0) for w in words))
+    columns['word_book'] = array('I', (next(iter(L.u(w, BOOK_TYPE)), 0) for w in words))
+    columns['word_text_offsets'], columns['word_text'] = pack_strings(T.text(w) for w in words)
+    features = {}
+    loaded = set(api.Fall())
+    for feat in PARSE_FEATURES:
+        if feat not in loaded:
+            continue
+        values = [None] # code 0 is no value
+        codes = {None: 0}
+        column = array('H')
+        for w in words:
+            value = Fs(feat).v(w)
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+            column.append(codes[value])
+        features[feat] = values
+        columns[f'feat_{feat}'] = column
+
+    # lexemes
+    lexemes = sorted(F.otype.s(lextype))
+    columns['lex_nodes'] = array('I', lexemes)
+    columns['lex_offsets'] = array('I', [0])
+    columns['lex_words'] = array('I')
+    for lex in lexemes:
+        columns['lex_words'].extend(L.d(lex, wordtype))
+        columns['lex_offsets'].append(len(columns['lex_words']))
+    columns['lex_gloss_offsets'], columns['lex_gloss'] = pack_strings(
+        Fs(appdata['gloss_feature']).v(lex) for lex in lexemes)
+    columns['lex_freq'] = array('I', (Fs(appdata['freq_feature']).v(lex) or 0 for lex in lexemes))
+
+    # contexts; their words are a run of slots
+    contexts = sorted(F.otype.s(context))
+    columns['context_nodes'] = array('I', contexts)
+    columns['context_first'] = array('I')
+    columns['context_last'] = array('I')
+    for ctx in contexts:
+        ctx_words = L.d(ctx, wordtype)
+        columns['context_first'].append(ctx_words[0])
+        columns['context_last'].append(ctx_words[-1])
+    columns['section_offsets'], columns['section'] = pack_strings(
+        app.sectionStrFromNode(ctx) for ctx in contexts)
+
+    sample = T.text(range(1, min(nwords, 20)+1))
+    rtl = any(unicodedata.bidirectional(char) in ('R', 'AL') for char in sample)
+    header = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'app': app.appName,
+        'version': appdata['version'],
+        'byteorder': sys.byteorder,
+        'wordtype': wordtype,
+        'context': context,
+        'lextype': lextype,
+        'gloss_feature': appdata['gloss_feature'],
+        'freq_feature': appdata['freq_feature'],
+        'nwords': nwords,
+        'direction': 'rtl' if rtl else 'ltr',
+        'features': features,
+        'columns': {},
+    }
+
+    # the data of the columns follows the header, aligned
+    offset = 0
+    for name, column in columns.items():
+        nbytes = len(column) * column.itemsize if isinstance(column, array) else len(column)
+        typecode = column.typecode if isinstance(column, array) else 'B'
+        header['columns'][name] = [typecode, offset, nbytes]
+        offset += -(-nbytes // ALIGN) * ALIGN
+    head = json.dumps(header, ensure_ascii=False).encode('utf8')
+    head += b' ' * (-len(head) % ALIGN)
+
+    with atomic_open(file, 'wb') as outfile:
+        outfile.write(MAGIC + len(head).to_bytes(8, 'little') + head)
+        for column in columns.values():
+            data = column.tobytes() if isinstance(column, array) else column
+            outfile.write(data + b'\0' * (-len(data) % ALIGN))
+
+class StringColumn:
+    '''Strings stored as utf8 bytes with offsets, decoded on access'''
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i+1]], 'utf8')
+
+class Feature:
+    '''A feature of a snapshot with the v method of TF features'''
+
+    def __init__(self, name, get):
+        self.name = name
+        self.get = get
+
+    def v(self, node):
+        return self.get(node)
+
+class Snapshot:
+    '''
+    A memory-mapped snapshot that stands in for a TF app.
+    '''
+
+    def __init__(self, file):
+        self.file = Path(file)
+        with open(self.file, 'rb') as infile:
+            self.mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise Exception(f'{file} is not a Mahir snapshot')
+        start = len(MAGIC) + 8
+        size = int.from_bytes(self.mm[len(MAGIC):start], 'little')
+        header = json.loads(bytes(self.mm[start:start+size]))
+        if header['snapshot_version'] != SNAPSHOT_VERSION or header['byteorder'] != sys.byteorder:
+            raise Exception(f'{file} was made by another snapshot version or on another platform; export it again')
+        self.header = header
+        self.appName = header['app']
+        self.version = header['version']
+        self.nwords = header['nwords']
+
+        data = memoryview(self.mm)[start+size:]
+        self.views = [data] # released on close, before the map
+        self.columns = {}
+        for name, (typecode, offset, nbytes) in header['columns'].items():
+            column = data[offset:offset+nbytes]
+            self.views.append(column)
+            if typecode != 'B':
+                column = column.cast(typecode)
+                self.views.append(column)
+            self.columns[name] = column
+        col = self.columns
+        self.word_text = StringColumn(col['word_text_offsets'], col['word_text'])
+        self.gloss = StringColumn(col['lex_gloss_offsets'], col['lex_gloss'])
+        self.section = StringColumn(col['section_offsets'], col['section'])
+
+        self.features = {}
+        for feat, values in header['features'].items():
+            codes = col[f'feat_{feat}']
+            self.features[feat] = Feature(feat, self.word_feature(codes, values))
+        self.features[header['gloss_feature']] = Feature(
+            header['gloss_feature'], lambda lex: self.gloss[self.lex_row(lex)])
+        self.features[header['freq_feature']] = Feature(
+            header['freq_feature'], lambda lex: col['lex_freq'][self.lex_row(lex)])
+        self.api = SnapshotAPI(self)
+
+    def word_feature(self, codes, values):
+        def get(word):
+            return values[codes[self.word_row(word)]]
+        return get
+
+    def word_row(self, word):
+        if not 1 <= word <= self.nwords:
+            raise Exception(f'node {word} is not a {self.header["wordtype"]}')
+        return word - 1
+
+    def row(self, name, node):
+        '''Give the row of a node in a sorted node column'''
+        nodes = self.columns[name]
+        i = bisect.bisect_left(nodes, node)
+        if i == len(nodes) or nodes[i] != node:
+            raise Exception(f'node {node} is not in the snapshot column {name}')
+        return i
+
+    def lex_row(self, lex):
+        return self.row('lex_nodes', lex)
+
+    def feature(self, name):
+        if name not in self.features:
+            raise Exception(f'feature {name} is not in the snapshot {self.file}')
+        return self.features[name]
+
+    def up(self, node, otype):
+        '''L.u for words, to their lexeme, context or book'''
+        row = self.word_row(node)
+        column = {
+            self.header['lextype']: 'word_lex',
+            self.header['context']: 'word_context',
+            BOOK_TYPE: 'word_book',
+        }.get(otype)
+        if column is None:
+            raise Exception(f'the snapshot has no {otype} nodes above words')
+        up = self.columns[column][row]
+        return (up,) if up else ()
+
+    def down(self, node, otype):
+        '''L.d for lexemes and contexts, to their words'''
+        if otype != self.header['wordtype']:
+            raise Exception(f'the snapshot has no {otype} nodes below other nodes')
+        if self.header['lextype'] == self.node_type(node):
+            row = self.lex_row(node)
+            offsets = self.columns['lex_offsets']
+            return tuple(self.columns['lex_words'][offsets[row]:offsets[row+1]])
+        row = self.row('context_nodes', node)
+        return tuple(range(self.columns['context_first'][row], self.columns['context_last'][row]+1))
+
+    def node_type(self, node):
+        '''Tell lexemes from contexts, the node types with words below'''
+        nodes = self.columns['lex_nodes']
+        i = bisect.bisect_left(nodes, node)
+        return self.header['lextype'] if i < len(nodes) and nodes[i] == node else self.header['context']
+
+    def sectionStrFromNode(self, node):
+        return self.section[self.row('context_nodes', node)]
+
+    def plain(self, node, highlights=None, _asString=False):
+        '''
+        Render the text of a context with highlighted words,
+        as TF's plain does; highlights maps words to colours.
+        '''
+        highlights = highlights or {}
+        parts = []
+        for word in self.down(node, self.header['wordtype']):
+            text = html.escape(self.word_text[self.word_row(word)])
+            if word in highlights:
+                text = f'<span style="background-color:{highlights[word]}">{text}</span>'
+            parts.append(text)
+        passage = f'<div dir="{self.header["direction"]}" style="font-size:20pt; line-height:1.6">{"".join(parts)}</div>'
+        if _asString:
+            return passage
+        display(HTML(passage))
+
+    def close(self):
+        '''Unmap the snapshot; it cannot be read after this.'''
+        for view in reversed(self.views):
+            view.release()
+        self.mm.close()
+
+class SnapshotAPI:
+    '''The F, L and Fs parts of the TF api that a Snapshot has'''
+
+    def __init__(self, snapshot):
+        self.F = SnapshotFeatures(snapshot)
+        self.L = SnapshotLocality(snapshot)
+        self.Fs = snapshot.feature
+
+class SnapshotFeatures:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == 'snapshot':
+            raise AttributeError(name)
+        return self.snapshot.feature(name)
+
+class SnapshotLocality:
+    def __init__(self, snapshot):
+        self.u = snapshot.up
+        self.d = snapshot.down
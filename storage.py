@@ -0,0 +1,598 @@
+'''
+This module contains the storage backends for Mahir vocab sets.
+
+A backend is picked by the file suffix:
+    .json   pretty or compact JSON, the original format
+    .mahir  a binary, columnar layout of terms_dict and term_queues
+    .sqlite a SQLite database with a row per term and queue entry
+
+All backends load to and save from the same set_data dict.
+File writes go to a temporary file that is renamed over
+the target, and SQLite writes are done in one transaction,
+so that a crash never leaves a half-written set.
+'''
+
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+from array import array
+from itertools import accumulate, chain
+from pathlib import Path
+from contextlib import contextmanager
+
+from terms import plain_terms
+
+@contextmanager
+def atomic_open(file, mode='w', **kwargs):
+    '''
+    Open a temporary file next to file for writing;
+    on success it is synced and renamed over file.
+    '''
+    file = Path(file)
+    fd, tmp = tempfile.mkstemp(dir=file.parent, prefix=f'.{file.name}.', suffix='.tmp')
+    try:
+        with open(fd, mode, **kwargs) as outfile:
+            yield outfile
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        # mkstemp makes private files; keep the usual permissions
+        if file.exists():
+            os.chmod(tmp, os.stat(file).st_mode)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def jsonable(obj):
+    '''
+    Give the JSON form of the containers of a loaded set:
+    TermTables as dicts and TermQueues as lists.
+    '''
+    if hasattr(obj, 'to_json'):
+        return obj.to_json()
+    return list(obj)
+
+class Store:
+    '''Base class for storage backends.'''
+
+    def update(self, set_data, term_ids, deleted=()):
+        '''
+        Save a set in which only the given terms have changed
+        or been deleted, together with the set's queues, cycle
+        data and stats.
+        Backends that cannot update in place save the whole set.
+        '''
+        self.save(set_data)
+
+class JSONStore(Store):
+    '''
+    Stores a set as JSON. Pretty JSON (indent=1) is the
+    original format; compact JSON is much faster to write.
+    '''
+
+    def __init__(self, file, pretty=True):
+        self.file = Path(file)
+        self.pretty = pretty
+
+    def load(self):
+        with open(self.file, encoding='utf8') as infile:
+            return json.load(infile)
+
+    def save(self, set_data):
+        indent = 1 if self.pretty else None
+        with atomic_open(self.file, 'w', encoding='utf8') as outfile:
+            json.dump(set_data, outfile, indent=indent, ensure_ascii=False, default=jsonable)
+
+class ColumnStore(Store):
+    '''
+    Stores a set in a binary, columnar layout.
+
+    Terms are kept as parallel columns in terms_dict order;
+    lexemes as one flat array with offsets; queues as arrays
+    of term rows. The key order of every term and stats dict
+    is kept as a layout id, so a round trip gives back
+    exactly the same JSON.
+
+    The file is laid out like a snapshot (see snapshot.py):
+    a JSON header with the small set data, then the bytes of
+    the columns, aligned. The string columns (IDs, terms,
+    scores, glosses and learned dates) are stored as utf8
+    separated by NUL bytes, so a column is decoded and split
+    with two calls; a column with a NUL in a string, or with
+    values other than strings and None, stays in the header.
+    Nothing is unpickled, so loading a file never runs code from it.
+    '''
+
+    FORMAT = 'mahir-columns'
+    VERSION = 3
+    MAGIC = b'MAHIRSET'
+    ALIGN = 8
+
+    def __init__(self, file):
+        self.file = Path(file)
+
+    def save(self, set_data):
+        header, columns = self.encode(set_data)
+        # the data of the columns follows the header
+        offset = 0
+        for name, column in columns.items():
+            if isinstance(column, bytes):
+                typecode, nbytes = 'B', len(column)
+            else:
+                typecode, nbytes = column.typecode, len(column) * column.itemsize
+            header['columns'][name] = [typecode, offset, nbytes]
+            offset += -(-nbytes // self.ALIGN) * self.ALIGN
+        head = json.dumps(header, ensure_ascii=False, default=jsonable).encode('utf8')
+        head += b' ' * (-len(head) % self.ALIGN)
+        with atomic_open(self.file, 'wb') as outfile:
+            outfile.write(self.MAGIC + len(head).to_bytes(8, 'little') + head)
+            for column in columns.values():
+                data = column if isinstance(column, bytes) else column.tobytes()
+                outfile.write(data + b'\0' * (-len(data) % self.ALIGN))
+
+    def load(self):
+        with open(self.file, 'rb') as infile:
+            data = infile.read()
+        start = len(self.MAGIC) + 8
+        header = None
+        if data[:len(self.MAGIC)] == self.MAGIC:
+            size = int.from_bytes(data[len(self.MAGIC):start], 'little')
+            header = json.loads(data[start:start+size])
+        if header is None or header.get('format') != self.FORMAT or header.get('version') != self.VERSION:
+            raise Exception(f'{self.file} is not a version {self.VERSION} {self.FORMAT} file')
+        body = memoryview(data)[start+size:]
+        columns = {}
+        for name, (typecode, offset, nbytes) in header['columns'].items():
+            if typecode == 'B':
+                columns[name] = bytes(body[offset:offset+nbytes])
+                continue
+            column = array(typecode)
+            column.frombytes(body[offset:offset+nbytes])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+        return self.decode(header, columns)
+
+    # the usual key order of terms and their stats
+    TERM_KEYS = ('term', 'score', 'source_lexemes', 'gloss', 'stats')
+    STATS_KEYS = ('seen', 'missed')
+    LEARNED_KEYS = ('seen', 'missed', 'learned')
+
+    @staticmethod
+    def join_strings(values):
+        '''
+        Give the utf8 bytes of strings joined with NUL, and
+        the positions of the values that are None; or None
+        if the values cannot be joined.
+        '''
+        nulls = array('I')
+        if None in values:
+            nulls.extend(i for i, value in enumerate(values) if value is None)
+            values = ['' if value is None else value for value in values]
+        try:
+            text = '\0'.join(values)
+        except TypeError:
+            return None
+        # a NUL inside a string would split it in two
+        if text.count('\0') != max(len(values) - 1, 0):
+            return None
+        return text.encode('utf8'), nulls
+
+    @staticmethod
+    def split_strings(data, nulls, count):
+        '''Give back the strings joined by join_strings'''
+        values = data.decode('utf8').split('\0') if count else []
+        for i in nulls:
+            values[i] = None
+        return values
+
+    @staticmethod
+    def encode(set_data):
+        '''Split a set into a header and number columns.'''
+        terms_dict = plain_terms(set_data['terms_dict'])
+        ids = list(terms_dict)
+        id2row = {tid:i for i, tid in enumerate(ids)}
+        layouts = [ColumnStore.TERM_KEYS, ColumnStore.STATS_KEYS, ColumnStore.LEARNED_KEYS]
+        layout2id = {keys:i for i, keys in enumerate(layouts)}
+        main_keys = set(ColumnStore.TERM_KEYS)
+        stat_keys = set(ColumnStore.LEARNED_KEYS)
+
+        def layout_id(keys):
+            if keys not in layout2id:
+                layout2id[keys] = len(layouts)
+                layouts.append(keys)
+            return layout2id[keys]
+
+        # the columns are built one at a time, which is faster than row by row
+        tdatas = list(terms_dict.values())
+        all_stats = [tdata.get('stats', {}) for tdata in tdatas]
+        layout = array('H', [layout_id(tuple(tdata)) for tdata in tdatas])
+        stats_layout = array('H', [layout_id(tuple(stats)) for stats in all_stats])
+        terms = [tdata.get('term') for tdata in tdatas]
+        scores = [tdata.get('score') for tdata in tdatas]
+        glosses = [tdata.get('gloss') for tdata in tdatas]
+        lexeme_lists = [tdata.get('source_lexemes', ()) for tdata in tdatas]
+        lexemes = array('I', chain.from_iterable(lexeme_lists))
+        lex_offsets = array('I', [0])
+        lex_offsets.extend(accumulate(map(len, lexeme_lists)))
+        seen = array('I', [stats.get('seen', 0) for stats in all_stats])
+        missed = array('I', [stats.get('missed', 0) for stats in all_stats])
+        learned = [stats.get('learned') for stats in all_stats]
+
+        # anything else is kept per term, with the other stats apart
+        extras = {}
+        for tid, tdata, stats in zip(ids, tdatas, all_stats):
+            if not main_keys.issuperset(tdata) or not stat_keys.issuperset(stats):
+                extra = [{k:v for k,v in tdata.items() if k not in main_keys},
+                         {k:v for k,v in stats.items() if k not in stat_keys}]
+                if extra != [{}, {}]:
+                    extras[tid] = extra
+
+        columns = {
+            'layout': layout, 'stats_layout': stats_layout,
+            'lex_offsets': lex_offsets, 'lexemes': lexemes,
+            'seen': seen, 'missed': missed,
+        }
+        for score, queue in set_data['term_queues'].items():
+            columns[f'queue.{score}'] = array('I', [id2row[tid] for tid in queue])
+
+        strings = {'ids': ids, 'term': terms, 'score': scores, 'gloss': glosses, 'learned': learned}
+        for name, values in list(strings.items()):
+            joined = ColumnStore.join_strings(values)
+            if joined is not None:
+                columns[f'{name}.utf8'], columns[f'{name}.nulls'] = joined
+                del strings[name]
+        strings['extra'] = extras
+
+        header = {
+            'format': ColumnStore.FORMAT,
+            'version': ColumnStore.VERSION,
+            'byteorder': sys.byteorder,
+            'keys': list(set_data),
+            'meta': {k:v for k,v in set_data.items() if k not in {'terms_dict', 'term_queues'}},
+            'layouts': layouts,
+            'queue_order': list(set_data['term_queues']),
+            'nterms': len(ids),
+            'terms': strings,
+            'columns': {},
+        }
+        return header, columns
+
+    @staticmethod
+    def decode(header, columns):
+        '''Rebuild a set from its header and columns.'''
+        strings = dict(header['terms'])
+        for name in ('ids', 'term', 'score', 'gloss', 'learned'):
+            if name not in strings:
+                strings[name] = ColumnStore.split_strings(
+                    columns[f'{name}.utf8'], columns[f'{name}.nulls'], header['nterms'])
+        layouts = header['layouts']
+        ids = strings['ids']
+        offsets, lexemes = columns['lex_offsets'].tolist(), columns['lexemes'].tolist()
+        extras = strings['extra']
+
+        terms_dict = {}
+        rows = zip(
+            ids, columns['layout'], columns['stats_layout'],
+            strings['term'], strings['score'], strings['gloss'],
+            offsets, offsets[1:], columns['seen'], columns['missed'], strings['learned'],
+        )
+        for tid, layout, stats_layout, term, score, gloss, start, stop, seen, missed, learned in rows:
+
+            # usual layouts are built directly
+            if layout == 0 and stats_layout < 3:
+                if stats_layout == 1:
+                    stats = {'seen': seen, 'missed': missed}
+                else:
+                    stats = {'seen': seen, 'missed': missed, 'learned': learned}
+                terms_dict[tid] = {
+                    'term': term,
+                    'score': score,
+                    'source_lexemes': lexemes[start:stop],
+                    'gloss': gloss,
+                    'stats': stats,
+                }
+                continue
+
+            extra, stats_extra = extras.get(tid, ({}, {}))
+            stats_values = {'seen': seen, 'missed': missed, 'learned': learned}
+            stats = {k: stats_values[k] if k in stats_values else stats_extra[k]
+                        for k in layouts[stats_layout]}
+            values = {
+                'term': term,
+                'score': score,
+                'source_lexemes': lexemes[start:stop],
+                'gloss': gloss,
+                'stats': stats,
+            }
+            terms_dict[tid] = {k: values[k] if k in values else extra[k]
+                                   for k in layouts[layout]}
+
+        term_queues = {score:[ids[row] for row in columns[f'queue.{score}']]
+                          for score in header['queue_order']}
+
+        set_data = {}
+        for key in header['keys']:
+            if key == 'terms_dict':
+                set_data[key] = terms_dict
+            elif key == 'term_queues':
+                set_data[key] = term_queues
+            else:
+                set_data[key] = header['meta'][key]
+        return set_data
+
+class SQLiteStore(Store):
+    '''
+    Stores a set in a SQLite database, with tables for terms,
+    queue positions, score config, cycle data and session stats.
+
+    Finished sessions are saved with update, which only writes
+    the rows of the session's terms in a single transaction.
+    Terms can also be queried directly, e.g.
+        store.query('SELECT id FROM terms WHERE missed > ?', (3,))
+    '''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS terms (
+            id TEXT PRIMARY KEY, ord INTEGER, term TEXT, score TEXT,
+            gloss TEXT, lexemes TEXT, seen INTEGER, missed INTEGER,
+            learned TEXT, layout TEXT, extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS terms_score ON terms (score);
+        CREATE INDEX IF NOT EXISTS terms_missed ON terms (missed);
+        CREATE TABLE IF NOT EXISTS queues (
+            term_id TEXT PRIMARY KEY, score TEXT, pos INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS queues_pos ON queues (score, pos);
+        CREATE TABLE IF NOT EXISTS scoreconfig (score TEXT PRIMARY KEY, config TEXT);
+        CREATE TABLE IF NOT EXISTS cycle_data (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS sessions (
+            n INTEGER PRIMARY KEY, date TEXT, cycle INTEGER, data TEXT
+        );
+    '''
+
+    def __init__(self, file):
+        self.file = Path(file)
+
+    def connect(self):
+        conn = sqlite3.connect(self.file)
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def query(self, sql, params=()):
+        '''Run a read query and return all rows.'''
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def term_row(tid, tdata, order):
+        '''Make a terms table row from a term dict.'''
+        stats = tdata.get('stats', {})
+        layout = None
+        if (tuple(tdata) != ColumnStore.TERM_KEYS
+                or tuple(stats) not in {ColumnStore.STATS_KEYS, ColumnStore.LEARNED_KEYS}):
+            layout = json.dumps([list(tdata), list(stats)])
+        extra = {k:v for k,v in tdata.items() if k not in ColumnStore.TERM_KEYS}
+        extra.update({f'stats.{k}':v for k,v in stats.items() if k not in ColumnStore.LEARNED_KEYS})
+        return (
+            tid, order, tdata.get('term'), tdata.get('score'), tdata.get('gloss'),
+            json.dumps(tdata.get('source_lexemes', [])),
+            stats.get('seen', 0), stats.get('missed', 0), stats.get('learned'),
+            layout, json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    @staticmethod
+    def row_term(row):
+        '''Make a term dict from a terms table row.'''
+        term, score, gloss, lexemes, seen, missed, learned, layout, extra = row
+        extra = json.loads(extra) if extra else {}
+        stats = {'seen': seen, 'missed': missed}
+        if learned is not None:
+            stats['learned'] = learned
+        tdata = {
+            'term': term,
+            'score': score,
+            'source_lexemes': json.loads(lexemes),
+            'gloss': gloss,
+            'stats': stats,
+        }
+        if layout is None:
+            return tdata
+        term_keys, stats_keys = json.loads(layout)
+        stats = {k: stats[k] if k in stats else extra[f'stats.{k}'] for k in stats_keys}
+        tdata['stats'] = stats
+        return {k: tdata[k] if k in tdata else extra[k] for k in term_keys}
+
+    def load(self):
+        conn = self.connect()
+        try:
+            meta = {k:json.loads(v) for k,v in conn.execute('SELECT key, value FROM meta')}
+            terms_dict = {}
+            for tid, *row in conn.execute(
+                    'SELECT id, term, score, gloss, lexemes, seen, missed, learned, layout, extra '
+                    'FROM terms ORDER BY ord'):
+                terms_dict[tid] = self.row_term(row)
+            term_queues = {score:[] for score in meta['queue_order']}
+            for tid, score in conn.execute('SELECT term_id, score FROM queues ORDER BY score, pos'):
+                term_queues[score].append(tid)
+            scoreconfig = {score:json.loads(config) for score, config in conn.execute(
+                'SELECT score, config FROM scoreconfig ORDER BY rowid')}
+            cycle_data = {k:json.loads(v) for k,v in conn.execute(
+                'SELECT key, value FROM cycle_data ORDER BY rowid')}
+            stats = [json.loads(data) for data, in conn.execute(
+                'SELECT data FROM sessions ORDER BY n')]
+        finally:
+            conn.close()
+
+        tables = {
+            'terms_dict': terms_dict,
+            'term_queues': term_queues,
+            'scoreconfig': scoreconfig,
+            'cycle_data': cycle_data,
+            'stats': stats,
+        }
+        return {key: tables[key] if key in tables else meta[key] for key in meta['keys']}
+
+    def save(self, set_data):
+        '''Write the whole set, replacing what is stored.'''
+        conn = self.connect()
+        try:
+            with conn:
+                for table in ('meta', 'terms', 'queues', 'scoreconfig', 'cycle_data', 'sessions'):
+                    conn.execute(f'DELETE FROM {table}')
+                conn.executemany(
+                    'INSERT INTO terms VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                    (self.term_row(tid, tdata, i)
+                        for i, (tid, tdata) in enumerate(plain_terms(set_data['terms_dict']).items())))
+                for score, queue in set_data['term_queues'].items():
+                    conn.executemany(
+                        'INSERT INTO queues VALUES (?,?,?)',
+                        ((tid, score, pos) for pos, tid in enumerate(queue)))
+                self.write_set_tables(conn, set_data)
+                conn.executemany(
+                    'INSERT INTO sessions VALUES (?,?,?,?)',
+                    (self.session_row(n, sd) for n, sd in enumerate(set_data['stats'])))
+        finally:
+            conn.close()
+
+    def update(self, set_data, term_ids, deleted=()):
+        '''
+        Write only the rows of the given terms, their queue positions,
+        the small set tables and any new session stats, in one transaction.
+        The rows of deleted terms are removed; the positions of the
+        other terms are kept, so their queues stay in order.
+        '''
+        if not self.file.exists():
+            return self.save(set_data)
+        term_ids = set(term_ids)
+        deleted = [(tid,) for tid in deleted]
+        terms_dict = set_data['terms_dict']
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany('DELETE FROM terms WHERE id = ?', deleted)
+                conn.executemany('DELETE FROM queues WHERE term_id = ?', deleted)
+                orders = dict(conn.execute('SELECT id, ord FROM terms'))
+                rows = []
+                for tid in term_ids:
+                    if tid not in orders:
+                        raise Exception(f'term {tid} is not stored in {self.file}')
+                    rows.append(self.term_row(tid, terms_dict[tid], orders[tid]))
+                conn.executemany('REPLACE INTO terms VALUES (?,?,?,?,?,?,?,?,?,?,?)', rows)
+                for score, queue in set_data['term_queues'].items():
+                    self.update_queue(conn, score, queue, term_ids)
+                self.write_set_tables(conn, set_data)
+                nstored = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+                conn.executemany(
+                    'INSERT INTO sessions VALUES (?,?,?,?)',
+                    (self.session_row(n, set_data['stats'][n])
+                        for n in range(nstored, len(set_data['stats']))))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def update_queue(conn, score, queue, term_ids):
+        '''
+        Store the positions of changed terms in a queue.
+
+        Changed terms are at the front or back of a queue after a
+        session (rotated or rescored terms), so they get positions
+        below or above all others. The terms in between must still
+        be in the order of their stored positions; if a changed term
+        moved among them, the whole queue is renumbered.
+        '''
+        if not term_ids & set(queue):
+            return
+        queue = list(queue)
+        stored = dict(conn.execute(
+            'SELECT term_id, pos FROM queues WHERE score = ?', (score,)))
+        front = 0
+        while front < len(queue) and queue[front] in term_ids:
+            front += 1
+        back = len(queue)
+        while back > front and queue[back-1] in term_ids:
+            back -= 1
+        middle = [stored.get(tid) for tid in queue[front:back]]
+
+        if None in middle or any(pos >= nxt for pos, nxt in zip(middle, middle[1:])):
+            positions = list(enumerate(queue))
+        else:
+            low = min(stored.values(), default=0)
+            high = max(stored.values(), default=0)
+            positions = [(low - front + i, tid) for i, tid in enumerate(queue[:front])]
+            positions += [(high + 1 + i, tid) for i, tid in enumerate(queue[back:])]
+        conn.executemany(
+            'REPLACE INTO queues VALUES (?,?,?)',
+            ((tid, score, pos) for pos, tid in positions))
+
+    @staticmethod
+    def session_row(n, session_stats):
+        return (n, session_stats.get('date'), session_stats.get('cycle'),
+                json.dumps(session_stats, ensure_ascii=False))
+
+    @staticmethod
+    def write_set_tables(conn, set_data):
+        '''Rewrite the small tables: meta, score config and cycle data.'''
+        for table in ('meta', 'scoreconfig', 'cycle_data'):
+            conn.execute(f'DELETE FROM {table}')
+        tables = {'terms_dict', 'term_queues', 'scoreconfig', 'cycle_data', 'stats'}
+        meta = {k:v for k,v in set_data.items() if k not in tables}
+        meta['keys'] = list(set_data)
+        meta['queue_order'] = list(set_data['term_queues'])
+        conn.executemany(
+            'INSERT INTO meta VALUES (?,?)',
+            ((k, json.dumps(v, ensure_ascii=False)) for k,v in meta.items()))
+        conn.executemany(
+            'INSERT INTO scoreconfig VALUES (?,?)',
+            ((score, json.dumps(config)) for score, config in set_data['scoreconfig'].items()))
+        conn.executemany(
+            'INSERT INTO cycle_data VALUES (?,?)',
+            ((k, json.dumps(v)) for k,v in set_data['cycle_data'].items()))
+
+STORES = {
+    '.json': JSONStore,
+    '.mahir': ColumnStore,
+    '.sqlite': SQLiteStore,
+    '.db': SQLiteStore,
+}
+
+def get_store(file, **kwargs):
+    '''Pick the storage backend for a file by its suffix.'''
+    file = Path(file)
+    try:
+        return STORES[file.suffix](file, **kwargs)
+    except KeyError:
+        raise Exception(f'no storage backend for {file.suffix} files')
+
+def load_set(file):
+    '''Load a vocab set from any backend.'''
+    return get_store(file).load()
+
+def save_set(set_data, file, **kwargs):
+    '''Save a vocab set to any backend.'''
+    get_store(file, **kwargs).save(set_data)
+
+def update_set(set_data, file, term_ids, deleted=()):
+    '''Save a set where only the given terms have changed or been deleted.'''
+    get_store(file).update(set_data, term_ids, deleted)
+
+def convert(source, target, **kwargs):
+    '''
+    Copy a set from one backend to another, e.g. to
+    export a binary set as pretty JSON. Returns True
+    if the target loads back to the same data.
+    '''
+    set_data = load_set(source)
+    save_set(set_data, target, **kwargs)
+    return load_set(target) == set_data
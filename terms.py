@@ -0,0 +1,421 @@
+'''
+This module holds the terms of a vocab set in a compact, typed table.
+
+In JSON, every term is a dict of strings and lists with a nested stats
+dict, and scores are strings like '3'. In a TermTable, term IDs and
+scores are integers, the lexemes of all terms are one flat array with
+offsets, and the stats are parallel integer arrays. This takes several
+times less memory than the nested dicts of a large set.
+
+A TermTable is a mapping from term ID to a TermView, which reads and
+writes the table but behaves like the term dict of the JSON:
+    terms_dict['12']['score'] = '3'
+    terms_dict['12']['stats']['missed'] += 1
+still work, so code written for the JSON keeps working.
+NB: source_lexemes is returned as a new list; to change the
+lexemes of a term, assign a new list to it.
+
+load_terms and TermTable.to_json convert from and to the JSON dicts.
+'''
+
+from array import array
+from collections.abc import MutableMapping
+
+# usual key order of a term and its stats
+TERM_KEYS = ('term', 'score', 'source_lexemes', 'gloss', 'stats')
+STATS_KEYS = ('seen', 'missed')
+LEARNED_KEYS = ('seen', 'missed', 'learned')
+
+def canonical_int(value):
+    '''Whether a string is an int that converts back to the same string'''
+    return isinstance(value, str) and value.isdigit() and str(int(value)) == value
+
+class TermView(MutableMapping):
+    '''A dict-like view of one term in a TermTable'''
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.table.get_value(self.row, key)
+
+    def __setitem__(self, key, value):
+        self.table.set_value(self.row, key, value)
+
+    def __delitem__(self, key):
+        self.table.del_key(self.row, key)
+
+    def __iter__(self):
+        return iter(self.table.term_keys(self.row))
+
+    def __len__(self):
+        return len(self.table.term_keys(self.row))
+
+    def __repr__(self):
+        return repr(self.table.term_json(self.row))
+
+class StatsView(MutableMapping):
+    '''A dict-like view of the stats of one term in a TermTable'''
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.table.get_stat(self.row, key)
+
+    def __setitem__(self, key, value):
+        self.table.set_stat(self.row, key, value)
+
+    def __delitem__(self, key):
+        self.table.del_key(self.row, key, stats=True)
+
+    def __iter__(self):
+        return iter(self.table.stats_keys(self.row))
+
+    def __len__(self):
+        return len(self.table.stats_keys(self.row))
+
+    def __repr__(self):
+        return repr(self.table.stats_json(self.row))
+
+class TermTable(MutableMapping):
+    '''
+    The terms of a set in parallel typed columns, one row per term.
+
+    Keys are term ID strings as in the JSON; internally the IDs are ints.
+    Keys other than the usual ones are kept in a per-row extra dict,
+    and the key order of every term is kept, so that to_json gives
+    back exactly the JSON the table was made from.
+    '''
+
+    def __init__(self):
+        self.ids = array('q')
+        self.id2row = {}
+        self.alive = bytearray()
+        self.terms = []
+        self.glosses = []
+        self.scores = array('h')
+        self.lex_start = array('I')
+        self.lex_len = array('H')
+        self.lexemes = array('I')
+        self.dead_lexemes = 0 # slots of replaced lexemes and deleted terms
+        self.seen = array('I')
+        self.missed = array('I')
+        self.learned = []
+        # key orders of terms and stats, by layout id
+        self.layouts = [TERM_KEYS, STATS_KEYS, LEARNED_KEYS]
+        self.layout2id = {keys:i for i, keys in enumerate(self.layouts)}
+        self.term_layout = array('B')
+        self.stats_layout = array('B')
+        self.extra = {}
+
+    @classmethod
+    def from_dict(cls, terms_dict):
+        '''
+        Make a table from the terms_dict of a JSON set.
+        Raises ValueError if a term ID or score is not a plain integer string.
+        '''
+        table = cls()
+        for tid, tdata in terms_dict.items():
+            stats = tdata.get('stats')
+            if (tuple(tdata) == TERM_KEYS and canonical_int(tid) and canonical_int(tdata['score'])
+                    and tid not in table and tuple(stats) in {STATS_KEYS, LEARNED_KEYS}):
+                table.append_term(int(tid), tdata, stats)
+            else:
+                table[tid] = tdata
+        return table
+
+    def append_term(self, nid, tdata, stats):
+        '''Add a new term with the usual keys, without checks'''
+        self.id2row[nid] = len(self.ids)
+        self.ids.append(nid)
+        self.alive.append(1)
+        self.terms.append(tdata['term'])
+        self.glosses.append(tdata['gloss'])
+        self.scores.append(int(tdata['score']))
+        lexs = tdata['source_lexemes']
+        self.lex_start.append(len(self.lexemes))
+        self.lex_len.append(len(lexs))
+        self.lexemes.extend(lexs)
+        self.seen.append(stats['seen'])
+        self.missed.append(stats['missed'])
+        self.learned.append(stats.get('learned'))
+        self.term_layout.append(0)
+        self.stats_layout.append(2 if 'learned' in stats else 1)
+
+    def to_json(self):
+        '''Give the terms as the plain dicts of the JSON format.'''
+        return {str(self.ids[row]): self.term_json(row)
+                    for row in range(len(self.ids)) if self.alive[row]}
+
+    # -- mapping of term IDs to views --
+
+    def row(self, tid):
+        '''Give the row of a term ID'''
+        try:
+            return self.id2row[int(tid)]
+        except ValueError:
+            raise KeyError(tid)
+
+    def __getitem__(self, tid):
+        return TermView(self, self.row(tid))
+
+    def __contains__(self, tid):
+        try:
+            return int(tid) in self.id2row
+        except (ValueError, TypeError):
+            return False
+
+    def __iter__(self):
+        ids, alive = self.ids, self.alive
+        return (str(ids[row]) for row in range(len(ids)) if alive[row])
+
+    def __len__(self):
+        return len(self.id2row)
+
+    def __delitem__(self, tid):
+        row = self.row(tid)
+        del self.id2row[self.ids[row]]
+        self.alive[row] = 0
+        self.extra.pop(row, None)
+        self.drop_lexemes(row)
+
+    def __setitem__(self, tid, tdata):
+        if not canonical_int(tid):
+            raise ValueError(f'term ID {tid!r} is not an integer string')
+        if 'score' in tdata and not canonical_int(tdata['score']):
+            raise ValueError(f'score {tdata["score"]!r} is not an integer string')
+        if isinstance(tdata, TermView):
+            tdata = tdata.table.term_json(tdata.row)
+        if tid in self:
+            # a term keeps its row, and so its place in the set
+            row = self.row(tid)
+            self.drop_lexemes(row)
+            self.extra.pop(row, None)
+        else:
+            row = len(self.ids)
+            self.id2row[int(tid)] = row
+            self.ids.append(int(tid))
+            self.alive.append(1)
+            self.terms.append(None)
+            self.glosses.append(None)
+            self.scores.append(0)
+            self.lex_start.append(0)
+            self.lex_len.append(0)
+            self.seen.append(0)
+            self.missed.append(0)
+            self.learned.append(None)
+            self.term_layout.append(0)
+            self.stats_layout.append(0)
+        self.terms[row] = self.glosses[row] = self.learned[row] = None
+        self.scores[row] = self.seen[row] = self.missed[row] = 0
+        self.term_layout[row] = self.stats_layout[row] = self.layout_id(())
+        for key, value in tdata.items():
+            self.set_value(row, key, value)
+
+    def __repr__(self):
+        return f'TermTable({len(self)} terms)'
+
+    # -- typed access for scheduling code --
+
+    def score(self, tid):
+        '''Give the score of a term as an int'''
+        return self.scores[self.row(tid)]
+
+    def score_items(self):
+        '''Iterate over the (term ID, score) strings of all terms'''
+        for tid, score, alive in zip(self.ids, self.scores, self.alive):
+            if alive:
+                yield str(tid), str(score)
+
+    def lexeme_items(self):
+        '''Iterate over the term IDs and source lexemes (as arrays) of all terms'''
+        for row, tid in enumerate(self.ids):
+            if self.alive[row]:
+                start = self.lex_start[row]
+                yield str(tid), self.lexemes[start:start+self.lex_len[row]]
+
+    def stat_items(self, key):
+        '''Iterate over the term IDs and values of an extra stat, for the terms that have it'''
+        skey = ('stats', key)
+        # the stats layouts with the key; stale extras are not in them
+        layouts = {i for i, keys in enumerate(self.layouts) if key in keys}
+        ids, alive, stats_layout = self.ids, self.alive, self.stats_layout
+        for row, values in self.extra.items():
+            if skey in values and alive[row] and stats_layout[row] in layouts:
+                yield str(ids[row]), values[skey]
+
+    def first_scores(self):
+        '''Map every score to the ID of the first term with it'''
+        first = {}
+        ids, alive = self.ids, self.alive
+        for row, score in enumerate(self.scores):
+            if score not in first and alive[row]:
+                first[score] = ids[row]
+        return {str(score):str(tid) for score, tid in first.items()}
+
+    # -- key layouts --
+
+    def layout_id(self, keys):
+        if keys not in self.layout2id:
+            self.layout2id[keys] = len(self.layouts)
+            self.layouts.append(keys)
+        return self.layout2id[keys]
+
+    def term_keys(self, row):
+        return self.layouts[self.term_layout[row]]
+
+    def stats_keys(self, row):
+        return self.layouts[self.stats_layout[row]]
+
+    def add_key(self, row, key, stats=False):
+        layout = self.stats_layout if stats else self.term_layout
+        keys = self.layouts[layout[row]]
+        if key not in keys:
+            layout[row] = self.layout_id(keys + (key,))
+
+    def del_key(self, row, key, stats=False):
+        layout = self.stats_layout if stats else self.term_layout
+        keys = self.layouts[layout[row]]
+        if key not in keys:
+            raise KeyError(key)
+        layout[row] = self.layout_id(tuple(k for k in keys if k != key))
+        if key not in (STATS_KEYS if stats else TERM_KEYS):
+            self.extra.get(row, {}).pop(('stats', key) if stats else key, None)
+        elif key == 'source_lexemes' and not stats:
+            self.drop_lexemes(row)
+
+    # -- term values --
+
+    def get_value(self, row, key):
+        if key not in self.term_keys(row):
+            raise KeyError(key)
+        if key == 'term':
+            return self.terms[row]
+        elif key == 'score':
+            return str(self.scores[row])
+        elif key == 'gloss':
+            return self.glosses[row]
+        elif key == 'source_lexemes':
+            start = self.lex_start[row]
+            return self.lexemes[start:start+self.lex_len[row]].tolist()
+        elif key == 'stats':
+            return StatsView(self, row)
+        return self.extra[row][key]
+
+    def set_value(self, row, key, value):
+        if key == 'term':
+            self.terms[row] = value
+        elif key == 'score':
+            if not canonical_int(value):
+                raise ValueError(f'score {value!r} is not an integer string')
+            self.scores[row] = int(value)
+        elif key == 'gloss':
+            self.glosses[row] = value
+        elif key == 'source_lexemes':
+            # new lexemes go to the end of the flat array
+            self.drop_lexemes(row)
+            self.lex_start[row] = len(self.lexemes)
+            self.lex_len[row] = len(value)
+            self.lexemes.extend(value)
+        elif key == 'stats':
+            self.stats_layout[row] = self.layout_id(())
+            self.learned[row] = None
+            for skey, svalue in value.items():
+                self.set_stat(row, skey, svalue)
+        else:
+            self.extra.setdefault(row, {})[key] = value
+        self.add_key(row, key)
+
+    def drop_lexemes(self, row):
+        '''
+        Leave the lexemes of a row as dead slots of the flat array.
+        Once more than half of it is dead, it is compacted.
+        '''
+        self.dead_lexemes += self.lex_len[row]
+        self.lex_len[row] = 0
+        if self.dead_lexemes > len(self.lexemes) // 2:
+            self.compact_lexemes()
+
+    def compact_lexemes(self):
+        '''Copy the live lexemes of all rows to a new flat array, in row order'''
+        lexemes = array('I')
+        for row in range(len(self.ids)):
+            start, stop = self.lex_start[row], self.lex_start[row] + self.lex_len[row]
+            self.lex_start[row] = len(lexemes)
+            lexemes.extend(self.lexemes[start:stop])
+        self.lexemes = lexemes
+        self.dead_lexemes = 0
+
+    def get_stat(self, row, key):
+        if key not in self.stats_keys(row):
+            raise KeyError(key)
+        if key == 'seen':
+            return self.seen[row]
+        elif key == 'missed':
+            return self.missed[row]
+        elif key == 'learned':
+            return self.learned[row]
+        return self.extra[row][('stats', key)]
+
+    def set_stat(self, row, key, value):
+        if key == 'seen':
+            self.seen[row] = value
+        elif key == 'missed':
+            self.missed[row] = value
+        elif key == 'learned':
+            self.learned[row] = value
+        else:
+            self.extra.setdefault(row, {})[('stats', key)] = value
+        self.add_key(row, key, stats=True)
+
+    # -- conversion to JSON dicts --
+
+    def stats_json(self, row):
+        layout = self.stats_layout[row]
+        if layout == 1:
+            return {'seen': self.seen[row], 'missed': self.missed[row]}
+        elif layout == 2:
+            return {'seen': self.seen[row], 'missed': self.missed[row], 'learned': self.learned[row]}
+        return {key: self.get_stat(row, key) for key in self.layouts[layout]}
+
+    def term_json(self, row):
+        if self.term_layout[row] == 0:
+            start = self.lex_start[row]
+            return {
+                'term': self.terms[row],
+                'score': str(self.scores[row]),
+                'source_lexemes': self.lexemes[start:start+self.lex_len[row]].tolist(),
+                'gloss': self.glosses[row],
+                'stats': self.stats_json(row),
+            }
+        values = {key: self.get_value(row, key) for key in self.term_keys(row)}
+        if 'stats' in values:
+            values['stats'] = self.stats_json(row)
+        return values
+
+def load_terms(set_data):
+    '''
+    Converts the terms_dict of a set to a TermTable in place.
+    Sets with term IDs or scores that are not plain
+    integer strings are left as they are.
+    '''
+    terms_dict = set_data['terms_dict']
+    if not isinstance(terms_dict, TermTable):
+        try:
+            set_data['terms_dict'] = TermTable.from_dict(terms_dict)
+        except (ValueError, OverflowError, TypeError):
+            pass
+    return set_data['terms_dict']
+
+def plain_terms(terms_dict):
+    '''Give the terms as plain JSON dicts, whatever they are stored in.'''
+    if isinstance(terms_dict, TermTable):
+        return terms_dict.to_json()
+    return terms_dict
@@ -0,0 +1,27 @@
+import sys
+import shutil
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO))
+sys.path.append(str(REPO / 'benchmarks')) # stubs.py, an offline Text-Fabric
+sys.path.append(str(REPO / 'tools')) # tools.py and streaming.py, as the scripts import them
+
+SAMPLE_VOCAB = REPO / 'sample_vocab'
+
+@pytest.fixture
+def vocab(tmp_path, monkeypatch):
+    '''Copy the test set to a temporary working directory and give its path.'''
+    monkeypatch.chdir(tmp_path)
+    return Path(shutil.copy(SAMPLE_VOCAB / 'test.json', tmp_path / 'test.json'))
+
+@pytest.fixture
+def stub_app(monkeypatch):
+    '''Stand in for the Text-Fabric app of the sample sets.'''
+    import iMahir
+    from stubs import StubApp
+    app = StubApp()
+    monkeypatch.setitem(iMahir.TF_APPS, ('bhsa', 'c'), app)
+    return app
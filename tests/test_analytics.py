@@ -0,0 +1,100 @@
+import json
+import math
+from datetime import datetime
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from analytics import SessionHistory, parse_duration
+
+def session(date, cycle, counts, duration='0:10:00', secs_per_term=6.0, deck=None):
+    return {
+        'date': date,
+        'cycle': cycle,
+        'duration': duration,
+        'secs_per_term': secs_per_term,
+        'deck': deck or {'0': 50, '1': 50},
+        'score_counts': counts,
+    }
+
+STATS = [
+    session('2026-01-01 10:00:00', 1, {'0': 90, '1': 10}),
+    {'date': '2026-01-01 18:00:00', 'cycle': 1}, # no score counts
+    session('2026-01-02 10:00:00', 1, {'0': 70, '1': 20, '3': 10}, duration='1:02:03.5'),
+    session('2026-01-03 10:00:00', 2, {'0': 60, '3': 30, '4': 10}, duration=None, secs_per_term=None),
+    session('2026-01-04 10:00:00', 2, {'0': 55, '3': 30, '4': 15}, deck={'0': 20}),
+]
+
+def test_columns():
+    history = SessionHistory(STATS)
+    assert len(history) == 4
+    assert list(history.time) == [datetime.fromisoformat(s['date']).timestamp() for s in STATS if 'score_counts' in s]
+    assert list(history.cycle) == [1, 1, 2, 2]
+    assert list(history.deck) == [100, 100, 100, 20]
+    assert list(history.learned) == [0, 10, 40, 45]
+    assert list(history.unlearned) == [90, 70, 60, 55]
+    # relative to the end of the previous cycle
+    assert list(history.cycle_learned) == [0, 10, 30, 35]
+    assert list(history.cycle_unlearned) == [0, -20, -10, -15]
+    assert history.cycle_starts == [0, 2]
+
+def test_unknown_duration():
+    history = SessionHistory(STATS)
+    assert history.duration[:2].tolist() == [600.0, 3723.5]
+    assert math.isnan(history.duration[2]) and math.isnan(history.secs_per_term[2])
+    assert history.secs_per_term[3] == 6.0
+
+def test_score_counts():
+    history = SessionHistory(STATS)
+    # a score first seen later is zero before it appeared
+    assert {score: list(column) for score, column in history.score_counts.items()} == {
+        '0': [90, 70, 60, 55],
+        '1': [10, 20, 0, 0],
+        '3': [0, 10, 30, 30],
+        '4': [0, 0, 10, 15],
+    }
+
+def test_append_matches_build():
+    built = SessionHistory(STATS)
+    appended = SessionHistory()
+    for session_stats in STATS:
+        appended.append(session_stats)
+    for name in SessionHistory.COLUMNS:
+        assert getattr(appended, name).tobytes() == getattr(built, name).tobytes()
+    assert appended.score_counts == built.score_counts
+    assert appended.cycle_starts == built.cycle_starts
+
+def test_cycles():
+    history = SessionHistory(STATS)
+    assert history.cycle_bounds() == [2]
+    assert history.cycle_bounds(start=1) == [1]
+    assert history.cycle_bounds(start=2) == []
+    trends = history.cycle_trends()
+    assert list(trends) == [1, 2]
+    assert trends[1] == {'sessions': 2, 'learned': 10, 'unlearned': 70,
+                         'learned_change': 10, 'unlearned_change': -20}
+    assert trends[2] == {'sessions': 2, 'learned': 45, 'unlearned': 55,
+                         'learned_change': 35, 'unlearned_change': -15}
+
+@pytest.mark.parametrize('text, secs', [
+    ('0:00:07', 7.0),
+    ('2:03:04.25', 7384.25),
+    ('1 day, 0:00:01', 86401.0),
+    ('3 days, 1:00:00', 262800.0),
+    ('nonsense', 0.0),
+])
+def test_parse_duration(text, secs):
+    assert parse_duration(text) == secs
+
+@pytest.mark.parametrize('name', ['hebrew', 'greek'])
+def test_set_history(name):
+    with open(SAMPLE_VOCAB / f'{name}.json') as infile:
+        stats = json.load(infile)['stats']
+    history = SessionHistory(stats)
+    sessions = [s for s in stats if 'score_counts' in s]
+    assert len(history) == len(sessions)
+    for row, session_stats in enumerate(sessions):
+        counts = session_stats['score_counts']
+        assert history.unlearned[row] == counts.get('0', 0)
+        assert history.learned[row] == sum(n for score, n in counts.items() if int(score) >= 3)
+        assert history.deck[row] == sum(session_stats['deck'].values())
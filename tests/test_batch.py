@@ -0,0 +1,49 @@
+import types
+
+import journal
+from batch import Batch, plan_set
+from storage import load_set, save_set
+
+def complete_cycle(vocab):
+    set_data = load_set(vocab)
+    set_data['cycle_data']['total_sessions'] = set_data['cycle_data']['cycle_length']
+    save_set(set_data, vocab)
+
+def test_plan_without_commit(vocab):
+    complete_cycle(vocab)
+    before = vocab.read_bytes()
+    assert plan_set(vocab)['status'] == 'cycle complete'
+    preview = plan_set(vocab, new_cycles=True, commit=False)
+    assert vocab.read_bytes() == before
+    assert preview['status'] == 'new' and preview['session'] == 1
+
+    plan = plan_set(vocab, new_cycles=True)
+    assert vocab.read_bytes() != before
+    assert len(plan['deck']) == len(preview['deck'])
+    assert plan['deck_stats'] == preview['deck_stats']
+    assert plan['cycle'] == preview['cycle'] == load_set(vocab)['cycle_data']['ncycle']
+
+def start_journal(vocab, term_n=None):
+    '''Start a journal for the planned deck, with its cursor at term_n or the end.'''
+    plan = plan_set(vocab)
+    term_n = len(plan['deck']) if term_n is None else term_n
+    session = types.SimpleNamespace(deck=plan['deck'], deck_stats=plan['deck_stats'])
+    jrnl = journal.Journal.start(journal.journal_path(vocab), session)
+    jrnl.record('cursor', term_n=term_n)
+    jrnl.close()
+    return plan
+
+def test_plan_keeps_journal_deck(vocab):
+    plan = start_journal(vocab, 1)
+    again = plan_set(vocab)
+    assert again['deck'] == plan['deck']
+    assert again['term_n'] == 1 and again['status'] == 'in progress'
+
+def test_finalize_unknown_duration(vocab):
+    start_journal(vocab)
+    sessions = len(load_set(vocab)['stats'])
+    assert Batch([vocab]).finalize() == [vocab]
+    stats = load_set(vocab)['stats']
+    assert len(stats) == sessions + 1
+    assert stats[-1]['duration'] is None and stats[-1]['secs_per_term'] is None
+    assert not journal.journal_path(vocab).exists()
@@ -0,0 +1,20 @@
+from cards import CardCache
+
+def test_caches_on_one_file_share_their_size(tmp_path):
+    file = tmp_path / 'bhsa-c.cardcache'
+    first = CardCache(file, 'bhsa', 'c', max_bytes=1000)
+    second = CardCache(file, 'bhsa', 'c', max_bytes=1000)
+    for i in range(30):
+        (first if i % 2 else second).put(f'html:{i}', 'x' * 100)
+        stored = first.conn.execute('SELECT SUM(LENGTH(value)) FROM entries').fetchone()[0]
+        assert first.nbytes == second.nbytes == stored
+        assert stored <= 1000
+    # the least recently used are dropped first
+    assert first.get('html:29') is not None
+    assert second.get('html:0') is None
+    first.close()
+    second.close()
+    # the size is kept in the file
+    reopened = CardCache(file, 'bhsa', 'c', max_bytes=1000)
+    assert reopened.nbytes == stored
+    reopened.close()
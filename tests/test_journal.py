@@ -0,0 +1,129 @@
+import copy
+import json
+import shutil
+import pickle
+import random
+import collections
+from pathlib import Path
+from types import SimpleNamespace
+from datetime import timedelta, datetime
+
+import iMahir
+import journal
+from iMahir import loadStudy
+from storage import load_set
+
+def baseline_save(vocab, rollover=False):
+    '''
+    Write a pickled save as old sessions did: the cycle is
+    rolled over first, if asked, then the known terms of the
+    deck are moved to the back of their queues.
+    '''
+    set_data = load_set(vocab)
+    cycle_data = set_data['cycle_data']
+    if rollover:
+        cycle_data['total_sessions'] = 0
+        cycle_data['ncycle'] += 1
+        for score, queue in set_data['term_queues'].items():
+            random.Random(score).shuffle(queue)
+            cycle_data['score_starts'][score] = len(queue)
+    deck, deck_stats = [], collections.Counter()
+    for score, queue in set_data['term_queues'].items():
+        if score != '0' and queue:
+            for i in range(min(2, len(queue))):
+                deck.append(queue[0])
+                queue.append(queue.pop(0))
+                deck_stats.update([score])
+    terms_dict = set_data['terms_dict']
+    terms_dict[deck[0]]['gloss'] = 'saved gloss'
+    terms_dict[deck[-1]]['gloss'] = 'last gloss'
+    savedata = {
+        'set_data': set_data,
+        'session_data': SimpleNamespace(deck=deck, deck_stats=deck_stats),
+        'resume_time': datetime.now(),
+        'pause_times': [timedelta(seconds=30)],
+        'term_n': len(deck) - 1,
+    }
+    with open(f'{vocab.stem}.save', 'wb') as outfile:
+        pickle.dump(savedata, outfile)
+    return copy.deepcopy(set_data)
+
+def test_save_at_rollover(vocab):
+    set_data = load_set(vocab)
+    cycle_data = set_data['cycle_data']
+    cycle_data['total_sessions'] = cycle_data['cycle_length']
+    vocab.write_text(json.dumps(set_data))
+    saved = baseline_save(vocab, rollover=True)
+
+    study = loadStudy(vocab, headless=True)
+    assert not vocab.with_suffix('.save').exists()
+    # the new cycle is committed before the journal
+    committed = load_set(vocab)['cycle_data']
+    assert committed == saved['cycle_data']
+    study.finalize_session([timedelta(seconds=60)])
+
+    final = load_set(vocab)
+    assert final['cycle_data']['ncycle'] == saved['cycle_data']['ncycle']
+    assert final['cycle_data']['total_sessions'] == 1
+    assert final['cycle_data']['score_starts'] == saved['cycle_data']['score_starts']
+    # no score changed, so the queues are as the save left them
+    assert final['term_queues'] == saved['term_queues']
+
+def test_save_without_changes(vocab):
+    saved = baseline_save(vocab)
+    study = loadStudy(vocab, headless=True)
+    assert load_set(vocab)['cycle_data'] == saved['cycle_data']
+    assert study.term_n == len(study.session_data.deck) - 1
+    assert study.pause_times == [timedelta(seconds=30)]
+    study.finalize_session([timedelta(seconds=60)])
+    final = load_set(vocab)
+    assert final['term_queues'] == saved['term_queues']
+    deck = study.session_data.deck
+    glosses = {final['terms_dict'][term]['gloss'] for term in deck}
+    assert {'saved gloss', 'last gloss'} <= glosses
+
+def test_undo_converted_edit(vocab):
+    baseline_save(vocab)
+    study = loadStudy(vocab, headless=True)
+    deck = study.session_data.deck
+    terms_dict = study.set_data['terms_dict']
+    # the last converted edit was made on the last card
+    op, term, old, new, term_n = study.edits.undo(terms_dict)
+    assert (op, term, new) == ('gloss', deck[-1], 'last gloss')
+    assert term_n == len(deck) - 1
+    op, term, old, new, term_n = study.edits.undo(terms_dict)
+    assert (term, new, term_n) == (deck[0], 'saved gloss', 0)
+    assert terms_dict[deck[0]]['gloss'] == old
+
+def test_journal_next_to_set(vocab, tmp_path, monkeypatch):
+    study = loadStudy(vocab, headless=True)
+    study.open_session()
+    study.journal.record('cursor', term_n=2)
+    study.save_session(2)
+    assert (tmp_path / 'test.journal').exists()
+
+    # the session resumes from the journal in another directory
+    study.close_cache()
+    iMahir.SAVED_STUDIES.clear()
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    study = loadStudy(vocab, headless=True)
+    assert study.term_n == 2
+    assert not list(elsewhere.glob('*.journal'))
+
+def test_saved_studies_are_bounded(vocab, monkeypatch):
+    monkeypatch.setattr(iMahir, 'SAVED_STUDIES', collections.OrderedDict())
+    monkeypatch.setattr(iMahir, 'MAX_SAVED_STUDIES', 2)
+    files = [vocab] + [Path(shutil.copy(vocab, vocab.with_name(f'test{i}.json'))) for i in (1, 2)]
+    studies = []
+    for file in files:
+        study = loadStudy(file, headless=True)
+        study.open_session()
+        study.save_session(1)
+        study.suspend(1)
+        studies.append(study)
+    assert list(iMahir.SAVED_STUDIES) == [file.resolve() for file in files[1:]]
+    # the dropped study is loaded from its journal again
+    assert loadStudy(files[0], headless=True) is not studies[0]
+    assert loadStudy(files[2], headless=True) is studies[2]
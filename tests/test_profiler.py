@@ -0,0 +1,66 @@
+import csv
+
+import pytest
+
+import profiler
+from profiler import Profiler, percentile
+
+class Clock:
+    '''A perf_counter that only moves when told to'''
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(profiler.time, 'perf_counter', clock)
+    return clock
+
+def visit(prof, clock, term, pos, display, think, handle, lex=None):
+    prof.card(term, pos)
+    prof.prepared({'ex_lex': lex, 'secs': {'lookup': 0.01, 'render': 0.02}})
+    for stage, secs in (('display', display), ('think', think), ('handle', handle)):
+        clock.now += secs
+        prof.lap(stage)
+
+def test_percentile():
+    assert percentile([], 50) == 0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([5], 95) == 5
+
+def test_summary(clock):
+    prof = Profiler()
+    visit(prof, clock, '1', 0, display=0.1, think=2.0, handle=0.01, lex=11)
+    visit(prof, clock, '2', 1, display=0.3, think=4.0, handle=0.01, lex=12)
+    visit(prof, clock, '1', 2, display=0.2, think=1.0, handle=0.02, lex=11)
+    clock.now += 0.5 # left over time is handling
+    prof.end()
+
+    summary = prof.summary(nslow=2)
+    assert summary['visits'] == 3
+    assert summary['think_secs'] == 7.0
+    assert summary['system_secs'] == round(0.6 + 0.04 + 0.5, 2)
+    # two terms were visited
+    assert summary['think_secs_per_term'] == 3.5
+    assert summary['stages']['display'] == {'p50': 0.2, 'p95': 0.3, 'max': 0.3}
+    assert summary['stages']['prep_render']['max'] == 0.02
+    assert summary['stages']['latency']['max'] == 0.3
+    assert summary['slowest'] == [
+        {'term': '2', 'lex': 12, 'latency': 0.3},
+        {'term': '1', 'lex': 11, 'latency': 0.2},
+    ]
+
+def test_export(clock, tmp_path):
+    prof = Profiler()
+    visit(prof, clock, '7', 0, display=0.25, think=1.0, handle=0.5, lex=70)
+    prof.end()
+    prof.export(tmp_path / 'timings.csv')
+    with open(tmp_path / 'timings.csv', newline='', encoding='utf8') as infile:
+        rows = list(csv.DictReader(infile))
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row['term'], row['lex'], row['pos']) == ('7', '70', '0')
+    assert float(row['latency']) == 0.25 and float(row['think']) == 1.0
@@ -0,0 +1,43 @@
+import collections
+
+import pytest
+
+from iMahir import TermQueue, loadStudy, load_queues
+
+def test_rotate_and_head():
+    queue = TermQueue(['1', '2', '3', '4', '5'])
+    assert queue.head(2) == ['1', '2']
+    assert queue.head(9) == ['1', '2', '3', '4', '5']
+    assert queue.rotate(2) == ['1', '2']
+    assert list(queue) == ['3', '4', '5', '1', '2']
+    assert queue.rotate(0) == []
+    assert queue.rotate(9) == ['3', '4', '5', '1', '2']
+    assert list(queue) == ['3', '4', '5', '1', '2']
+    assert (queue[0], queue[-1]) == ('3', '2')
+    with pytest.raises(IndexError):
+        queue[5]
+
+def test_queue_edits():
+    queue = TermQueue(['1', '2', '3'])
+    queue.append('1')
+    queue.appendleft('4')
+    assert list(queue) == ['4', '2', '3', '1']
+    assert queue.popleft() == '4'
+    queue.remove('3')
+    assert '3' not in queue and len(queue) == 2
+    with pytest.raises(ValueError):
+        queue.remove('3')
+
+def test_rescore_unqueued_term(vocab):
+    study = loadStudy(vocab, headless=True)
+    term_queues = load_queues(study.set_data)
+    terms_dict = study.set_data['terms_dict']
+    queued, lost = term_queues['3'].head(2)
+    term_queues['3'].remove(lost)
+    terms_dict[queued]['score'] = terms_dict[lost]['score'] = '4'
+
+    changes = collections.Counter()
+    study.update_queues(changes, [queued, lost])
+    assert changes == {'3->4': 1}
+    assert list(term_queues['4'])[-2:] == [queued, lost]
+    assert not any(lost in term_queues[score] for score in term_queues if score != '4')
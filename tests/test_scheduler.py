@@ -0,0 +1,133 @@
+import copy
+import math
+from datetime import datetime
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from iMahir import load_queues
+from storage import load_set
+from scheduler import DueScheduler, DAY, day_start, day_end, sm2, score_quotas, simulate
+
+NOW = datetime(2024, 1, 1, 12).timestamp()
+
+def due_set(vocab):
+    set_data = load_set(vocab)
+    set_data['cycle_data']['scheduler'] = 'due'
+    return set_data, load_queues(set_data)
+
+def test_migrate(vocab):
+    set_data, term_queues = due_set(vocab)
+    terms_dict = set_data['terms_dict']
+    known = [tid for score, queue in term_queues.items() if score != '0' for tid in queue]
+    scheduler = DueScheduler(set_data)
+    assert scheduler.migrate(term_queues, NOW) == len(known)
+    assert scheduler.migrate(term_queues, NOW) == 0
+    assert not any('schedule' in terms_dict[tid]['stats'] for tid in term_queues['0'])
+    # due dates follow the queue order, from today on
+    dues = [terms_dict[tid]['stats']['schedule'][0] for tid in term_queues['3']]
+    assert dues == sorted(dues) and dues[0] == day_start(NOW)
+
+def test_build_deck(vocab):
+    set_data, term_queues = due_set(vocab)
+    terms_dict = set_data['terms_dict']
+    queues = {score: list(queue) for score, queue in term_queues.items()}
+    scheduler = DueScheduler(set_data)
+    deck, deck_stats = scheduler.build_deck(term_queues, NOW)
+
+    new_quota = set_data['cycle_data']['new_quota']
+    known, new = deck[:-new_quota], deck[-new_quota:]
+    assert new == queues['0'][:new_quota]
+    dues = [terms_dict[tid]['stats']['schedule'][0] for tid in known]
+    assert dues == sorted(dues) and all(due < day_end(NOW) for due in dues)
+    due_today = [tid for tid, tdata in terms_dict.items()
+                    if tdata['score'] != '0' and tdata['stats']['schedule'][0] < day_end(NOW)]
+    assert known and sorted(known) == sorted(due_today)
+    assert sum(deck_stats.values()) == len(deck)
+    # the queues are not advanced
+    assert {score: list(queue) for score, queue in term_queues.items()} == queues
+
+def test_review(vocab, capsys):
+    set_data, term_queues = due_set(vocab)
+    terms_dict = set_data['terms_dict']
+    scheduler = DueScheduler(set_data)
+    scheduler.migrate(term_queues, NOW)
+    raised, kept, lowered, lost = term_queues['3'].head(4)
+    new, dropped = term_queues['0'].head(1)[0], term_queues['1'].head(1)[0]
+    terms_dict[raised]['score'] = '4'
+    terms_dict[lowered]['score'] = '1'
+    terms_dict[new]['score'] = '1'
+    terms_dict[dropped]['score'] = '0'
+    del terms_dict[lost]['stats']['schedule']
+    before = {tid: list(terms_dict[tid]['stats']['schedule']) for tid in (raised, kept, lowered)}
+
+    later = NOW + 3 * DAY
+    scheduler.review(term_queues, [raised, kept, lowered, lost, new, dropped], later)
+    for tid, quality in ((raised, 5), (kept, 4), (lowered, 1)):
+        assert terms_dict[tid]['stats']['schedule'] == sm2(before[tid], quality, later)
+    assert terms_dict[lowered]['stats']['schedule'][2:] == [1, 0]
+    assert terms_dict[new]['stats']['schedule'] == sm2([later, 2.5, 0, 0], 5, later)
+    assert 'schedule' not in terms_dict[dropped]['stats']
+
+    # a known term without a schedule is reported
+    out = capsys.readouterr().out
+    assert f'term {lost} of score 3 had no schedule' in out
+    assert f'term {new} ' not in out
+    assert terms_dict[lost]['stats']['schedule'] == sm2([later, 2.5, 0, 0], 4, later)
+
+def old_quotas(s_counts, cycle_data):
+    '''The hard-coded quotas of scores 0-6 that Session used before score_quotas'''
+    cycle_len, nsession = cycle_data['cycle_length'], cycle_data['total_sessions']
+    s_starts = cycle_data['score_starts']
+    def super_cycle(score, nreset):
+        per_session = s_starts[score] / cycle_len / nreset
+        return int(round(per_session*(nsession-1) - int(per_session*(nsession-1)) + per_session, 2))
+    return {
+        '6': super_cycle('6', 8) if s_counts.get('6', 0) else 0,
+        '5': super_cycle('5', 4) if s_counts.get('5', 0) else 0,
+        '4': super_cycle('4', 2) if s_counts.get('4', 0) else 0,
+        '3': math.ceil(s_starts['3'] / cycle_len) if s_counts.get('3', 0) else 0,
+        '2': math.ceil(s_counts['2'] / 4) if s_counts.get('2', 0) else 0,
+        '1': math.ceil(s_counts['1'] / 2) if s_counts.get('1', 0) else 0,
+        '0': cycle_data['new_quota'],
+    }
+
+@pytest.mark.parametrize('name', ['hebrew', 'greek', 'test'])
+def test_score_quotas_match_old_formulas(name):
+    set_data = load_set(SAMPLE_VOCAB / f'{name}.json')
+    cycle_data = set_data['cycle_data']
+    s_counts = {score: len(queue) for score, queue in set_data['term_queues'].items()}
+    for score in '0123456':
+        s_counts.setdefault(score, 0)
+        cycle_data['score_starts'].setdefault(score, 0)
+    for nsession in range(1, cycle_data['cycle_length'] + 1):
+        cycle_data['total_sessions'] = nsession
+        quotas = score_quotas(s_counts, cycle_data, set_data['scoreconfig'])
+        assert dict(quotas) == old_quotas(s_counts, cycle_data)
+        assert list(quotas) == ['6', '5', '4', '3', '2', '1', '0']
+
+def test_score_quotas_of_other_levels():
+    cycle_data = {'new_quota': 10, 'cycle_length': 10, 'total_sessions': 1, 'score_starts': {'2': 40}}
+    scoreconfig = {'2': {'nreset': 1, 'shuffle': 'yes'}}
+    quotas = score_quotas({'0': 5, '1': 7, '2': 40, '3': 9}, cycle_data, scoreconfig)
+    # score 1 is below the configured scores, score 3 above them
+    assert dict(quotas) == {'3': 0, '2': 4, '1': 4, '0': 10}
+
+def test_simulate(vocab):
+    set_data = load_set(vocab)
+    before = copy.deepcopy(set_data)
+    cycle_length = set_data['cycle_data']['cycle_length']
+    sessions = simulate(set_data, ncycles=3)
+    assert set_data == before
+    assert len(sessions) == 3 * cycle_length - set_data['cycle_data']['total_sessions']
+    ends = [session for session in sessions if 'coverage' in session]
+    assert len(ends) == 3 and ends[-1] is sessions[-1]
+    # without moves the queues keep their sizes, and every configured score is seen each cycle
+    counts = {score: len(queue) for score, queue in set_data['term_queues'].items()}
+    assert all(session['score_counts'] == counts for session in sessions)
+    assert sessions[-1]['coverage']['3'] == 1
+
+    moved = simulate(set_data, ncycles=2, moves={'0->1': 0.5, '1->3': 0.5}, new_quota=20)
+    assert moved[0]['deck']['0'] == 20
+    assert all(sum(session['score_counts'].values()) == sum(counts.values()) for session in moved)
+    assert moved[-1]['score_counts']['0'] < counts['0']
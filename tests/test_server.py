@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import journal
+from server import StudyServer, StudyClient
+from storage import load_set
+
+@pytest.fixture
+def server(vocab, stub_app):
+    server = StudyServer({'alice': vocab}, port=0).start()
+    yield server
+    server.close()
+
+def test_status_writes_nothing(vocab, server):
+    # a due scheduler would give the terms due dates and save them
+    set_data = json.loads(vocab.read_text(encoding='utf8'))
+    set_data['cycle_data']['scheduler'] = 'due'
+    vocab.write_text(json.dumps(set_data, ensure_ascii=False), encoding='utf8')
+    before = vocab.read_bytes()
+    status = StudyClient(server.url, 'alice').status()
+    assert (status['status'], status['open']) == ('new', False)
+    assert status['ndeck'] > 0
+    assert vocab.read_bytes() == before
+
+def test_session(vocab, server):
+    client = StudyClient(server.url, 'alice')
+    nsessions = len(load_set(vocab)['stats'])
+
+    card = client.card()
+    assert (card['term_n'], card['complete']) == (0, False)
+    assert client.status()['open']
+    card = client.act('score', score=card['score'])
+    assert card['term_n'] == 1
+    edited = card['term_ID']
+    card = client.act('gloss', gloss='edited gloss')
+    assert card['gloss'] == 'edited gloss'
+
+    # a saved session is resumed where it was left
+    assert client.act('save')['saved']
+    status = client.status()
+    assert (status['status'], status['term_n'], status['open']) == ('in progress', 1, False)
+    card = client.card()
+    assert (card['term_n'], card['gloss']) == (1, 'edited gloss')
+
+    while not card['complete']:
+        card = client.act('score', score=card['score'])
+    with pytest.raises(Exception, match='unknown action'):
+        client.act('fly')
+    summary = client.act('finish')
+    assert summary['changes'] == {}
+
+    set_data = load_set(vocab)
+    assert len(set_data['stats']) == nsessions + 1
+    assert set_data['terms_dict'][edited]['gloss'] == 'edited gloss'
+    assert not journal.journal_path(vocab).exists()
+
+def test_new_score_needs_confirm(vocab, server):
+    client = StudyClient(server.url, 'alice')
+    term = client.card()['term_ID']
+    with pytest.raises(Exception, match='score 9 is new'):
+        client.act('score', score='9')
+    assert client.card()['term_n'] == 0
+    assert client.act('score', score='9', confirm=True)['term_n'] == 1
+    client.act('move', to='end')
+    client.act('finish')
+    set_data = load_set(vocab)
+    assert set_data['terms_dict'][term]['score'] == '9'
+    assert term in set_data['term_queues']['9']
@@ -0,0 +1,28 @@
+import copy
+
+from conftest import SAMPLE_VOCAB
+from iMahir import Session
+from storage import load_set
+from scheduler import score_quotas
+from bench_deck import list_deck
+
+def test_deck_matches_list_rotation():
+    set_data = load_set(SAMPLE_VOCAB / 'hebrew.json')
+    list_queues = copy.deepcopy(set_data['term_queues'])
+    s_counts = {score: len(queue) for score, queue in list_queues.items()}
+    quota = score_quotas(s_counts, set_data['cycle_data'], set_data['scoreconfig'])
+    deck = list_deck(list_queues, {score: n for score, n in quota.items() if score in list_queues})
+
+    session = Session(set_data)
+    assert session.deck and sorted(session.deck) == sorted(deck)
+    assert sum(session.deck_stats.values()) == len(session.deck)
+    assert {score: list(queue) for score, queue in set_data['term_queues'].items()} == list_queues
+
+def test_deck_is_replayed():
+    set_data = load_set(SAMPLE_VOCAB / 'hebrew.json')
+    committed = copy.deepcopy(set_data)
+    session = Session(set_data)
+    replayed = Session.from_deck(committed, session.deck, session.deck_stats)
+    assert replayed.deck == session.deck
+    assert ({score: list(queue) for score, queue in committed['term_queues'].items()}
+                == {score: list(queue) for score, queue in set_data['term_queues'].items()})
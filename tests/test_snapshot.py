@@ -0,0 +1,127 @@
+import pytest
+
+from tfindex import ExampleIndex
+from snapshot import Snapshot, export, PARSE_FEATURES
+
+APPDATA = {
+    'app': 'bhsa',
+    'version': 'c',
+    'gloss_feature': 'gloss',
+    'freq_feature': 'freq_lex',
+    'wordtype': 'word',
+    'context': 'verse',
+}
+
+# a tiny corpus: words 1-12 in verses 20-22 of book 30, with lexemes 13-16
+WORDS = range(1, 13)
+LEXEMES = range(13, 17)
+VERSES = range(20, 23)
+TEXTS = ['בְּ', 'רֵאשִׁ֖ית', 'בָּרָ֣א', '<b>', 'אֱלֹהִ֑ים', 'אֵ֥ת', 'הַ', 'שָּׁמַ֖יִם', 'וְ', 'אֵ֥ת', 'הָ', 'אָֽרֶץ']
+
+class Feature:
+    def __init__(self, values):
+        self.values = values
+    def v(self, node):
+        return self.values.get(node)
+
+class Otype(Feature):
+    slotType = 'word'
+    maxSlot = len(WORDS)
+    def s(self, otype):
+        return [node for node, value in self.values.items() if value == otype]
+
+class Locality:
+    def u(self, node, otype):
+        if otype == 'lex':
+            return (13 + node % 4,)
+        elif otype == 'verse':
+            return (20 + (node - 1) // 4,)
+        elif otype == 'book':
+            return (30,)
+        return ()
+    def d(self, node, otype):
+        if node in LEXEMES:
+            return tuple(w for w in WORDS if 13 + w % 4 == node)
+        return tuple(w for w in WORDS if 20 + (w - 1) // 4 == node)
+
+class TinyAPI:
+    def __init__(self):
+        otypes = {**{w: 'word' for w in WORDS}, **{l: 'lex' for l in LEXEMES},
+                  **{v: 'verse' for v in VERSES}, 30: 'book'}
+        self.features = {
+            'otype': Otype(otypes),
+            'pdp': Feature({w: 'verb' if w % 3 == 0 else 'subs' for w in WORDS}),
+            'gn': Feature({w: 'm' for w in WORDS if w % 2}),
+            'nu': Feature({w: 'sg' for w in WORDS}),
+            'ps': Feature({w: 'p3' for w in WORDS if w % 3 == 0}),
+            'vs': Feature({w: 'qal' for w in WORDS if w % 3 == 0}),
+            'vt': Feature({w: 'perf' for w in WORDS if w % 3 == 0}),
+            'st': Feature({w: 'a' for w in WORDS if w % 3}),
+            'gloss': Feature({l: f'gloss {l}' for l in LEXEMES}),
+            'freq_lex': Feature({l: l * 10 for l in LEXEMES}),
+        }
+        self.F = type('F', (), self.features)()
+        self.L = Locality()
+        self.T = type('T', (), {'text': staticmethod(
+            lambda w: TEXTS[w-1] if isinstance(w, int) else ''.join(TEXTS[n-1] for n in w))})()
+    def Fs(self, name):
+        return self.features[name]
+    def Fall(self):
+        return [name for name in self.features if name != 'otype']
+
+class TinyApp:
+    appName = 'bhsa'
+    def __init__(self):
+        self.api = TinyAPI()
+    def sectionStrFromNode(self, node):
+        return f'Genesis 1:{node - 19}'
+
+@pytest.fixture
+def snapshot(tmp_path):
+    app = TinyApp()
+    export(app, APPDATA, 'lex', tmp_path / 'bhsa-c.snapshot')
+    snapshot = Snapshot(tmp_path / 'bhsa-c.snapshot')
+    yield app, snapshot
+    snapshot.close()
+
+def test_round_trip(snapshot):
+    app, snap = snapshot
+    api, sapi = app.api, snap.api
+    for w in WORDS:
+        for otype in ('lex', 'verse', 'book'):
+            assert sapi.L.u(w, otype) == api.L.u(w, otype)
+        for feat in PARSE_FEATURES:
+            assert sapi.Fs(feat).v(w) == api.Fs(feat).v(w)
+        assert sapi.F.pdp.v(w) == api.F.pdp.v(w)
+    for lex in LEXEMES:
+        assert sapi.L.d(lex, 'word') == api.L.d(lex, 'word')
+        assert sapi.F.gloss.v(lex) == f'gloss {lex}'
+        assert sapi.Fs('freq_lex').v(lex) == lex * 10
+    for verse in VERSES:
+        assert sapi.L.d(verse, 'word') == api.L.d(verse, 'word')
+        assert snap.sectionStrFromNode(verse) == app.sectionStrFromNode(verse)
+
+def test_plain(snapshot):
+    app, snap = snapshot
+    passage = snap.plain(20, {2: 'yellow'}, _asString=True)
+    assert passage.startswith('<div dir="rtl"')
+    assert f'<span style="background-color:yellow">{TEXTS[1]}</span>' in passage
+    assert '&lt;b&gt;' in passage
+
+def test_index_from_snapshot(snapshot):
+    app, snap = snapshot
+    built = ExampleIndex.build(app.api, list(LEXEMES), APPDATA)
+    from_snap = ExampleIndex.build(snap.api, list(LEXEMES), APPDATA)
+    for column in ('lexemes', 'offsets', 'words', 'contexts', 'books', 'parses', 'freqs'):
+        assert getattr(from_snap, column) == getattr(built, column)
+    assert (from_snap.parse_strings, from_snap.glosses) == (built.parse_strings, built.glosses)
+
+def test_unknown_nodes(snapshot, tmp_path):
+    app, snap = snapshot
+    with pytest.raises(Exception, match='is not a word'):
+        snap.api.L.u(99, 'verse')
+    with pytest.raises(Exception, match='not in the snapshot'):
+        snap.api.F.lex_utf8
+    (tmp_path / 'other.snapshot').write_bytes(b'not a snapshot')
+    with pytest.raises(Exception, match='is not a Mahir snapshot'):
+        Snapshot(tmp_path / 'other.snapshot')
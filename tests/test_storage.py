@@ -0,0 +1,71 @@
+import json
+import pickle
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from storage import load_set, save_set, update_set, convert
+
+SAMPLE_SETS = sorted(SAMPLE_VOCAB.glob('*.json'))
+
+@pytest.mark.parametrize('suffix', ['.json', '.mahir', '.sqlite'])
+@pytest.mark.parametrize('sample', SAMPLE_SETS, ids=lambda file: file.stem)
+def test_round_trip(sample, suffix, tmp_path):
+    set_data = load_set(sample)
+    file = tmp_path / f'{sample.stem}{suffix}'
+    save_set(set_data, file)
+    loaded = load_set(file)
+    assert loaded == set_data
+    # the same JSON, down to the key order
+    assert json.dumps(loaded) == json.dumps(set_data)
+
+@pytest.mark.parametrize('suffix', ['.mahir', '.sqlite'])
+def test_convert_back_to_json(suffix, tmp_path):
+    sample = SAMPLE_VOCAB / 'greek.json'
+    convert(sample, tmp_path / f'greek{suffix}')
+    convert(tmp_path / f'greek{suffix}', tmp_path / 'greek.json')
+    assert (tmp_path / 'greek.json').read_text(encoding='utf8') == sample.read_text(encoding='utf8')
+
+class Unsafe:
+    def __reduce__(self):
+        return (exec, ('raise SystemExit("unpickled")',))
+
+def test_mahir_is_not_unpickled(tmp_path):
+    file = tmp_path / 'test.mahir'
+    file.write_bytes(pickle.dumps({'format': 'mahir-columns', 'version': 2, 'run': Unsafe()}))
+    with pytest.raises(Exception, match='is not a version'):
+        load_set(file)
+
+@pytest.fixture
+def sqlite_set(vocab):
+    file = vocab.with_suffix('.sqlite')
+    save_set(load_set(vocab), file)
+    return file
+
+def test_update_term_moved_within_queue(sqlite_set):
+    set_data = load_set(sqlite_set)
+    queue = set_data['term_queues']['3']
+    term = queue.pop(1)
+    queue.insert(len(queue) - 2, term)
+    update_set(set_data, sqlite_set, [term])
+    assert load_set(sqlite_set)['term_queues']['3'] == queue
+
+def test_update_rotated_queue(sqlite_set):
+    set_data = load_set(sqlite_set)
+    queue = set_data['term_queues']['3']
+    moved = queue[:3]
+    del queue[:3]
+    queue.extend(moved)
+    queue.insert(0, queue.pop(5))
+    update_set(set_data, sqlite_set, moved + [queue[0]])
+    assert load_set(sqlite_set)['term_queues']['3'] == queue
+
+def test_update_deleted_terms(sqlite_set):
+    from tools import bulkedit, edited_ids
+    set_data = load_set(sqlite_set)
+    queue = set_data['term_queues']['3']
+    merges, deletes = [[queue[0], queue[4]]], [queue[2]]
+    bulkedit(set_data, merges, deletes)
+    changed, removed = edited_ids(merges, deletes)
+    update_set(set_data, sqlite_set, changed, deleted=removed)
+    assert json.dumps(load_set(sqlite_set)) == json.dumps(set_data)
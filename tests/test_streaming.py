@@ -0,0 +1,56 @@
+import shutil
+from datetime import datetime
+
+import pytest
+
+import tools
+import streaming
+from conftest import SAMPLE_VOCAB
+from tools import load, save, reindex, bulkedit, blank
+from streaming import stream_edit, stream_blank
+
+@pytest.fixture(params=[2**20, 64])
+def chunk(request, monkeypatch):
+    '''Read in the usual chunks, and in tiny ones to refill the buffer mid-value'''
+    monkeypatch.setattr(streaming.JSONReader.__init__, '__defaults__', (request.param,))
+
+def edits(set_data):
+    queue = set_data['term_queues']['3']
+    return [[queue[5], queue[0]], [queue[1], queue[9], queue[2]]], [queue[3], set_data['term_queues']['0'][0]]
+
+@pytest.mark.parametrize('name', ['test', 'greek'])
+def test_stream_edit(name, tmp_path, chunk):
+    file = shutil.copy(SAMPLE_VOCAB / f'{name}.json', tmp_path / 'set.json')
+    set_data = load(file)
+    merges, deletes = edits(set_data)
+    diff = bulkedit(set_data, merges, deletes)
+    save(reindex(set_data), tmp_path / 'expected.json')
+
+    assert stream_edit(file, tmp_path / 'streamed.json', merges, deletes) == diff
+    assert (tmp_path / 'streamed.json').read_bytes() == (tmp_path / 'expected.json').read_bytes()
+
+    # in place, without edits, is a reindex
+    save(reindex(load(file)), tmp_path / 'expected.json')
+    assert stream_edit(file, file) == []
+    assert file.read_bytes() == (tmp_path / 'expected.json').read_bytes()
+
+def test_dryrun_writes_nothing(tmp_path):
+    file = shutil.copy(SAMPLE_VOCAB / 'test.json', tmp_path / 'set.json')
+    before = file.read_bytes()
+    merges, deletes = edits(load(file))
+    diff = stream_edit(file, file, merges, deletes, dryrun=True)
+    assert diff and file.read_bytes() == before
+    assert [f.name for f in tmp_path.iterdir()] == ['set.json']
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls):
+        return cls(2024, 1, 1)
+
+def test_stream_blank(tmp_path, monkeypatch, chunk):
+    monkeypatch.setattr(tools, 'datetime', FixedDatetime)
+    monkeypatch.setattr(streaming, 'datetime', FixedDatetime)
+    file = SAMPLE_VOCAB / 'test.json'
+    save(blank(load(file)), tmp_path / 'expected.json')
+    stream_blank(file, tmp_path / 'streamed.json')
+    assert (tmp_path / 'streamed.json').read_bytes() == (tmp_path / 'expected.json').read_bytes()
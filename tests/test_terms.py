@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from terms import TermTable
+from validate import validate
+
+def sample_terms():
+    with open(SAMPLE_VOCAB / 'test.json', encoding='utf8') as infile:
+        return json.load(infile)['terms_dict']
+
+def test_lexeme_edits_are_compacted():
+    terms_dict = sample_terms()
+    table = TermTable.from_dict(terms_dict)
+    nlexemes = len(table.lexemes)
+    tid = next(iter(terms_dict))
+    old = terms_dict[tid]['source_lexemes']
+    # an edit undone and redone many times
+    for i in range(10_001):
+        table[tid]['source_lexemes'] = [1, 2, 3] if i % 2 else old
+    assert len(table.lexemes) <= 2 * nlexemes + 3
+    assert table.to_json() == terms_dict
+
+def test_deleted_terms_are_compacted():
+    set_data = json.loads((SAMPLE_VOCAB / 'test.json').read_text(encoding='utf8'))
+    terms_dict = set_data['terms_dict']
+    table = TermTable.from_dict(terms_dict)
+    for tid in [tid for i, tid in enumerate(terms_dict) if i % 3]:
+        del table[tid]
+        del terms_dict[tid]
+        for queue in set_data['term_queues'].values():
+            if tid in queue:
+                queue.remove(tid)
+    live = sum(len(tdata['source_lexemes']) for tdata in terms_dict.values())
+    assert len(table.lexemes) <= 2 * live
+    assert table.to_json() == terms_dict
+    # the dead slots are not taken for problems of the set
+    assert validate(dict(set_data, terms_dict=table)) == validate(set_data)
+
+def test_reassigned_term_keeps_its_place():
+    terms_dict = sample_terms()
+    table = TermTable.from_dict(terms_dict)
+    first, second = list(terms_dict)[:2]
+    new = dict(terms_dict[second], gloss='new gloss', note='kept apart')
+    new['stats'] = {'seen': 4, 'missed': 1}
+    table[second] = terms_dict[second] = new
+    table[first] = table[first]
+    table['999999'] = terms_dict['999999'] = dict(terms_dict[first])
+    assert list(table) == list(terms_dict)
+    assert json.dumps(table.to_json()) == json.dumps(terms_dict)
+    assert len(table) == len(terms_dict)
+    # a bad term leaves the old one as it was
+    with pytest.raises(ValueError):
+        table[first] = dict(terms_dict[first], score='x')
+    assert table.to_json() == terms_dict
@@ -0,0 +1,83 @@
+import pickle
+from array import array
+
+import pytest
+
+import tfindex
+from cards import Prefetcher
+from iMahir import loadStudy
+from tfindex import ExampleIndex, ExampleSampler
+from stubs import StubAPI
+
+APPDATA = {
+    'app': 'bhsa',
+    'version': 'c',
+    'gloss_feature': 'gloss',
+    'freq_feature': 'freq_lex',
+    'wordtype': 'word',
+    'context': 'verse',
+}
+
+def test_failed_save_keeps_index(tmp_path, monkeypatch):
+    file = tmp_path / 'test.bhsa-c.index'
+    ExampleIndex.build(StubAPI(), [1_000_001, 1_000_002], APPDATA).save(file)
+
+    def torn_dump(data, outfile, protocol=None):
+        outfile.write(b'torn')
+        raise OSError('disk full')
+    monkeypatch.setattr(tfindex.pickle, 'dump', torn_dump)
+    with pytest.raises(OSError):
+        ExampleIndex.build(StubAPI(), [1_000_003], APPDATA).save(file)
+    monkeypatch.setattr(tfindex.pickle, 'dump', pickle.dump)
+
+    index = ExampleIndex.load(file, 'bhsa', 'c')
+    assert list(index.lexemes) == [1_000_001, 1_000_002]
+    assert [f.name for f in tmp_path.iterdir()] == [file.name]
+
+def two_context_index():
+    '''An index of one lexeme with two occurrences in each of two verses'''
+    return ExampleIndex(
+        'bhsa', 'c', lexemes=array('I', [1]), offsets=array('I', [0, 4]),
+        words=array('I', [10, 11, 12, 13]), contexts=array('I', [100, 100, 200, 200]),
+        books=array('I', [1, 1, 1, 1]), parses=array('I', [0, 0, 0, 0]),
+        parse_strings=[''], glosses=['gloss'], freqs=array('I', [4]),
+    )
+
+def test_drawn_contexts_are_not_used_up():
+    sampler = ExampleSampler(two_context_index(), seed=0)
+    # cards prepared ahead but never shown
+    drawn = {sampler.draw(1)[1] for i in range(50)}
+    assert drawn == {100, 200}
+    sampler.show(100)
+    assert {sampler.draw(1)[1] for i in range(50)} == {200}
+    sampler.reset()
+    assert {sampler.draw(1)[1] for i in range(50)} == {100, 200}
+
+def test_last_unseen_context_is_found():
+    # one rare context among many occurrences of another
+    index = ExampleIndex(
+        'bhsa', 'c', lexemes=array('I', [1]), offsets=array('I', [0, 100]),
+        words=array('I', range(100)), contexts=array('I', [100] * 99 + [200]),
+        books=array('I', [1] * 100), parses=array('I', [0] * 100),
+        parse_strings=[''], glosses=['gloss'], freqs=array('I', [100]),
+    )
+    sampler = ExampleSampler(index, redraws=1, seed=0)
+    sampler.show(100)
+    assert {sampler.draw(1)[1] for i in range(20)} == {200}
+    # once all are shown, contexts repeat
+    sampler.show(200)
+    assert 100 in {sampler.draw(1)[1] for i in range(20)}
+
+def test_prefetched_cards_do_not_use_up_contexts(vocab, stub_app):
+    study = loadStudy(vocab)
+    study.open_session()
+    deck = study.session_data.deck
+    cards = Prefetcher(lambda pos: study.prepare_card(deck[pos]), len(deck))
+    cards.prefetch(0)
+    prepared = [cards.get(pos) for pos in range(1, 4)]
+    cards.close()
+    assert study.sampler.shown == set()
+    card = study.render_card(prepared[0], prepared[0]['highlight'])
+    assert study.sampler.shown == {card['ex_passage']}
+    study.close_cache()
+    study.journal.delete()
@@ -0,0 +1,66 @@
+import copy
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from storage import load_set
+from tools import bulkedit, read_edits, reindex
+
+def test_read_edits(tmp_path):
+    file = tmp_path / 'edits.csv'
+    file.write_text('merge, 12,15 ,18\n\ndelete,20\ndelete,21,\nmerge,3,4\n', encoding='utf8')
+    assert read_edits(file) == ([['12', '15', '18'], ['3', '4']], ['20', '21'])
+    file.write_text('merge,1,2\nsplit,3\n', encoding='utf8')
+    with pytest.raises(Exception, match='unknown operation split'):
+        read_edits(file)
+
+def edit_ids(set_data):
+    queue = set_data['term_queues']['3']
+    return [[queue[0], queue[1], queue[2]]], [queue[3], set_data['term_queues']['0'][0]]
+
+def test_bulkedit():
+    set_data = load_set(SAMPLE_VOCAB / 'test.json')
+    terms = set_data['terms_dict']
+    merges, deletes = edit_ids(set_data)
+    target, *origins = merges[0]
+    deleted = [terms[tid]['term'] for tid in deletes]
+    words = [terms[tid]['term'] for tid in merges[0]]
+    lexemes = [lex for tid in merges[0] for lex in terms[tid]['source_lexemes']]
+    nterms = len(terms)
+
+    diff = bulkedit(set_data, merges, deletes)
+    assert diff[:3] == [
+        f'delete {deletes[0]}: {deleted[0]}',
+        f'delete {deletes[1]}: {deleted[1]}',
+        f'merge {", ".join(origins)} -> {target}: {"; ".join(words)}',
+    ]
+    assert len(terms) == nterms - 4
+    assert terms[target]['term'] == '; '.join(words)
+    assert terms[target]['source_lexemes'] == lexemes
+    removed = set(origins) | set(deletes)
+    assert not any(tid in removed for queue in set_data['term_queues'].values() for tid in queue)
+
+    # reindexing gives ids 1 to N in the same order
+    order = [terms[tid]['term'] for tid in terms]
+    reindexed = reindex(set_data)
+    assert list(reindexed['terms_dict']) == [str(i) for i in range(1, len(order) + 1)]
+    assert [tdata['term'] for tdata in reindexed['terms_dict'].values()] == order
+
+def test_dryrun_diff():
+    set_data = load_set(SAMPLE_VOCAB / 'test.json')
+    merges, deletes = edit_ids(set_data)
+    before = copy.deepcopy(set_data)
+    diff = bulkedit(set_data, merges, deletes, dryrun=True)
+    assert set_data == before
+    assert diff == bulkedit(set_data, merges, deletes)
+    assert set_data != before
+
+def test_bad_edits_change_nothing():
+    set_data = load_set(SAMPLE_VOCAB / 'test.json')
+    merges, deletes = edit_ids(set_data)
+    before = copy.deepcopy(set_data)
+    with pytest.raises(Exception, match='not in the set'):
+        bulkedit(set_data, merges, deletes + ['no such id'])
+    with pytest.raises(Exception, match='edited more than once'):
+        bulkedit(set_data, merges, deletes + [merges[0][1]])
+    assert set_data == before
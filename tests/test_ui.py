@@ -0,0 +1,69 @@
+import asyncio
+
+from iMahir import loadStudy
+from storage import load_set
+from ui import EventUI, run_sync
+
+class WaitingUI(EventUI):
+    '''An EventUI that tells when the session first waits on input'''
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = asyncio.Event()
+
+    async def read(self, ask=''):
+        self.waiting.set()
+        return await super().read(ask)
+
+def test_study_loop_with_events(vocab, stub_app):
+    study = loadStudy(vocab)
+    study.ui = ui = WaitingUI()
+    deck = study.session_data.deck
+    terms_dict = study.set_data['terms_dict']
+    nsessions = len(study.set_data['stats'])
+    first = deck[0]
+    old_score = terms_dict[first]['score']
+    new_score = '1' if old_score != '1' else '2'
+
+    async def session():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+        other = asyncio.ensure_future(ticker())
+        loop = asyncio.ensure_future(study.study_loop(profile=True, sync_secs=0.01))
+
+        # the event loop runs other tasks while the session waits on input
+        await asyncio.wait_for(ui.waiting.wait(), 30)
+        before = ticks
+        await asyncio.sleep(0.02)
+        assert not loop.done() and ticks > before
+        ui.send(new_score)
+        for term in deck[1:]:
+            ui.send(terms_dict[term]['score'])
+        ui.send('y') # quit at the end of the deck
+        await asyncio.wait_for(loop, 30)
+        other.cancel()
+
+    asyncio.run(session())
+    stats = load_set(vocab)['stats']
+    assert len(stats) == nsessions + 1
+    assert stats[-1]['changes'] == {f'{new_score}<-{old_score}' if int(new_score) < int(old_score)
+                                    else f'{old_score}->{new_score}': 1}
+    assert stats[-1]['timings']['visits'] >= len(deck)
+    assert load_set(vocab)['terms_dict'][first]['score'] == new_score
+
+def test_run_sync():
+    async def answer():
+        return 42
+    assert run_sync(answer()) == 42
+    async def waits():
+        await asyncio.sleep(0)
+    try:
+        run_sync(waits())
+    except Exception as error:
+        assert 'event loop' in str(error)
+    else:
+        raise AssertionError('run_sync did not refuse a waiting coroutine')
@@ -0,0 +1,110 @@
+import json
+import collections
+from array import array
+
+import pytest
+
+from conftest import SAMPLE_VOCAB
+from terms import TermTable
+from tfindex import ExampleIndex
+from storage import load_set
+from validate import validate, repair, check_file, describe
+
+def load_test_set():
+    with open(SAMPLE_VOCAB / 'test.json') as infile:
+        return json.load(infile)
+
+def break_set(set_data):
+    '''Make one problem of every check in the test set'''
+    terms_dict = set_data['terms_dict']
+    queues = set_data['term_queues']
+    queues['0'].append('99999') # unknown
+    queues['3'].append(queues['3'][0]) # duplicate
+    wrong = queues['4'].pop(0) # wrong queue
+    queues['5'].append(wrong)
+    unqueued = queues['1'].pop(0)
+    moved = queues['2'].pop(0) # scores of its own: no queue and unconfigured
+    terms_dict[moved]['score'] = '9'
+    del set_data['cycle_data']['score_starts']['6']
+    terms_dict['1']['source_lexemes'] = []
+    terms_dict['2']['source_lexemes'] = [0]
+    return {
+        'unknown': [('0', '99999')],
+        'duplicate': [('3', queues['3'][0])],
+        'wrong queue': [('5', wrong)],
+        'unqueued': [unqueued, moved],
+        'no queue': ['9'],
+        'unconfigured': ['9'],
+        'score_starts': ['6'],
+        'lexemes': [('1', None), ('2', 0)],
+    }
+
+def sort_problems(problems):
+    return {check: sorted(found, key=str) for check, found in problems.items()}
+
+def queue_counts(set_data):
+    return {score: collections.Counter(queue) for score, queue in set_data['term_queues'].items()}
+
+def test_consistent_set():
+    set_data = load_test_set()
+    assert validate(set_data) == {}
+    assert validate(dict(set_data, terms_dict=TermTable.from_dict(set_data['terms_dict']))) == {}
+
+@pytest.mark.parametrize('table', [False, True])
+def test_broken_set(table):
+    set_data = load_test_set()
+    expected = break_set(set_data)
+    if table:
+        set_data['terms_dict'] = TermTable.from_dict(set_data['terms_dict'])
+    problems = validate(set_data)
+    assert list(problems) == list(expected) # in the order of the checks
+    assert sort_problems(problems) == sort_problems(expected)
+    assert describe(problems)[0] == "unknown: 1: ('0', '99999')"
+
+def test_empty_lexemes_in_index():
+    set_data = load_test_set()
+    lex = set_data['terms_dict']['3']['source_lexemes'][0]
+    other = set_data['terms_dict']['4']['source_lexemes'][0]
+    # other has occurrences, lex has none
+    index = ExampleIndex('bhsa', 'c', lexemes=array('I', [lex, other]), offsets=array('I', [0, 0, 3]))
+    assert validate(set_data, index) == {'lexemes': [('3', lex)]}
+
+def test_repair():
+    set_data = load_test_set()
+    break_set(set_data)
+    n_terms = len(set_data['terms_dict'])
+    changes = repair(set_data)
+    assert 'unknown: drop 99999 from queue 0' in changes
+    assert 'no queue: new queue 9' in changes
+    # only what repair leaves for the user is left
+    assert list(validate(set_data)) == ['unconfigured', 'lexemes']
+    counts = queue_counts(set_data)
+    assert sum(sum(counter.values()) for counter in counts.values()) == n_terms
+    assert all(n == 1 for counter in counts.values() for n in counter.values())
+    for tid, tdata in set_data['terms_dict'].items():
+        assert tid in counts[tdata['score']]
+    starts = set_data['cycle_data']['score_starts']
+    assert starts['6'] == len(set_data['term_queues']['6'])
+    assert starts['9'] == 0
+
+def test_repair_keeps_rightly_queued_duplicate():
+    set_data = load_test_set()
+    queues = set_data['term_queues']
+    tid = queues['3'][0]
+    queues['4'].insert(0, tid) # a copy in the wrong queue comes first
+    problems = validate(set_data)
+    assert problems == {'duplicate': [('4', tid)]}
+    repair(set_data, problems)
+    assert validate(set_data) == {}
+    assert tid in queues['3'] and tid not in queues['4']
+
+def test_check_file(vocab):
+    set_data = load_set(vocab)
+    break_set(set_data)
+    with open(vocab, 'w') as outfile:
+        json.dump(set_data, outfile)
+    problems, changes = check_file(vocab)
+    assert 'unknown' in problems and not changes
+    problems, changes = check_file(vocab, fix=True)
+    assert changes
+    assert list(validate(load_set(vocab))) == ['unconfigured', 'lexemes']
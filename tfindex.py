@@ -0,0 +1,310 @@
+'''
+This module builds and reads a precomputed index of example occurrences
+for the lexemes of a Mahir vocab set.
+
+For every source lexeme the index stores the word nodes where it occurs,
+the context node (e.g. verse) and book of each occurrence, a parse
+string for each occurrence, and the standard gloss and frequency of the
+lexeme. All of this is kept in flat arrays with offsets, so that a study
+card can be assembled with a few array lookups instead of walking the
+Text-Fabric API.
+
+The index is built once per vocab set and TF data version and is
+pickled to disk next to the session saves.
+
+ExampleSampler draws the examples of a session from the index,
+weighted with the alias method and without repeating a context.
+'''
+
+import pickle
+import random
+import threading
+import collections
+from array import array
+from pathlib import Path
+
+from storage import atomic_open
+
+INDEX_VERSION = 2
+BOOK_TYPE = 'book'
+
+def index_path(fstem, app, version):
+    '''Give the file name of the index for a set and TF data version'''
+    return Path(f'{fstem}.{app}-{version}.index')
+
+def parse_string(F, node, app):
+    '''
+    Build a parse string for a word node.
+    Only the BHSA app has parse features; other apps get an empty string.
+    '''
+    if app != 'bhsa':
+        return ''
+    gender = F.gn.v(node)
+    number = F.nu.v(node)
+    if F.pdp.v(node) == 'verb':
+        person = F.ps.v(node)
+        stem = F.vs.v(node)
+        tense = F.vt.v(node)
+        return f'{stem}.{tense}.{person}.{gender}.{number}'
+    else:
+        state = F.st.v(node)
+        return f'{gender}.{number}.{state}'
+
+class ExampleIndex:
+    '''
+    Flat, array-backed index of lexeme occurrences.
+
+    The occurrences of the lexeme at row i are found in
+    words[offsets[i]:offsets[i+1]], with the matching
+    context nodes, book nodes and parse string ids at the
+    same positions in contexts, books and parses.
+    '''
+
+    def __init__(self, app, version, lexemes=None, offsets=None,
+                 words=None, contexts=None, books=None, parses=None,
+                 parse_strings=None, glosses=None, freqs=None):
+
+        self.app = app
+        self.version = version
+        self.lexemes = lexemes if lexemes is not None else array('I')
+        self.offsets = offsets if offsets is not None else array('I', [0])
+        self.words = words if words is not None else array('I')
+        self.contexts = contexts if contexts is not None else array('I')
+        self.books = books if books is not None else array('I')
+        self.parses = parses if parses is not None else array('I')
+        self.parse_strings = parse_strings if parse_strings is not None else []
+        self.glosses = glosses if glosses is not None else []
+        self.freqs = freqs if freqs is not None else array('I')
+
+        # in-memory lookups, not stored on disk
+        self.lex2row = {lex:i for i, lex in enumerate(self.lexemes)}
+        self.parse2id = {ps:i for i, ps in enumerate(self.parse_strings)}
+
+    @classmethod
+    def build(cls, api, lexemes, appdata):
+        '''
+        Build an index for the given lexeme nodes
+        with a Text-Fabric api object.
+        '''
+        index = cls(appdata['app'], appdata['version'])
+        index.extend(api, lexemes, appdata)
+        return index
+
+    def extend(self, api, lexemes, appdata):
+        '''
+        Add lexeme nodes that are not yet indexed.
+        A lexeme is only found in lex2row once all of its
+        rows are added, so it can be read while others are added.
+        '''
+        F, L, Fs = api.F, api.L, api.Fs
+        app = appdata['app']
+        wordtype, context = appdata['wordtype'], appdata['context']
+        glossfeat, freqfeat = appdata['gloss_feature'], appdata['freq_feature']
+
+        for lex in lexemes:
+            if lex in self.lex2row:
+                continue
+            for word in L.d(lex, wordtype):
+                parse = parse_string(F, word, app)
+                if parse not in self.parse2id:
+                    self.parse2id[parse] = len(self.parse_strings)
+                    self.parse_strings.append(parse)
+                self.words.append(word)
+                self.contexts.append(L.u(word, context)[0])
+                self.books.append(next(iter(L.u(word, BOOK_TYPE)), 0))
+                self.parses.append(self.parse2id[parse])
+            row = len(self.lexemes)
+            self.lexemes.append(lex)
+            self.offsets.append(len(self.words))
+            self.glosses.append(Fs(glossfeat).v(lex))
+            self.freqs.append(Fs(freqfeat).v(lex) or 0)
+            self.lex2row[lex] = row
+
+    def missing(self, lexemes):
+        '''Return lexemes that are not in the index'''
+        return [lex for lex in lexemes if lex not in self.lex2row]
+
+    def noccurrences(self, lex):
+        '''Count the occurrences of a lexeme'''
+        row = self.lex2row[lex]
+        return self.offsets[row+1] - self.offsets[row]
+
+    def span(self, lex):
+        '''Return the start and stop positions of a lexeme's occurrences'''
+        row = self.lex2row[lex]
+        return self.offsets[row], self.offsets[row+1]
+
+    def occurrence(self, pos):
+        '''Return the (word, context, parse string) at a position'''
+        return self.words[pos], self.contexts[pos], self.parse_strings[self.parses[pos]]
+
+    def example(self, lex, i=None):
+        '''
+        Return the (word, context, parse string) of an occurrence
+        of a lexeme. A random occurrence is chosen if i is not given.
+        '''
+        start, stop = self.span(lex)
+        pos = random.randrange(start, stop) if i is None else start + i
+        return self.occurrence(pos)
+
+    def std_glosses(self, lexemes):
+        '''Return (lexeme, gloss, frequency) for each lexeme'''
+        rows = [self.lex2row[lex] for lex in lexemes]
+        return [(lex, self.glosses[row], self.freqs[row])
+                    for lex, row in zip(lexemes, rows)]
+
+    def save(self, file):
+        '''
+        Pickle the index arrays to disk. The file is replaced
+        atomically, so a crash never leaves a torn index.
+        '''
+        data = {
+            'index_version': INDEX_VERSION,
+            'app': self.app,
+            'version': self.version,
+            'lexemes': self.lexemes,
+            'offsets': self.offsets,
+            'words': self.words,
+            'contexts': self.contexts,
+            'books': self.books,
+            'parses': self.parses,
+            'parse_strings': self.parse_strings,
+            'glosses': self.glosses,
+            'freqs': self.freqs,
+        }
+        with atomic_open(file, 'wb') as outfile:
+            pickle.dump(data, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file, app, version):
+        '''
+        Load an index from disk.
+        Returns None if the file is missing or was built
+        for another app, TF data version, or index format.
+        '''
+        file = Path(file)
+        if not file.exists():
+            return None
+        with open(file, 'rb') as infile:
+            data = pickle.load(infile)
+        if (data.get('index_version') != INDEX_VERSION
+                or data['app'] != app or data['version'] != version):
+            return None
+        del data['index_version']
+        return cls(**data)
+
+def alias_table(weights):
+    '''
+    Make the tables of Vose's alias method for a list of weights.
+    Returns (prob, alias) arrays; see alias_draw.
+    '''
+    n = len(weights)
+    total = sum(weights)
+    prob = array('d', (w * n / total for w in weights))
+    alias = array('I', range(n))
+    small = [i for i, p in enumerate(prob) if p < 1]
+    large = [i for i, p in enumerate(prob) if p >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        alias[less] = more
+        prob[more] += prob[less] - 1
+        (small if prob[more] < 1 else large).append(more)
+    # what is left is 1 up to rounding errors
+    for i in small + large:
+        prob[i] = 1
+    return prob, alias
+
+def alias_draw(prob, alias, rng=random):
+    '''Draw an index from alias tables in O(1)'''
+    i = int(rng.random() * len(prob))
+    return i if rng.random() < prob[i] else alias[i]
+
+class ExampleSampler:
+    '''
+    Draws examples of lexemes from an ExampleIndex.
+
+    weights sets how likely each occurrence of a lexeme is:
+        uniform  every occurrence is equally likely
+        parse    every parse of the lexeme is equally likely,
+                 so that rare forms are seen as often as common ones
+        book     every book of the lexeme is equally likely
+    Weighted draws use alias tables, made the first time a lexeme
+    is drawn, so every draw is O(1).
+
+    Contexts are remembered once they are shown (see show),
+    so that a session does not show the same context twice as long
+    as a lexeme has other contexts. After a few redraws, the contexts
+    not yet shown are picked from uniformly, and a context is only
+    repeated once all are shown. Contexts that are drawn but never shown, e.g. for
+    cards prepared ahead and then dropped, can be drawn again.
+    '''
+
+    WEIGHTS = ('uniform', 'parse', 'book')
+
+    def __init__(self, index, weights='uniform', redraws=8, seed=None):
+        if weights not in self.WEIGHTS:
+            raise Exception(f'unknown example weights {weights}; choose from {self.WEIGHTS}')
+        self.index = index
+        self.weights = weights
+        self.redraws = redraws
+        self.rng = random.Random(seed)
+        self.tables = {}
+        self.shown = set()
+        self.lock = threading.Lock() # cards are prepared in a worker thread
+
+    def table(self, lex):
+        '''Give the alias tables of a lexeme for the weights'''
+        if lex not in self.tables:
+            start, stop = self.index.span(lex)
+            column = self.index.parses if self.weights == 'parse' else self.index.books
+            groups = column[start:stop]
+            counts = collections.Counter(groups)
+            self.tables[lex] = alias_table([1 / counts[group] for group in groups])
+        return self.tables[lex]
+
+    def position(self, lex):
+        '''Draw the position of an occurrence of a lexeme'''
+        start, stop = self.index.span(lex)
+        if self.weights == 'uniform':
+            return self.rng.randrange(start, stop)
+        prob, alias = self.table(lex)
+        return start + alias_draw(prob, alias, self.rng)
+
+    def draw(self, lex):
+        '''
+        Return the (word, context, parse string) of an
+        example of a lexeme whose context was not yet shown.
+        '''
+        with self.lock:
+            for i in range(self.redraws):
+                pos = self.position(lex)
+                if self.index.contexts[pos] not in self.shown:
+                    break
+            else:
+                # a scan of the lexeme's rows for the contexts left
+                start, stop = self.index.span(lex)
+                contexts = self.index.contexts
+                unseen = [pos for pos in range(start, stop) if contexts[pos] not in self.shown]
+                pos = self.rng.choice(unseen) if unseen else self.position(lex)
+        return self.index.occurrence(pos)
+
+    def show(self, context):
+        '''Count a context as shown, once its card is displayed'''
+        with self.lock:
+            self.shown.add(context)
+
+    def reset(self):
+        '''Forget the contexts shown, e.g. for a new session'''
+        with self.lock:
+            self.shown.clear()
+
+def set_lexemes(terms_dict):
+    '''Gather all source lexemes of a set in term order'''
+    lexemes = []
+    seen = set()
+    for tdata in terms_dict.values():
+        for lex in tdata['source_lexemes']:
+            if lex not in seen:
+                seen.add(lex)
+                lexemes.append(lex)
+    return lexemes
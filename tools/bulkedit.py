@@ -0,0 +1,51 @@
+'''
+This module applies a batch of merges and deletes to a Mahir
+study set, reading them from a CSV file like:
+    merge,12,15,18
+    delete,20,21
+All edits are made in one pass, and term IDs are reindexed
+from 1 to N once at the end.
+With --dry-run, the changes are only printed.
+JSON sets are streamed, so that huge sets fit in memory.
+SQLite sets only write the edited rows and are not
+reindexed; run reindex.py to close the ID gaps.
+
+    python bulkedit.py hebrew.json edits.csv [--dry-run]
+'''
+
+import sys
+from tools import bulkedit, read_edits, edited_ids, reindex, load, save, update
+from streaming import stream_edit
+
+try: 
+    file = sys.argv[1]
+    editfile = sys.argv[2]
+except:
+    print('no file given...doing nothing...')
+    sys.exit(1)
+dryrun = '--dry-run' in sys.argv[3:]
+
+merges, deletes = read_edits(editfile)
+
+if file.endswith('.json'):
+    # apply all edits and reindex while streaming the file
+    diff = stream_edit(file, file, merges, deletes, dryrun=dryrun)
+else:
+    # apply all edits in one pass
+    vocab = load(file)
+    diff = bulkedit(vocab, merges, deletes, dryrun=dryrun)
+    if not dryrun and file.endswith(('.sqlite', '.db')):
+        # write only the edited rows
+        changed, removed = edited_ids(merges, deletes)
+        update(vocab, file, changed, deleted=removed)
+    elif not dryrun:
+        # reindex term ids from 1 to N
+        reindexed = reindex(vocab)
+        save(reindexed, file)
+
+for line in diff:
+    print(line)
+if dryrun:
+    print('dry run: nothing is saved')
+else:
+    print(f'{len(diff)} changes saved to {file}')
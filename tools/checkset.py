@@ -0,0 +1,28 @@
+'''
+This module checks Mahir study sets for inconsistencies,
+such as terms in the wrong queue or scores without a queue,
+in parallel, and with --repair fixes what can be fixed;
+see validate.py.
+
+    python checkset.py hebrew.json greek.json [--repair]
+'''
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from validate import validate_files, describe
+
+files = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+if not files:
+    print('no file given...doing nothing...')
+    sys.exit(1)
+fix = '--repair' in sys.argv[1:]
+
+if __name__ == '__main__':
+    for file, (problems, changes) in validate_files(files, fix=fix).items():
+        print(f'{file}: {"ok" if not problems else ""}')
+        for line in describe(problems):
+            print('\t' + line)
+        for line in changes:
+            print('\trepaired ' + line)
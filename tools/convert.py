@@ -0,0 +1,20 @@
+'''
+This module converts a Mahir study set between storage backends,
+e.g. from pretty json to the binary .mahir format or back.
+The backend is chosen by the file suffix.
+'''
+
+import sys
+from tools import convert
+
+try: 
+    file = sys.argv[1]
+    output = sys.argv[2]
+except:
+    print('no file given...doing nothing...')
+
+# convert and check the round trip
+if convert(file, output):
+    print(f'{file} -> {output}: round trip ok')
+else:
+    print(f'{file} -> {output}: round trip FAILED')
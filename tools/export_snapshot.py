@@ -0,0 +1,36 @@
+'''
+This module exports a memory-mapped corpus snapshot for the
+TF app and version of a Mahir study set, so that study sessions
+can run without loading Text-Fabric; see snapshot.py.
+The snapshot is written to {app}-{version}.snapshot
+unless an output file is given.
+
+    python export_snapshot.py hebrew.json [bhsa-c.snapshot]
+'''
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from storage import load_set
+from snapshot import export, snapshot_path
+
+try:
+    file = sys.argv[1]
+except:
+    print('no file given...doing nothing...')
+    sys.exit(1)
+
+set_data = load_set(file)
+appdata = set_data['app_data']
+output = sys.argv[2] if len(sys.argv) > 2 else snapshot_path(appdata['app'], appdata['version'])
+
+from tf.app import use
+app = use(appdata['app'], version=appdata['version'], silent=True)
+
+# the lexeme type is that of the set's lexemes
+lexeme = next(lex for tdata in set_data['terms_dict'].values() for lex in tdata['source_lexemes'])
+lextype = app.api.F.otype.v(lexeme)
+
+export(app, appdata, lextype, output)
+print(f'{appdata["app"]} {appdata["version"]} -> {output}')
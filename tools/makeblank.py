@@ -1,19 +1,23 @@
 import sys
-import json
-from tools import blank, save
+from tools import blank, load, save
+from streaming import stream_blank
 
 try: 
     file = sys.argv[1]
     output = sys.argv[2]
 except:
     print('no file given...doing nothing...')
-    
-# load the vocab file
-with open(file, 'r') as infile:
-    vocab = json.load(infile)
 
-# generate blank set
-new_set = blank(vocab)
+if file.endswith('.json') and output.endswith('.json'):
+    # stream the blank set, so that huge sets fit in memory
+    stream_blank(file, output)
 
-# export new set
-save(new_set, output)
+else:
+    # load the vocab file
+    vocab = load(file)
+
+    # generate blank set
+    new_set = blank(vocab)
+
+    # export new set
+    save(new_set, output)
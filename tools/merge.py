@@ -1,12 +1,14 @@
 '''
-This module reindexes a Mahir study set from 1 to N. 
-This is necessary when terms are deleted or merged and
-the IDs have gaps.
+This module merges terms of a Mahir study set into the
+leftmost given ID and reindexes the set from 1 to N.
+JSON sets are streamed, so that huge sets fit in memory.
+SQLite sets only write the merged rows and are not
+reindexed; run reindex.py to close the ID gaps.
 '''
 
 import sys
-import json
-from tools import reindex, merge, save
+from tools import reindex, merge, edited_ids, load, save, update
+from streaming import stream_edit
 
 try: 
     file = sys.argv[1]
@@ -16,15 +18,25 @@ except:
 # get ids to merge
 tomerge = sys.argv[2:]
 
-# load the vocab file
-with open(file, 'r') as infile:
-    vocab = json.load(infile)
-    
-# merge requested term ids
-merged = merge(vocab, tomerge)
-    
-# reindex term ids from 1 to N
-reindexed = reindex(vocab)
+if file.endswith('.json'):
+    # merge and reindex while streaming the file
+    stream_edit(file, file, merges=[tomerge])
+
+else:
+    # load the vocab file
+    vocab = load(file)
+        
+    # merge requested term ids
+    merged = merge(vocab, tomerge)
+
+    if file.endswith(('.sqlite', '.db')):
+        # write only the merged rows
+        changed, removed = edited_ids([tomerge], [])
+        update(merged, file, changed, deleted=removed)
+
+    else:
+        # reindex term ids from 1 to N
+        reindexed = reindex(vocab)
 
-# export data back to file
-save(reindexed, file)
\ No newline at end of file
+        # export data back to file
+        save(reindexed, file)
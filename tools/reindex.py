@@ -2,24 +2,29 @@
 This module reindexes a Mahir study set from 1 to N. 
 This is necessary when terms are deleted or merged and
 the IDs have gaps.
+JSON sets are streamed, so that huge sets fit in memory.
 '''
 
 import sys
-import json
 from tools import reindex
-from tools import save
+from tools import load, save
+from streaming import stream_edit
 
 try: 
     file = sys.argv[1]
 except:
     print('no file given...doing nothing...')
 
-# load the vocab file
-with open(file, 'r') as infile:
-    vocab = json.load(infile)
-    
-# reindex data
-reindexed = reindex(vocab)
+if file.endswith('.json'):
+    # reindex data while streaming the file
+    stream_edit(file, file)
 
-# export data back to file
-save(reindexed, file)
\ No newline at end of file
+else:
+    # load the vocab file
+    vocab = load(file)
+        
+    # reindex data
+    reindexed = reindex(vocab)
+
+    # export data back to file
+    save(reindexed, file)
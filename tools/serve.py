@@ -0,0 +1,25 @@
+'''
+This module serves the study sessions of many users
+over HTTP from one process; see server.py.
+
+    python serve.py alice=hebrew.json bob=greek.json [--port=8000] [--snapshot] [--new-cycles]
+'''
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from server import StudyServer
+
+users = dict(arg.split('=', 1) for arg in sys.argv[1:] if not arg.startswith('--'))
+if not users:
+    print('no file given...doing nothing...')
+    sys.exit(1)
+options = dict((arg[2:].split('=', 1) + [True])[:2] for arg in sys.argv[1:] if arg.startswith('--'))
+
+if __name__ == '__main__':
+    server = StudyServer(users, host=options.get('host', '127.0.0.1'), port=int(options.get('port', 8000)),
+                         snapshot=True if options.get('snapshot') else None,
+                         new_cycles=bool(options.get('new-cycles')))
+    print(f'serving {", ".join(users)} at {server.url}')
+    server.serve_forever()
@@ -0,0 +1,357 @@
+'''
+Streaming versions of the tools for very large vocab jsons.
+
+A set file is read piece by piece with json's raw_decode and written
+back as it is read, so terms_dict and term_queues are never held in
+memory whole; only the term ids are kept, in a compact array. The
+output is byte for byte what tools.save writes, i.e. json.dump
+with indent=1 and ensure_ascii=False.
+
+    stream_edit(file, output, merges, deletes)  merge, delete and reindex
+    stream_blank(file, output)                  same as blank
+'''
+
+import os
+import re
+import sys
+import json
+from array import array
+from pathlib import Path
+from datetime import datetime
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from storage import atomic_open, jsonable
+from terms import canonical_int
+from tools import bulkedit
+
+NONSPACE = re.compile(r'\S')
+DELIMITER = re.compile(r'[,:\]}]')
+
+class JSONReader:
+    '''
+    Reads a JSON file value by value. Objects and arrays
+    can be walked member by member with keys and elements;
+    any value can be read whole with value.
+    '''
+
+    def __init__(self, file, chunk=2**20):
+        self.infile = open(file, encoding='utf8')
+        self.chunk = chunk
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        '''
+        Read more of the file into the buffer; returns False at its end.
+        The read size grows with the buffer, so that a long
+        value is not decoded over and over.
+        '''
+        data = self.infile.read(max(self.chunk, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''Give the next character that is not whitespace'''
+        while True:
+            match = NONSPACE.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                raise json.JSONDecodeError('Unexpected end of file', self.buf, self.pos)
+
+    def expect(self, chars):
+        '''Consume the next character, which must be one of chars'''
+        char = self.peek()
+        if char not in chars:
+            raise json.JSONDecodeError(f'Expecting one of {chars!r}', self.buf, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        '''Decode the next whole value'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number may go on in the next chunk, so the
+            # delimiter after the value must be in the buffer
+            if not self.eof and not DELIMITER.search(self.buf, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def keys(self):
+        '''
+        Iterate over the keys of the next object.
+        The caller reads the value of each key before the next.
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self):
+        '''Iterate over the values of the next array.'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+    def close(self):
+        self.infile.close()
+
+def drain(iterator):
+    for item in iterator:
+        pass
+
+def iter_set(file):
+    '''
+    Yield the top-level (key, value) pairs of a set file.
+    terms_dict is given as an iterator of (id, term data) pairs,
+    and term_queues as an iterator of (score, iterator of ids).
+    Iterators that are not used up are read through
+    before the next pair is given.
+    '''
+    reader = JSONReader(file)
+
+    def term_items():
+        for tid in reader.keys():
+            yield tid, reader.value()
+
+    def queue_items():
+        for score in reader.keys():
+            ids = reader.elements()
+            yield score, ids
+            drain(ids)
+
+    try:
+        for key in reader.keys():
+            if key == 'terms_dict':
+                items = term_items()
+            elif key == 'term_queues':
+                items = queue_items()
+            else:
+                yield key, reader.value()
+                continue
+            yield key, items
+            drain(items)
+    finally:
+        reader.close()
+
+class Stream:
+    '''
+    An object (of key, value pairs) or array (of values)
+    that is written member by member as it is iterated.
+    Values may be Streams themselves.
+    '''
+
+    def __init__(self, members, array=False):
+        self.members = members
+        self.array = array
+
+def dump_at(value, level):
+    '''Encode a value as json.dump with indent=1 would at an indent level'''
+    text = json.dumps(value, indent=1, ensure_ascii=False, default=jsonable)
+    # newlines in strings are escaped, so every newline is indentation
+    return text.replace('\n', '\n' + ' '*level) if level else text
+
+def write_json(outfile, value, level=0):
+    '''Write a value that may contain Streams'''
+    if not isinstance(value, Stream):
+        outfile.write(dump_at(value, level))
+        return
+    opener, closer = '[]' if value.array else '{}'
+    outfile.write(opener)
+    indent = '\n' + ' '*(level+1)
+    empty = True
+    for member in value.members:
+        outfile.write(indent if empty else ',' + indent)
+        empty = False
+        if value.array:
+            write_json(outfile, member, level+1)
+        else:
+            key, member = member
+            outfile.write(json.dumps(key, ensure_ascii=False) + ': ')
+            write_json(outfile, member, level+1)
+    if not empty:
+        outfile.write('\n' + ' '*level)
+    outfile.write(closer)
+
+def save_stream(pairs, file):
+    '''Write the top-level pairs of a set to a file, atomically.'''
+    with atomic_open(file, 'w', encoding='utf8') as outfile:
+        write_json(outfile, Stream(pairs))
+
+class TermIds:
+    '''
+    Term ids in file order, as an int array
+    as long as they are all plain integer strings.
+    '''
+
+    def __init__(self):
+        self.ints = array('q')
+        self.strs = None
+
+    def append(self, tid):
+        if self.strs is None and canonical_int(tid):
+            self.ints.append(int(tid))
+        else:
+            if self.strs is None:
+                self.strs = [str(i) for i in self.ints]
+                self.ints = None
+            self.strs.append(tid)
+
+    def __iter__(self):
+        if self.strs is not None:
+            return iter(self.strs)
+        return (str(i) for i in self.ints)
+
+    def __len__(self):
+        return len(self.strs if self.strs is not None else self.ints)
+
+    def reindex(self, removed=()):
+        '''
+        Give a function that maps the old ids to new ones from 1 to N,
+        as tools.reindex does, leaving out removed ids.
+        '''
+        if self.strs is None and self.ints and max(self.ints) < 8*len(self.ints) + 1000:
+            old2new = array('I', [0]) * (max(self.ints) + 1)
+            n = 0
+            for tid in self.ints:
+                if str(tid) not in removed:
+                    n += 1
+                    old2new[tid] = n
+            def newid(tid):
+                n = old2new[int(tid)] if canonical_int(tid) and int(tid) < len(old2new) else 0
+                if not n:
+                    raise KeyError(tid)
+                return str(n)
+            return newid
+        old2new = {}
+        for tid in self:
+            if tid not in removed:
+                old2new[tid] = str(len(old2new) + 1)
+        return old2new.__getitem__
+
+def stream_edit(file, output, merges=(), deletes=(), reindex=True, dryrun=False):
+    '''
+    Applies merges and deletes to a set file as tools.bulkedit does,
+    optionally reindexes it as tools.reindex does, and writes it to output,
+    which may be the same file. Memory stays small whatever the set size.
+    Returns the lines of the diff; with dryrun=True nothing is written.
+    '''
+    edited = {tid for group in merges for tid in group} | set(deletes)
+
+    # first pass: the term ids and the data of edited terms
+    ids = TermIds()
+    subset = {'terms_dict': {}, 'term_queues': {}}
+    for key, value in iter_set(file):
+        if key == 'terms_dict':
+            for tid, tdata in value:
+                ids.append(tid)
+                if tid in edited:
+                    subset['terms_dict'][tid] = tdata
+
+    # the edits are checked and made on the edited terms only
+    diff = bulkedit(subset, merges, deletes)
+    removed = edited - set(subset['terms_dict'])
+    newid = ids.reindex(removed) if reindex else (lambda tid: tid)
+
+    def queue_ids(score, queue):
+        old = new = 0
+        for tid in queue:
+            old += 1
+            if tid not in removed:
+                new += 1
+                yield newid(tid)
+        if new != old:
+            diff.append(f'queue {score}: {old} -> {new} terms')
+
+    def pairs():
+        for key, value in iter_set(file):
+            if key == 'terms_dict':
+                value = Stream((newid(tid), subset['terms_dict'].get(tid, tdata))
+                                   for tid, tdata in value if tid not in removed)
+            elif key == 'term_queues':
+                value = Stream((score, Stream(queue_ids(score, queue), array=True))
+                                   for score, queue in value)
+            yield key, value
+
+    # second pass: write the edited set
+    if dryrun:
+        with open(os.devnull, 'w', encoding='utf8') as outfile:
+            write_json(outfile, Stream(pairs()))
+    else:
+        save_stream(pairs(), output)
+    return diff
+
+def stream_blank(file, output):
+    '''
+    Writes a fresh version of a set file to output,
+    with the same result as tools.blank.
+    '''
+
+    # first pass: the small values, queue scores and term ids
+    meta = {}
+    scores = []
+    ids = TermIds()
+    for key, value in iter_set(file):
+        if key == 'terms_dict':
+            for tid, tdata in value:
+                ids.append(tid)
+        elif key == 'term_queues':
+            scores = [score for score, queue in value]
+        else:
+            meta[key] = value
+
+    queues = {score:0 for score in scores}
+    queues['0'] = len(ids)
+    cycle_data = meta['cycle_data']
+    cycle_data['ncycle'] = 0
+    cycle_data['total_sessions'] = 0
+    cycle_data['score_starts'] = queues
+
+    def blank_terms():
+        for key, value in iter_set(file):
+            if key == 'terms_dict':
+                for tid, tdata in value:
+                    tdata['stats'] = {'seen':0,'missed':0}
+                    yield tid, tdata
+
+    # second pass: write the blank set in the key order of blank
+    def pairs():
+        yield 'name', meta['name']
+        yield 'init_date', str(datetime.now())
+        yield 'description', meta['description']
+        yield 'app_data', meta['app_data']
+        yield 'cycle_data', cycle_data
+        yield 'scoreconfig', meta['scoreconfig']
+        yield 'term_queues', Stream(
+            (score, Stream(iter(ids), array=True) if score == '0' else [])
+                for score in queues)
+        yield 'terms_dict', Stream(blank_terms())
+        yield 'stats', []
+
+    save_stream(pairs(), output)
@@ -2,16 +2,36 @@
 Tools for maintaining and editing Mahir vocab jsons
 '''
 
-import json
+import sys
+import csv
+from pathlib import Path
 from datetime import datetime
 
+# the storage backends live in the main Mahir directory
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from storage import load_set, save_set, update_set, convert
+
+def load(file):
+    '''
+    Loads a vocab file from any storage backend
+    '''
+    return load_set(file)
+
 def save(data, file):
     '''
-    Saves a json vocab file with proper indentation 
-    and ensure_ascii=False
+    Saves a vocab file with its storage backend;
+    json files get proper indentation and ensure_ascii=False.
+    The file is replaced atomically.
+    '''
+    save_set(data, file)
+
+def update(data, file, term_ids, deleted=()):
+    '''
+    Saves a vocab file in which only the given terms
+    have changed or been deleted. SQLite sets only write
+    those rows; other backends save the whole file.
     '''
-    with open(file, 'w') as outfile:
-        json.dump(data, outfile, indent=1, ensure_ascii=False)
+    update_set(data, file, term_ids, deleted)
         
 def deleteterm(setdata, termid):
     '''
@@ -62,20 +82,102 @@ def merge(vocdat, ids):
     Given a vocab set dict and a list of ids,
     merges all ids to the leftmost id.
     '''
-    
-    # leftmost id subsumes others
-    target = vocdat['terms_dict'][ids[0]]
-    
-    # subsume right into left; delete right
-    for tid in ids[1:]:
-        origin = vocdat['terms_dict'][tid]
-        target['source_lexemes'].extend(origin['source_lexemes'])
-        target['gloss'] += '; '+origin['gloss']
-        target['term'] += '; '+origin['term']
-        deleteterm(vocdat, tid)
-        
+    bulkedit(vocdat, merges=[ids])
     return vocdat
 
+def bulkedit(vocdat, merges=(), deletes=(), dryrun=False):
+    '''
+    Applies a batch of merges and deletes to a vocab set dict
+    in one pass over its terms and queues.
+    merges is a list of id groups, each merged to its leftmost id
+    as in merge; deletes is a list of ids to delete.
+    All edits are checked before any is made.
+    Returns a list of lines describing the changes;
+    with dryrun=True the set is left unchanged.
+    Term ids are not reindexed.
+    '''
+    terms = vocdat['terms_dict']
+
+    # check that every id exists and is edited only once
+    used = set()
+    for tid in [tid for group in merges for tid in group] + list(deletes):
+        if tid not in terms:
+            raise Exception(f'term {tid} is not in the set')
+        if tid in used:
+            raise Exception(f'term {tid} is edited more than once')
+        used.add(tid)
+
+    diff = []
+    removed = set(deletes)
+    for tid in deletes:
+        diff.append(f'delete {tid}: {terms[tid]["term"]}')
+
+    # combine the data of each group in its leftmost term
+    for group in merges:
+        target, origins = group[0], group[1:]
+        if not origins:
+            continue
+        lexemes = list(terms[target]['source_lexemes'])
+        glosses = [terms[target]['gloss']]
+        words = [terms[target]['term']]
+        for tid in origins:
+            lexemes.extend(terms[tid]['source_lexemes'])
+            glosses.append(terms[tid]['gloss'])
+            words.append(terms[tid]['term'])
+        removed.update(origins)
+        diff.append(f'merge {", ".join(origins)} -> {target}: {"; ".join(words)}')
+        if not dryrun:
+            terms[target]['source_lexemes'] = lexemes
+            terms[target]['gloss'] = '; '.join(glosses)
+            terms[target]['term'] = '; '.join(words)
+
+    # drop removed terms from the queues
+    for score, queue in vocdat['term_queues'].items():
+        kept = [tid for tid in queue if tid not in removed]
+        if len(kept) != len(queue):
+            diff.append(f'queue {score}: {len(queue)} -> {len(kept)} terms')
+            if not dryrun:
+                vocdat['term_queues'][score] = kept
+
+    if not dryrun:
+        for tid in removed:
+            del terms[tid]
+
+    return diff
+
+def edited_ids(merges, deletes):
+    '''
+    Gives the ids that a bulkedit changes and removes:
+    the target of each merge group is changed, its other
+    ids and the deletes are removed.
+    '''
+    changed = [group[0] for group in merges if len(group) > 1]
+    removed = [tid for group in merges for tid in group[1:]] + list(deletes)
+    return changed, removed
+
+def read_edits(file):
+    '''
+    Reads merges and deletes from a CSV file.
+    Each row is an operation followed by term ids, e.g.
+        merge,12,15,18
+        delete,20,21
+    Returns a list of merge groups and a list of deletes.
+    '''
+    merges, deletes = [], []
+    with open(file, newline='', encoding='utf8') as infile:
+        for row in csv.reader(infile):
+            row = [cell.strip() for cell in row if cell.strip()]
+            if not row:
+                continue
+            op, ids = row[0], row[1:]
+            if op == 'merge':
+                merges.append(ids)
+            elif op == 'delete':
+                deletes.extend(ids)
+            else:
+                raise Exception(f'unknown operation {op} in {file}')
+    return merges, deletes
+
 def blank(vocdat):
     '''
     Prepares a fresh version of a vocab set
@@ -0,0 +1,94 @@
+'''
+This module connects a study session to the user.
+
+The study loop of Study is a coroutine that gets user input,
+and waits on slow work such as card preparation and saving,
+through a UI object:
+    TextUI    reads input with input(); the loop runs to the end
+              in one call, as Study.learn does
+    EventUI   input arrives as events (send), and slow work runs
+              in threads, so the event loop stays free in between
+    WidgetUI  an EventUI fed by an ipywidgets text box, to run a
+              session as a task on Jupyter's event loop (Study.start)
+
+In an EventUI session other tasks can run while the user thinks,
+e.g. the periodic journal sync of Study.start.
+'''
+
+import asyncio
+import contextlib
+
+def run_sync(coro):
+    '''
+    Run a coroutine that never suspends, such as a study
+    loop with a TextUI, to its end without an event loop.
+    '''
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise Exception('the coroutine waited on an event; run it on an event loop instead')
+
+class TextUI:
+    '''Blocking input with input(); work is done in place.'''
+
+    async def read(self, ask=''):
+        return input(ask)
+
+    async def call(self, func, *args):
+        return func(*args)
+
+    def output(self):
+        return contextlib.nullcontext()
+
+class EventUI:
+    '''
+    Input from events: each call of send is the answer
+    to one read. Work given to call runs in a thread.
+    '''
+
+    def __init__(self):
+        self.events = asyncio.Queue()
+        self.ask = ''
+
+    def send(self, text):
+        '''Give the answer to the current (or next) read.'''
+        self.events.put_nowait(text)
+
+    async def read(self, ask=''):
+        self.ask = ask
+        return await self.events.get()
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def output(self):
+        return contextlib.nullcontext()
+
+class WidgetUI(EventUI):
+    '''
+    An EventUI with a text box for input and an output
+    area for the cards. Requires ipywidgets.
+    '''
+
+    def __init__(self):
+        import ipywidgets as widgets
+        super().__init__()
+        self.out = widgets.Output()
+        self.prompt = widgets.Label()
+        self.text = widgets.Text(placeholder='enter to submit')
+        self.text.on_submit(self.submitted)
+        self.box = widgets.VBox([self.out, widgets.HBox([self.prompt, self.text])])
+
+    def submitted(self, text):
+        value = text.value
+        text.value = ''
+        self.send(value)
+
+    async def read(self, ask=''):
+        self.prompt.value = ask
+        return await super().read(ask)
+
+    def output(self):
+        return self.out
@@ -0,0 +1,253 @@
+'''
+This module checks that a vocab set is consistent and repairs it.
+
+The checks are:
+    unknown       queued IDs that are not in terms_dict
+    duplicate     terms that are queued more than once
+    wrong queue   terms in the queue of another score than their own
+    unqueued      terms that are in no queue
+    no queue      scores of terms that have no queue
+    unconfigured  scores above the lowest configured score that are not
+                  in scoreconfig; their terms are never shown
+    score_starts  configured scores with a queue but no start count,
+                  and start counts larger than the set
+    lexemes       terms without source lexemes, lexemes that are not
+                  node numbers, and lexemes without occurrences in the
+                  example index (i.e. not lexemes of the TF version)
+
+The checks are made with dict and set lookups in one pass over the
+terms and queues. For a TermTable, the queues and lexemes are first
+compared with its columns as whole arrays. Only if that finds a
+problem are the terms checked one by one. So a consistent set of
+100k terms is checked in well under a second, and Study checks
+every set when it is loaded. validate_files checks many set
+files in a process pool, as Batch prepares them.
+
+repair fixes the queue problems: unknown and duplicate IDs are dropped,
+misplaced and unqueued terms go to the back of their score's queue,
+and missing start counts are set to the queue length. Unconfigured
+scores and bad lexemes are left for the user.
+'''
+
+import collections
+from array import array
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from terms import TermTable
+from storage import load_set, save_set
+from tfindex import ExampleIndex, index_path
+
+CHECKS = ('unknown', 'duplicate', 'wrong queue', 'unqueued', 'no queue',
+          'unconfigured', 'score_starts', 'lexemes')
+REPAIRABLE = ('unknown', 'duplicate', 'wrong queue', 'unqueued', 'no queue', 'score_starts')
+
+def term_scores(terms_dict):
+    '''Map term IDs to their score strings'''
+    if isinstance(terms_dict, TermTable):
+        return dict(terms_dict.score_items())
+    return {tid: tdata['score'] for tid, tdata in terms_dict.items()}
+
+def term_lexemes(terms_dict):
+    '''Iterate over the term IDs and source lexemes of a set'''
+    if isinstance(terms_dict, TermTable):
+        return terms_dict.lexeme_items()
+    return ((tid, tdata.get('source_lexemes') or []) for tid, tdata in terms_dict.items())
+
+def queues_match(table, queues):
+    '''
+    Whether every term of a TermTable is queued once, in the queue
+    of its score, and nothing else is queued. The queues are mapped
+    to rows with map, and compared with the scores column at once.
+    '''
+    alive = len(table)
+    if sum(len(queue) for queue in queues.values()) != alive:
+        return False
+    placed = array('h', [-1]) * len(table.ids)
+    for score, queue in queues.items():
+        try:
+            ints = list(map(int, queue))
+        except ValueError:
+            return False
+        # IDs are looked up by int, as the table does
+        rows = list(map(table.id2row.get, ints))
+        if None in rows:
+            return False
+        nscore = int(score)
+        for row in rows:
+            placed[row] = nscore
+    expected = table.scores
+    if alive != len(table.ids): # deleted rows are in no queue
+        expected = array('h', (score if live else -1 for score, live in zip(table.scores, table.alive)))
+    return placed == expected
+
+def lexemes_match(table, empty):
+    '''Whether all terms of a TermTable have lexemes, none of them 0 or in empty'''
+    lex_len, lexemes = table.lex_len, table.lexemes
+    if len(table) != len(table.ids): # deleted rows have no lexemes
+        lex_len = array('H', (n for n, live in zip(lex_len, table.alive) if live))
+    if table.dead_lexemes: # skip the slots of old lexemes
+        lexemes = array('I', (lex for tid, lexs in table.lexeme_items() for lex in lexs))
+    return 0 not in lex_len and 0 not in lexemes and empty.isdisjoint(lexemes)
+
+def validate(set_data, index=None):
+    '''
+    Check the consistency of a set. The lexemes are also
+    checked against an example index, if one is given.
+    Returns an ordered dict from the checks that failed
+    to their problems:
+        unknown, duplicate, wrong queue   (queue score, term ID)
+        unqueued                          term ID
+        no queue, unconfigured            score
+        score_starts                      score
+        lexemes                           (term ID, lexeme or None)
+    '''
+    terms_dict = set_data['terms_dict']
+    queues = set_data['term_queues']
+    scoreconfig = set_data['scoreconfig']
+    problems = collections.OrderedDict((check, []) for check in CHECKS)
+    table = terms_dict if isinstance(terms_dict, TermTable) else None
+
+    if table is not None and queues_match(table, queues):
+        used = {str(score) for score, live in zip(table.scores, table.alive) if live} \
+                   if len(table) != len(table.ids) else set(map(str, set(table.scores)))
+    else:
+        scores = term_scores(terms_dict)
+        used = set(scores.values())
+
+        # the queue of every ID; later occurrences are duplicates
+        queued = {}
+        extra = []
+        for score, queue in queues.items():
+            for tid in queue:
+                if tid in queued:
+                    extra.append((score, tid))
+                else:
+                    queued[tid] = score
+
+        for score, tid in extra:
+            if tid not in scores:
+                problems['unknown'].append((score, tid))
+                continue
+            # keep the occurrence in the term's own queue
+            if score == scores[tid] != queued[tid]:
+                queued[tid], score = score, queued[tid]
+            problems['duplicate'].append((score, tid))
+        for tid, score in queued.items():
+            if tid not in scores:
+                problems['unknown'].append((score, tid))
+            elif scores[tid] != score:
+                problems['wrong queue'].append((score, tid))
+        problems['unqueued'] = [tid for tid in scores if tid not in queued]
+
+    # scores
+    problems['no queue'] = sorted(used - set(queues), key=int)
+    lowest_config = min((int(score) for score in scoreconfig), default=None)
+    if lowest_config is not None:
+        problems['unconfigured'] = sorted(
+            (score for score in used | set(queues)
+                if score not in scoreconfig and int(score) > lowest_config), key=int)
+    starts = set_data['cycle_data']['score_starts']
+    for score in sorted(set(scoreconfig) | set(starts), key=int):
+        start = starts.get(score)
+        if score in scoreconfig and start is None and len(queues.get(score, ())):
+            problems['score_starts'].append(score)
+        elif start is not None and not 0 <= start <= len(terms_dict):
+            problems['score_starts'].append(score)
+
+    # lexemes, against the index if there is one
+    empty = set()
+    if index is not None:
+        offsets = index.offsets
+        empty = {lex for row, lex in enumerate(index.lexemes) if offsets[row] == offsets[row+1]}
+    if table is None or not lexemes_match(table, empty):
+        for tid, lexemes in term_lexemes(terms_dict):
+            if not lexemes:
+                problems['lexemes'].append((tid, None))
+            for lex in lexemes:
+                if type(lex) is not int or lex <= 0 or lex in empty:
+                    problems['lexemes'].append((tid, lex))
+
+    return collections.OrderedDict((check, found) for check, found in problems.items() if found)
+
+def describe(problems, limit=5):
+    '''Give a line per failed check with its count and first problems'''
+    lines = []
+    for check, found in problems.items():
+        shown = ', '.join(str(item) for item in found[:limit])
+        more = f', ... ({len(found) - limit} more)' if len(found) > limit else ''
+        lines.append(f'{check}: {len(found)}: {shown}{more}')
+    return lines
+
+def repair(set_data, problems=None):
+    '''
+    Repair the queue problems of a set in place.
+    Returns the lines of the changes made.
+    '''
+    if problems is None:
+        problems = validate(set_data)
+    queues = set_data['term_queues']
+    starts = set_data['cycle_data']['score_starts']
+    scores = term_scores(set_data['terms_dict'])
+    Queue = type(next(iter(queues.values()), []))
+    changes = []
+
+    # drop unknown IDs, duplicates and misplaced terms from their queues
+    drop = collections.defaultdict(collections.Counter)
+    for check in ('unknown', 'duplicate', 'wrong queue'):
+        for score, tid in problems.get(check, []):
+            drop[score][tid] += 1
+            changes.append(f'{check}: drop {tid} from queue {score}')
+    for score, tids in drop.items():
+        # an ID is kept after as many occurrences as are dropped,
+        # in case it is also queued in the right place
+        kept = []
+        for tid in queues[score]:
+            if tids[tid]:
+                tids[tid] -= 1
+            else:
+                kept.append(tid)
+        queues[score] = Queue(kept)
+
+    # misplaced and unqueued terms go to the back of their queue
+    moved = [tid for score, tid in problems.get('wrong queue', [])]
+    for tid in moved + problems.get('unqueued', []):
+        score = scores[tid]
+        if score not in queues:
+            queues[score] = Queue()
+            starts.setdefault(score, 0)
+            changes.append(f'no queue: new queue {score}')
+        queues[score].append(tid)
+        changes.append(f'queue {tid} in {score}')
+
+    for score in problems.get('score_starts', []):
+        starts[score] = len(queues.get(score, ()))
+        changes.append(f'score_starts: {score} = {starts[score]}')
+    return changes
+
+def check_file(file, fix=False):
+    '''
+    Validate a set file, with its example index if there is one,
+    and optionally repair and save it.
+    Runs in a worker process; returns (problems, changes).
+    '''
+    file = Path(file)
+    set_data = load_set(file)
+    appdata = set_data['app_data']
+    index = ExampleIndex.load(index_path(file.stem, appdata['app'], appdata['version']),
+                              appdata['app'], appdata['version'])
+    problems = validate(set_data, index)
+    changes = []
+    if fix and any(check in REPAIRABLE for check in problems):
+        changes = repair(set_data, problems)
+        save_set(set_data, file)
+    return problems, changes
+
+def validate_files(files, fix=False, workers=None):
+    '''
+    Check many set files in a process pool.
+    Returns a dict from file to (problems, changes).
+    '''
+    files = [Path(file) for file in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(files, pool.map(check_file, files, [fix]*len(files))))